@@ -0,0 +1,51 @@
+"""
+Core data and generation helpers for AttackGen.
+
+Copyright (C) 2023, Matthew Adams
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+A copy of the licence is provided with this program. If you are unable
+to view it, please see https://www.gnu.org/licenses/
+"""
+
+# The public API is imported lazily so that ``import attackgen`` stays cheap and
+# scripts only pay for the modules (pandas, provider SDKs, ...) they actually use.
+_EXPORTS = {
+    "get_attack_store": "attackgen.data",
+    "get_attack_data": "attackgen.data",
+    "load_groups": "attackgen.data",
+    "KillChainSampler": "attackgen.killchain",
+    "build_kill_chain": "attackgen.killchain",
+    "format_kill_chain": "attackgen.prompts",
+    "threat_group_messages": "attackgen.prompts",
+    "custom_messages": "attackgen.prompts",
+    "build_messages_within_budget": "attackgen.context",
+    "count_tokens": "attackgen.tokens",
+    "ProviderConfig": "attackgen.generation",
+    "generate_text": "attackgen.generation",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'attackgen' has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,162 @@
+"""
+Remote static assets cached on disk.
+
+The Welcome page used to download its branding SVG on every rerun, with no
+timeout, so every sidebar interaction waited on the network and an
+air-gapped server stalled until the connection failed. ``CachedAsset``
+fetches an asset once into ``.cache/assets`` (or ``ATTACKGEN_ASSET_DIR``)
+and serves it from disk afterwards. Fetching and revalidation (a
+conditional request with ``If-None-Match``/``If-Modified-Since``) run on a
+background thread with a strict timeout, so a page never waits on them;
+until the first fetch succeeds the asset is simply not available locally.
+
+For air-gapped deployments, fetch the assets ahead of time (e.g. when
+building the Docker image) with:
+
+    python -m attackgen.assets
+"""
+
+import base64
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+
+
+ASSET_DIR = os.getenv("ATTACKGEN_ASSET_DIR", os.path.join(".cache", "assets"))
+REVALIDATE_SECONDS = float(os.getenv("ATTACKGEN_ASSET_REVALIDATE_SECONDS", str(24 * 3600)))
+
+# Wait this long after a failed fetch (e.g. no network) before trying again
+RETRY_SECONDS = 300
+TIMEOUT = (2, 5)
+
+BRANDING_SVG_URL = "https://trknmgl-paygen.replit.app/trkn.svg"
+
+# Assets used by the pages, fetched ahead of time by ``python -m attackgen.assets``
+ASSET_URLS = [BRANDING_SVG_URL]
+
+
+class CachedAsset:
+    """A remote file kept in a local cache and revalidated in the background."""
+
+    def __init__(self, url, path, revalidate_seconds=REVALIDATE_SECONDS, timeout=TIMEOUT):
+        self.url = url
+        self.path = path
+        self.meta_path = path + ".json"
+        self.revalidate_seconds = revalidate_seconds
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._retry_at = 0.0
+        self._data_uri = None  # (mtime, data URI)
+        self._checked_at = None  # When the cached copy was last fetched or revalidated
+
+    def _metadata(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def local_path(self):
+        """Return the cached file's path, or None if it has not been fetched yet. Never waits on the network.
+
+        Starts a background fetch if the file is missing, or a revalidation if
+        it has not been checked for ``revalidate_seconds``.
+        """
+        exists = os.path.exists(self.path)
+        if self._checked_at is None:
+            self._checked_at = self._metadata().get("checked_at", 0)
+        if not exists or time.time() - self._checked_at > self.revalidate_seconds:
+            self.refresh_in_background()
+        return self.path if exists else None
+
+    def data_uri(self):
+        """Return the cached file as a ``data:`` URI for inline HTML, or None if it has not been fetched yet."""
+        path = self.local_path()
+        if path is None:
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._data_uri
+        if cached is None or cached[0] != mtime:
+            mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            with open(path, "rb") as f:
+                cached = (mtime, f"data:{mime_type};base64,{base64.b64encode(f.read()).decode()}")
+            self._data_uri = cached
+        return cached[1]
+
+    def refresh_in_background(self):
+        """Start a fetch or revalidation on a daemon thread, unless one is running or recently failed."""
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._retry_at:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_then_release, name="attackgen-asset-refresh", daemon=True).start()
+
+    def _refresh_then_release(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self):
+        """Fetch the asset, or revalidate the cached copy. Returns True if the cache is up to date."""
+        import requests
+
+        metadata = self._metadata() if os.path.exists(self.path) else {}
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+        try:
+            response = requests.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Could not fetch {self.url}, using the cached copy if there is one: {e}", file=sys.stderr)
+            with self._lock:
+                self._retry_at = time.monotonic() + RETRY_SECONDS
+            return False
+
+        if response.status_code == 200:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Write to a temporary file and rename it into place, so readers never see a partial file
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(response.content)
+            os.replace(temporary_path, self.path)
+            metadata = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+        metadata["checked_at"] = time.time()
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        self._checked_at = metadata["checked_at"]
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_cached_asset(url, filename=None):
+    """Return the ``CachedAsset`` for ``url`` shared by every session in this process."""
+    filename = filename or os.path.basename(url.split("?")[0]) or "asset"
+    return CachedAsset(url, os.path.join(ASSET_DIR, filename))
+
+
+def main():
+    failed = False
+    for url in ASSET_URLS:
+        asset = get_cached_asset(url)
+        if asset.refresh():
+            print(f"Cached {url} in {asset.path}")
+        else:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Headless batch scenario generation.
+
+Generates threat group scenarios for every combination of the given groups,
+industries and company sizes, using the same prompts as the Threat Group
+page. Provider calls run concurrently on a thread pool, capped per provider,
+and each scenario is written to disk as soon as it finishes: one Markdown file
+per scenario plus a line in ``scenarios.jsonl``.
+
+Example:
+
+    python -m attackgen.batch --provider "OpenAI API" --model gpt-4 \\
+        --groups APT28 APT29 --industries all --sizes "Small (1-50 employees)" \\
+        --output scenarios/
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from attackgen.data import get_attack_store, load_groups
+from attackgen.cache import get_response_cache
+from attackgen.context import DEFAULT_CONTEXT_TOKENS, build_messages_within_budget
+from attackgen.generation import (AZURE_OPENAI, MISTRAL, OLLAMA, OPENAI, PROVIDERS, ProviderConfig, generate_text,
+                                  timed_generation)
+from attackgen.killchain import KillChainSampler
+from attackgen.prompts import COMPANY_SIZES, INDUSTRIES, kill_chain_labels, threat_group_messages
+
+
+# Default number of concurrent calls per provider; local Ollama models can only serve one at a time
+PROVIDER_CONCURRENCY = {
+    OPENAI: 8,
+    AZURE_OPENAI: 8,
+    MISTRAL: 4,
+    OLLAMA: 1,
+}
+
+
+@dataclass
+class Job:
+    number: int
+    group: str
+    industry: str
+    company_size: str
+    variant: int
+    kill_chain: object  # DataFrame with 'Technique Name', 'ATT&CK ID' and 'Phase Name'
+    kill_chain_rows: object  # Technique rows of the kill chain, one per phase
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-").lower()
+
+
+def _expand(values, choices):
+    return list(choices) if values == ["all"] else values
+
+
+def plan_jobs(groups, industries, company_sizes, variants=1, seed=None, store=None):
+    """Build one job per group, industry, size and variant.
+
+    Kill chains for a group are drawn without replacement, so the scenarios
+    for a group use as many different techniques as it has.
+    """
+    store = store or get_attack_store()
+    combinations = list(itertools.product(industries, company_sizes, range(variants)))
+
+    jobs = []
+    for group_number, group in enumerate(groups):
+        group_row = store.index.group_for_alias(group)
+        if group_row is None:
+            print(f"Skipping unknown threat actor group: {group}", file=sys.stderr)
+            continue
+        technique_rows = store.index.techniques_for_group(group_row)
+        sampler = KillChainSampler.from_catalog(store.catalog, technique_rows)
+        if len(sampler) == 0:
+            print(f"Skipping {group}: no Enterprise ATT&CK techniques", file=sys.stderr)
+            continue
+
+        group_seed = None if seed is None else (seed, group_number)
+        kill_chains = sampler.sample(len(combinations), seed=group_seed, replace=False)
+        for (industry, company_size, variant), kill_chain_rows in zip(combinations, kill_chains):
+            kill_chain = store.catalog.table(kill_chain_rows).reset_index(drop=True)
+            jobs.append(Job(len(jobs), group, industry, company_size, variant, kill_chain, kill_chain_rows))
+    return jobs
+
+
+def run_batch(jobs, config, output_dir, workers=None, max_concurrent=None, generate=generate_text,
+              context_tokens=DEFAULT_CONTEXT_TOKENS, store=None):
+    """Generate every job and stream the results to ``output_dir``.
+
+    Up to ``context_tokens`` of technique descriptions and detection notes are
+    added to each prompt. Returns the number of scenarios that failed.
+    """
+    store = store or get_attack_store()
+    max_concurrent = max_concurrent or PROVIDER_CONCURRENCY.get(config.provider, 4)
+    workers = workers or max_concurrent
+    provider_slots = threading.BoundedSemaphore(max_concurrent)
+
+    def run(job):
+        messages = build_messages_within_budget(
+            lambda kill_chain_string: threat_group_messages(job.group, kill_chain_string, job.industry,
+                                                            job.company_size),
+            job.kill_chain_rows, kill_chain_labels(job.kill_chain), store.context, config,
+            max_tokens=config.max_tokens, limit=context_tokens)
+        with provider_slots:
+            start = time.perf_counter()
+            try:
+                return generate(config, messages), None, time.perf_counter() - start
+            except Exception as e:
+                return None, str(e), time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    failures = 0
+    with open(os.path.join(output_dir, "scenarios.jsonl"), "a", encoding="utf-8") as jsonl, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            scenario_text, error, duration = future.result()
+
+            markdown_path = None
+            if scenario_text is not None:
+                markdown_path = os.path.join(output_dir, f"{job.number:04d}-{_slug(job.group)}-{_slug(job.industry)}-"
+                                                         f"{_slug(job.company_size)}-{job.variant}.md")
+                with open(markdown_path, "w", encoding="utf-8") as f:
+                    f.write(scenario_text)
+            else:
+                failures += 1
+
+            record = {
+                "number": job.number,
+                "group": job.group,
+                "industry": job.industry,
+                "company_size": job.company_size,
+                "variant": job.variant,
+                "provider": config.provider,
+                "model": config.model,
+                "kill_chain": job.kill_chain.astype(str).to_dict(orient="records"),
+                "markdown_path": markdown_path,
+                "scenario": scenario_text,
+                "error": error,
+                "duration_s": round(duration, 3),
+            }
+            jsonl.write(json.dumps(record) + "\n")
+            jsonl.flush()
+
+            status = "failed: " + error if error else f"done in {duration:.1f}s"
+            print(f"[{done}/{len(jobs)}] {job.group} / {job.industry} / {job.company_size} {status}", file=sys.stderr)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate AttackGen threat group scenarios in bulk.")
+    parser.add_argument("--provider", choices=PROVIDERS, default=OPENAI, help="Model provider to use.")
+    parser.add_argument("--model", help="Model name (or Azure deployment name). Defaults to the provider's environment variable.")
+    parser.add_argument("--groups", nargs="+", default=["all"], help="Threat actor groups, or 'all' for every group in groups.json.")
+    parser.add_argument("--industries", nargs="+", default=["all"], help="Industries, or 'all'.")
+    parser.add_argument("--sizes", nargs="+", default=["all"], help="Company sizes, or 'all'.")
+    parser.add_argument("--variants", type=int, default=1, help="Scenarios to generate per combination.")
+    parser.add_argument("--seed", type=int, help="Seed for choosing kill chains, for reproducible batches.")
+    parser.add_argument("--workers", type=int, help="Size of the worker thread pool.")
+    parser.add_argument("--max-concurrent", type=int, help="Maximum concurrent calls to the provider.")
+    parser.add_argument("--max-tokens", type=int, help="Maximum length of each scenario, in tokens.")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS,
+                        help="Tokens of technique descriptions and detection notes to add to each prompt (0 for none).")
+    parser.add_argument("--output", default="scenarios", help="Directory to write scenarios to.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse scenarios from the response cache for identical prompts, e.g. when re-running a seeded batch.")
+    args = parser.parse_args(argv)
+
+    config = ProviderConfig.from_env(args.provider, args.model, max_tokens=args.max_tokens)
+    groups = _expand(args.groups, load_groups()['group'])
+    jobs = plan_jobs(groups, _expand(args.industries, INDUSTRIES), _expand(args.sizes, COMPANY_SIZES),
+                     variants=args.variants, seed=args.seed)
+
+    generate = generate_text
+    if args.cache:
+        response_cache = get_response_cache()
+
+        def generate(config, messages):
+            return "".join(timed_generation(config, messages, stream=False, cache=response_cache))
+
+    start = time.perf_counter()
+    failures = run_batch(jobs, config, args.output, workers=args.workers, max_concurrent=args.max_concurrent,
+                         generate=generate, context_tokens=args.context_tokens)
+    print(f"Generated {len(jobs) - failures} of {len(jobs)} scenarios in {time.perf_counter() - start:.1f}s "
+          f"to {args.output}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Micro-benchmarks for the work done on every page rerun.
+
+Times the data and prompt hot paths (loading the ATT&CK store, building the
+Custom page's technique choices, building group technique tables, sampling
+kill chains and formatting prompts) on small, typical and largest-group
+cases and on Custom page selections of 1, 20 and 200 techniques. Each case
+records its median and best time and its peak Python memory allocation.
+
+Save a baseline on the deployment machine, then compare against it before
+deploying:
+
+    python -m attackgen.benchmarks --save
+    python -m attackgen.benchmarks
+
+A case fails if it is more than ``ATTACKGEN_BENCHMARK_TOLERANCE`` (default
+50%) slower, or uses that much more peak memory, than its baseline. The
+baseline file is ``benchmarks.json`` in the repository root, or
+``ATTACKGEN_BENCHMARK_BASELINE``.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from attackgen.import_budget import ROOT
+
+
+DEFAULT_BASELINE = os.getenv("ATTACKGEN_BENCHMARK_BASELINE", os.path.join(ROOT, "benchmarks.json"))
+DEFAULT_TOLERANCE = float(os.getenv("ATTACKGEN_BENCHMARK_TOLERANCE", "0.5"))
+
+SELECTION_SIZES = (1, 20, 200)
+
+# Cases faster than this are compared with the baseline using this as their time, so timer noise on
+# sub-millisecond cases does not fail the check
+MIN_COMPARED_SECONDS = 0.001
+
+
+def measure(func, repeat=20, min_seconds=0.2):
+    """Time ``func`` and record its peak memory; returns a dict of results.
+
+    ``func`` is called ``repeat`` times, or until ``min_seconds`` have passed,
+    then once more under tracemalloc to find the peak allocation.
+    """
+    func()  # warm up caches and lazy imports
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat or time.perf_counter() - start < min_seconds:
+        call_start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - call_start)
+        if len(times) >= 10 * repeat:
+            break
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": len(times), "peak_bytes": peak}
+
+
+def group_cases(store):
+    """Return the smallest, median and largest groups by number of techniques, as (label, group row) pairs."""
+    counts = sorted((len(store.index.techniques_for_group(group)), group)
+                    for group in range(len(store.index.group_ids)))
+    counts = [(count, group) for count, group in counts if count > 0]
+    if not counts:
+        return []
+    return [("small", counts[0][1]), ("typical", counts[len(counts) // 2][1]), ("largest", counts[-1][1])]
+
+
+def cases(store):
+    """Return the benchmark cases as (name, function) pairs."""
+    from attackgen.catalog import technique_choices
+    from attackgen.context import build_messages_within_budget
+    from attackgen.generation import ProviderConfig
+    from attackgen.index import AttackIndex
+    from attackgen.killchain import KillChainSampler
+    from attackgen.prompts import custom_messages, kill_chain_labels, threat_group_messages
+    from attackgen.snapshot import load_snapshot
+
+    config = ProviderConfig("OpenAI API", "gpt-4")
+    industry, company_size = "Healthcare", "Small (1-50 employees)"
+
+    def load_store():
+        AttackIndex(load_snapshot(store.source_path))
+
+    benchmarks = [
+        ("load_store", load_store),
+        ("technique_choices", lambda: technique_choices(store.snapshot)),
+    ]
+
+    for label, group in group_cases(store):
+        technique_rows = store.index.techniques_for_group(group)
+        alias = store.snapshot.groups[group]["name"]
+
+        def group_table(technique_rows=technique_rows):
+            store.catalog.table(technique_rows)
+
+        def kill_chain_sample(technique_rows=technique_rows):
+            KillChainSampler.from_catalog(store.catalog, technique_rows).sample(1)
+
+        def threat_group_prompt(technique_rows=technique_rows, alias=alias):
+            kill_chain_rows = KillChainSampler.from_catalog(store.catalog, technique_rows).sample(1, seed=0)[0]
+            kill_chain = store.catalog.table(kill_chain_rows).reset_index(drop=True)
+            build_messages_within_budget(
+                lambda kill_chain_string: threat_group_messages(alias, kill_chain_string, industry, company_size),
+                kill_chain_rows, kill_chain_labels(kill_chain), store.context, config)
+
+        benchmarks += [
+            (f"group_table[{label}]", group_table),
+            (f"kill_chain_sample[{label}]", kill_chain_sample),
+            (f"threat_group_prompt[{label}]", threat_group_prompt),
+        ]
+
+    choices = technique_choices(store.snapshot).drop_duplicates("Display Name").set_index("Display Name")
+    for size in SELECTION_SIZES:
+        selected = list(choices.index[:size])
+
+        def custom_prompt(selected=selected):
+            technique_rows = [store.index.technique_rows[technique_id] for technique_id in choices.loc[selected, "id"]]
+            build_messages_within_budget(
+                lambda selected_techniques_string: custom_messages(selected_techniques_string, industry,
+                                                                   company_size),
+                technique_rows, selected, store.context, config)
+
+        benchmarks.append((f"custom_prompt[{len(selected)}]", custom_prompt))
+
+    return benchmarks
+
+
+def run(only=None, repeat=20):
+    """Run every benchmark (or those whose names contain ``only``); returns {name: results}."""
+    from attackgen.data import get_attack_store
+
+    store = get_attack_store()
+    return {name: measure(func, repeat=repeat) for name, func in cases(store) if not only or only in name}
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return {name: [problems]} for results that regressed against ``baseline``."""
+    regressions = {}
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        problems = []
+        seconds = max(result["median_s"], MIN_COMPARED_SECONDS)
+        if seconds > max(expected["median_s"], MIN_COMPARED_SECONDS) * (1 + tolerance):
+            problems.append(f"median {result['median_s'] * 1000:.2f}ms, baseline {expected['median_s'] * 1000:.2f}ms")
+        if result["peak_bytes"] > expected["peak_bytes"] * (1 + tolerance) + 64 * 1024:
+            problems.append(f"peak {result['peak_bytes'] / 1024:.0f}KB, baseline {expected['peak_bytes'] / 1024:.0f}KB")
+        if problems:
+            regressions[name] = problems
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AttackGen data and prompt hot paths.")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare with or save to.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown or memory growth before a case fails, e.g. 0.5 for 50%%.")
+    parser.add_argument("--only", help="Only run benchmarks whose names contain this text.")
+    parser.add_argument("--repeat", type=int, default=20, help="Minimum number of timed runs per benchmark.")
+    args = parser.parse_args(argv)
+
+    results = run(only=args.only, repeat=args.repeat)
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+
+    for name, result in results.items():
+        status = "FAIL: " + "; ".join(regressions[name]) if name in regressions else \
+            "ok" if name in baseline else "no baseline" if baseline else ""
+        print(f"{name}: median {result['median_s'] * 1000:.3f}ms, best {result['min_s'] * 1000:.3f}ms, "
+              f"peak {result['peak_bytes'] / 1024:.0f}KB {status}".rstrip())
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f)["results"]
+        saved.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "saved": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": saved}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
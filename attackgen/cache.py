@@ -0,0 +1,176 @@
+"""
+Disk-backed cache of generated scenarios.
+
+Generating the same scenario twice (same prompt, provider and model) costs a
+full LLM call each time. ``ResponseCache`` stores complete responses in a
+SQLite database keyed by a hash of the request, so repeat requests are served
+from disk in milliseconds, across reruns, sessions and restarts.
+
+The cache is bounded by size, evicting the least recently used responses
+first, and entries can optionally expire after a TTL. Its location and limits
+can be changed with the ``ATTACKGEN_CACHE_PATH``, ``ATTACKGEN_CACHE_MAX_BYTES``
+and ``ATTACKGEN_CACHE_TTL_SECONDS`` environment variables.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+
+DEFAULT_PATH = os.getenv("ATTACKGEN_CACHE_PATH", ".cache/responses.sqlite3")
+DEFAULT_MAX_BYTES = int(os.getenv("ATTACKGEN_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_TTL_SECONDS = float(os.getenv("ATTACKGEN_CACHE_TTL_SECONDS", "0")) or None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def cache_key(config, messages, params=None):
+    """Hash of everything that determines a response: the messages, provider, model and parameters.
+
+    API keys are deliberately left out so that users of the same model share
+    cached responses. The endpoint is included whenever one is set, since
+    Azure deployments and Ollama models are specific to a server, and
+    responses from another base URL (such as the mock server) must not be
+    served for the public API.
+    """
+    from attackgen.generation import to_openai_messages
+
+    request = {
+        "provider": config.provider,
+        "model": config.model,
+        "endpoint": config.endpoint,
+        "api_version": config.api_version,
+        "max_tokens": config.max_tokens,
+        "messages": to_openai_messages(messages),
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def _count_lookup(config, hit):
+    """Count a lookup in the Prometheus metrics, if ``prometheus_client`` is installed."""
+    try:
+        from attackgen.metrics import count_cache_lookup
+    except ImportError:
+        return
+    count_cache_lookup(config, hit)
+
+
+class ResponseCache:
+    """SQLite-backed response cache with size-bounded LRU eviction and an optional TTL.
+
+    Safe to share between threads; each thread uses its own connection.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Let readers carry on while another thread or process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, config, messages, params=None):
+        """Return the cached response for this request, or None."""
+        key = cache_key(config, messages, params)
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._count(row is not None)
+        _count_lookup(config, row is not None)
+        return row[0] if row is not None else None
+
+    def put(self, config, messages, response, params=None):
+        """Store a complete response, then evict the least recently used responses if over the size limit.
+
+        Empty responses, e.g. from a generation that failed or was cut short,
+        are not stored, so they are never replayed.
+        """
+        if not response or not response.strip():
+            return
+        key = cache_key(config, messages, params)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (key, config.provider, config.model, response, size, now, now))
+            self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            evict.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        connection.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._connection() as connection:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size,
+                    "max_bytes": self.max_bytes}
+
+
+@lru_cache(maxsize=None)
+def get_response_cache(path=DEFAULT_PATH):
+    """Return the response cache shared by every session in this process."""
+    return ResponseCache(path)
+
+
+def format_cache_stats(stats):
+    """One-line summary of ``ResponseCache.stats()`` for display."""
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = f" ({stats['hits'] / lookups:.0%} hit rate)" if lookups else ""
+    return (f"Scenario cache: {stats['entries']:,} scenarios, {stats['size_bytes'] / 1024 / 1024:.1f} MB · "
+            f"{stats['hits']:,} hits, {stats['misses']:,} misses{hit_rate}")
@@ -0,0 +1,66 @@
+"""
+Columnar catalog of per-technique display columns.
+
+The Threat Group page used to derive the technique name, ATT&CK ID and
+normalised phase name row by row for every group on every rerun. The catalog
+computes those columns once per technique, so a group's technique table is a
+single gather of the rows listed in ``AttackIndex``.
+"""
+
+import pandas as pd
+
+
+PHASE_NAME_ORDER = ['Reconnaissance', 'Resource Development', 'Initial Access', 'Execution', 'Persistence',
+                    'Privilege Escalation', 'Defense Evasion', 'Credential Access', 'Discovery', 'Lateral Movement',
+                    'Collection', 'Command and Control', 'Exfiltration', 'Impact']
+
+PHASE_NAME_CATEGORY = pd.CategoricalDtype(categories=PHASE_NAME_ORDER, ordered=True)
+
+TABLE_COLUMNS = ['Technique Name', 'ATT&CK ID', 'Phase Name']
+
+CHOICE_COLUMNS = ['id', 'Technique Name', 'External ID', 'Display Name']
+
+
+def normalise_phase_name(phase_name):
+    """Convert a kill chain phase (e.g. 'command-and-control') to its display name."""
+    phase_name = phase_name.replace('-', ' ').title()
+    # Replace 'Command And Control' with 'Command and Control'
+    return phase_name.replace('Command And Control', 'Command and Control')
+
+
+class TechniqueCatalog:
+    """One row per technique in the snapshot, indexed by technique row."""
+
+    def __init__(self, snapshot, index):
+        # Normalise each tactic once, then map every technique's primary tactic onto it
+        tactic_phase_names = [normalise_phase_name(shortname) for shortname in index.tactic_shortnames]
+        phase_codes = pd.Index(PHASE_NAME_ORDER).get_indexer(tactic_phase_names)
+        primary_tactic = index.primary_tactic.astype('int64')
+        codes = phase_codes[primary_tactic]
+        codes[primary_tactic < 0] = -1
+
+        self.frame = pd.DataFrame({
+            'Technique Name': [technique['name'] for technique in snapshot.techniques],
+            'ATT&CK ID': [technique['attack_id'] for technique in snapshot.techniques],
+            'Phase Name': pd.Categorical.from_codes(codes, dtype=PHASE_NAME_CATEGORY),
+        })
+
+    def table(self, technique_rows):
+        """Return the technique table for ``technique_rows`` in a single gather.
+
+        Rows from ``AttackIndex.techniques_for_group`` are already ordered by
+        primary tactic in matrix order, which is ``PHASE_NAME_ORDER`` for
+        Enterprise ATT&CK, so the result is sorted by 'Phase Name'.
+        """
+        return self.frame.take(technique_rows)
+
+
+def technique_choices(snapshot):
+    """Return the Custom page's technique choices: one row per technique and external ID.
+
+    'Display Name' is the technique name followed by the external ID, e.g.
+    'Phishing (T1566)', so techniques can be searched by either.
+    """
+    rows = [(technique['id'], technique['name'], external_id, f"{technique['name']} ({external_id})")
+            for technique in snapshot.get_techniques() for external_id in technique['external_ids']]
+    return pd.DataFrame(rows, columns=CHOICE_COLUMNS)
@@ -0,0 +1,274 @@
+"""
+Process-wide pool of provider clients.
+
+Creating a new SDK client for every generation means a new HTTP connection
+pool, and so new TCP and TLS handshakes, on every click. ``ClientPool`` keeps
+clients alive between reruns and sessions so repeat generations reuse warm
+keep-alive connections.
+
+Clients are keyed by provider, endpoint, API version, model and a hash of the
+API key, so a client (and the credentials it holds) is never shared between
+users with different keys. The pool is bounded and clients that have been idle
+for too long are closed, but never while a request is still using them.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+DEFAULT_MAX_SIZE = int(os.getenv("ATTACKGEN_CLIENT_POOL_SIZE", "32"))
+DEFAULT_IDLE_TIMEOUT = float(os.getenv("ATTACKGEN_CLIENT_IDLE_SECONDS", "600"))
+
+# Connection limits for each pooled client's HTTP connection pool
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY_SECONDS = 120
+CONNECT_TIMEOUT_SECONDS = 10
+READ_TIMEOUT_SECONDS = 600
+
+
+class ScopeCancelled(RuntimeError):
+    """A request was started in a ``CancelScope`` that had already been cancelled."""
+
+
+def client_key(config):
+    """Pool key for a ``ProviderConfig``; the API key itself is never stored."""
+    key_hash = hashlib.sha256(config.api_key.encode()).hexdigest() if config.api_key else None
+    return config.provider, config.endpoint, config.api_version, config.model, key_hash
+
+
+def http_client():
+    """An ``httpx.Client`` with keep-alive connection pooling, for the OpenAI SDKs."""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS),
+        timeout=httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+def requests_session(pool_connections=1):
+    """A ``requests.Session`` with keep-alive connection pooling, for plain HTTP APIs.
+
+    ``pool_connections`` is the number of hosts to keep connection pools for.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=MAX_CONNECTIONS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _close_quietly(close):
+    try:
+        close()
+    except Exception:
+        pass
+
+
+_scopes = threading.local()
+
+
+def current_cancel_scope():
+    """The ``CancelScope`` active on this thread, or None."""
+    return getattr(_scopes, "current", None)
+
+
+def is_cancelled():
+    """True if the request on this thread was cancelled through its ``CancelScope``."""
+    scope = current_cancel_scope()
+    return scope is not None and scope.cancelled
+
+
+def close_on_cancel(close):
+    """Have the ``CancelScope`` active on this thread, if any, call ``close`` when it is cancelled."""
+    scope = current_cancel_scope()
+    if scope is not None:
+        scope.register(close)
+
+
+class CancelScope:
+    """Clients of their own for a request that another thread may cancel part-way.
+
+    Pooled clients are shared between sessions, so one cannot be closed to
+    stop a single request. While a scope is active on a thread, the provider
+    backends build dedicated clients and register them, and any responses
+    they open, with the scope, and ``cancel()`` closes them all from another
+    thread. Once its connection is closed, the provider stops generating the
+    next time it writes to it, and the request's blocked read fails.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._closers = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Make this the scope of requests made on this thread in a ``with`` block."""
+        previous = current_cancel_scope()
+        _scopes.current = self
+        try:
+            yield self
+        finally:
+            _scopes.current = previous
+
+    def register(self, close):
+        """Call ``close`` when the scope is cancelled, or straight away if it already has been."""
+        with self._lock:
+            if not self.cancelled:
+                self._closers.append(close)
+                return
+        _close_quietly(close)
+
+    @contextmanager
+    def client(self, factory):
+        """Use a new client from ``factory()`` in a ``with`` block, closing it on exit or cancellation."""
+        if self.cancelled:
+            raise ScopeCancelled("The request was cancelled before it started.")
+        client, close = factory()
+        if close is not None:
+            self.register(close)
+        try:
+            yield client
+        finally:
+            if close is not None:
+                _close_quietly(close)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            closers, self._closers = self._closers, []
+        for close in closers:
+            _close_quietly(close)
+
+
+class PooledClient:
+    """A pooled client with the number of callers currently using it."""
+
+    __slots__ = ("client", "close", "checkouts", "released", "evicted")
+
+    def __init__(self, client, close, now):
+        self.client = client
+        self.close = close
+        self.checkouts = 0
+        self.released = now  # When the client was last returned to the pool
+        self.evicted = False
+
+
+class ClientPool:
+    """Bounded, thread-safe LRU pool of clients with idle eviction.
+
+    Clients are checked out for as long as a request (or a response stream)
+    uses them. A client that is evicted while checked out is closed only once
+    its last caller has returned it, and idle time is measured from then.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients = OrderedDict()  # key -> PooledClient
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def checkout(self, key, factory):
+        """Use the pooled client for ``key`` in a ``with`` block, creating it with ``factory()`` if needed.
+
+        ``factory`` returns ``(client, close)`` where ``close`` releases the
+        client's connections (or is None). It is called without holding the
+        pool's lock, so building one client never holds up other sessions.
+        """
+        entry = self._acquire(key, factory)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def _acquire(self, key, factory):
+        with self._lock:
+            to_close = self._evict_idle(time.monotonic())
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients.move_to_end(key)
+                entry.checkouts += 1
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._close_all(to_close)
+        if entry is not None:
+            return entry
+
+        client, close = factory()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                # Another session created the same client in the meantime; use that one
+                to_close = [PooledClient(client, close, time.monotonic())]
+            else:
+                entry = self._clients[key] = PooledClient(client, close, time.monotonic())
+                to_close = []
+                while len(self._clients) > self.max_size:
+                    to_close += self._evict(self._clients.popitem(last=False)[1])
+            self._clients.move_to_end(key)
+            entry.checkouts += 1
+        self._close_all(to_close)
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.checkouts -= 1
+            entry.released = time.monotonic()
+            # Close an evicted client once the last caller still using it is done
+            to_close = [entry] if entry.evicted and entry.checkouts == 0 else []
+        self._close_all(to_close)
+
+    def _evict_idle(self, now):
+        """Remove clients unused for ``idle_timeout``; returns those to close."""
+        idle = [key for key, entry in self._clients.items()
+                if entry.checkouts == 0 and now - entry.released > self.idle_timeout]
+        return [closing for key in idle for closing in self._evict(self._clients.pop(key))]
+
+    def _evict(self, entry):
+        """Mark a removed client as evicted; returns it if it can be closed now."""
+        self.evictions += 1
+        entry.evicted = True
+        return [entry] if entry.checkouts == 0 else []
+
+    @staticmethod
+    def _close_all(entries):
+        for entry in entries:
+            if entry.close is not None:
+                _close_quietly(entry.close)
+
+    def clear(self):
+        """Remove every pooled client, closing each one once it is no longer in use."""
+        with self._lock:
+            to_close = []
+            while self._clients:
+                to_close += self._evict(self._clients.popitem()[1])
+        self._close_all(to_close)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "in_use": sum(entry.checkouts for entry in self._clients.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+client_pool = ClientPool()
@@ -0,0 +1,183 @@
+"""
+Coalescing of identical generation requests that are in progress at the same time.
+
+At the start of a tabletop exercise several analysts often choose the same
+group, industry and company size within seconds of each other. The scenario
+cache only helps once the first response is complete, so each of them used
+to start an identical provider call. ``InFlightRequests`` lets the first
+request for a prompt, provider and model (the same key as the scenario
+cache) call the provider while later identical requests subscribe to it:
+they receive the text already produced and then each new chunk as it
+arrives, and share its result or error. Each subscriber is a provider call
+saved, counted in ``attackgen_coalesced_requests``.
+
+A request only joins when its stream is first read, and leaves when the
+stream ends or is closed, so a stream that is dropped unread never blocks
+later requests. A subscriber gives up if the request it follows produces
+nothing for ``ATTACKGEN_COALESCE_TIMEOUT`` seconds.
+"""
+
+import os
+import threading
+
+from attackgen import metrics
+
+
+# Seconds a subscriber waits for the next chunk of the request it follows
+FOLLOW_TIMEOUT_SECONDS = float(os.getenv("ATTACKGEN_COALESCE_TIMEOUT", "300"))
+
+
+class RequestCancelled(RuntimeError):
+    """The request another request was subscribed to stopped before it finished."""
+
+
+class Flight:
+    """One provider request in progress, whose chunks are replayed to every subscriber."""
+
+    def __init__(self, key):
+        self.key = key
+        self.source = None  # The HedgedStream or RoutedStream of the leading request
+        self.subscribers = 0
+        self._chunks = []
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    # The provider that answered, for TimedStream.stats()
+    @property
+    def winner(self):
+        return self.source.winner if self.source is not None else None
+
+    @property
+    def hedged(self):
+        return self.source.hedged if self.source is not None else False
+
+    @property
+    def failed_over(self):
+        return getattr(self.source, "failed_over", False)
+
+    def lead(self, chunks, on_done):
+        """Pass ``chunks`` through, publishing each one to subscribers; calls ``on_done()`` when they end."""
+        error = None
+        try:
+            for chunk in chunks:
+                with self._condition:
+                    self._chunks.append(chunk)
+                    self._condition.notify_all()
+                yield chunk
+        except GeneratorExit:
+            error = RequestCancelled("The identical request this scenario was waiting for was cancelled.")
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            on_done()
+            with self._condition:
+                self._done = True
+                self._error = error
+                self._condition.notify_all()
+
+    def follow(self, timeout=FOLLOW_TIMEOUT_SECONDS):
+        """Yield every chunk of the leading request, waiting up to ``timeout`` seconds for each new one."""
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self._chunks) and not self._done:
+                    if not self._condition.wait(timeout):
+                        raise RequestCancelled(f"The identical request this scenario was waiting for "
+                                               f"produced nothing for {timeout:g} seconds.")
+                chunks = self._chunks[position:]
+                position += len(chunks)
+                done, error = self._done, self._error
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class InFlightRequests:
+    """The provider requests in progress in this process, by cache key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.saved = 0
+
+    def join(self, key, config):
+        """Return (flight, leading): the request in progress for ``key``, or a new one for the caller to lead."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(key)
+                return flight, True
+            flight.subscribers += 1
+            self.saved += 1
+        metrics.COALESCED_REQUESTS.labels(provider=config.provider, model=config.model or "").inc()
+        return flight, False
+
+    def lead(self, flight, chunks, source):
+        """Iterate over ``chunks`` from ``source`` for ``flight``, replaying them to its subscribers."""
+        flight.source = source
+
+        def remove():
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+
+        return flight.lead(chunks, remove)
+
+    def stream(self, key, config, chunks, source, timeout=FOLLOW_TIMEOUT_SECONDS):
+        """A ``CoalescedStream`` over ``chunks`` from ``source``, shared with identical requests under ``key``."""
+        return CoalescedStream(self, key, config, chunks, source, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "saved": self.saved,
+                    "subscribers": sum(flight.subscribers for flight in self._flights.values())}
+
+
+class CoalescedStream:
+    """Iterate over a request's chunks, or over those of an identical request already in progress.
+
+    The request is looked up in ``requests`` when iteration starts. If an
+    identical one is in progress its chunks are followed and ``coalesced`` is
+    True; otherwise this request leads, calling the provider through
+    ``chunks`` until they end or the stream is closed.
+    """
+
+    def __init__(self, requests, key, config, chunks, source, timeout=FOLLOW_TIMEOUT_SECONDS):
+        self.requests = requests
+        self.key = key
+        self.config = config
+        self.chunks = chunks
+        self.source = source  # The HedgedStream or RoutedStream of this request
+        self.timeout = timeout
+        self.flight = None
+        self.coalesced = False
+
+    # The provider that answered, for TimedStream.stats()
+    @property
+    def winner(self):
+        return (self.flight if self.coalesced else self.source).winner
+
+    @property
+    def hedged(self):
+        return (self.flight if self.coalesced else self.source).hedged
+
+    @property
+    def failed_over(self):
+        return getattr(self.flight if self.coalesced else self.source, "failed_over", False)
+
+    def __iter__(self):
+        self.flight, leading = self.requests.join(self.key, self.config)
+        if leading:
+            yield from self.requests.lead(self.flight, self.chunks, self.source)
+        else:
+            self.coalesced = True
+            yield from self.flight.follow(self.timeout)
+
+
+# Shared by every session in this process
+in_flight_requests = InFlightRequests()
@@ -0,0 +1,84 @@
+"""
+Token-budgeted technique context for prompts.
+
+Scenarios are better when the prompt explains each technique, but including
+every description in full makes prompt size, cost and latency grow with the
+number of techniques. ``TechniqueContext`` counts the tokens of each
+technique's description and detection notes once per ATT&CK data version;
+``build_messages_within_budget`` then adds as much of that detail as fits in
+a token budget for the chosen model, so prompt size stays predictable.
+"""
+
+import os
+
+import numpy as np
+
+from attackgen.tokens import SAFETY_MARGIN, context_window, count_message_tokens, count_tokens
+
+
+# Default maximum number of tokens of technique detail to add to a prompt
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("ATTACKGEN_CONTEXT_TOKENS", "1500"))
+
+
+class TechniqueContext:
+    """Description and detection lines for every technique row, with their token counts."""
+
+    def __init__(self, snapshot):
+        self.description_lines = [f"  Description: {technique['description']}" if technique.get("description")
+                                  else None for technique in snapshot.techniques]
+        self.detection_lines = [f"  Detection: {technique['detection']}" if technique.get("detection")
+                                else None for technique in snapshot.techniques]
+        # One extra token for each line break
+        self.description_tokens = np.array([count_tokens(line) + 1 if line else 0 for line in self.description_lines],
+                                           dtype=np.int32)
+        self.detection_tokens = np.array([count_tokens(line) + 1 if line else 0 for line in self.detection_lines],
+                                         dtype=np.int32)
+
+    def render(self, technique_rows, labels, budget_tokens):
+        """Return one ``labels`` line per technique, followed by as much detail as fits in ``budget_tokens``.
+
+        Descriptions are added first, in order, then detection notes, so every
+        technique is described before any detection notes are included.
+        Details that do not fit are skipped in favour of shorter ones.
+        """
+        remaining = budget_tokens
+        included = []
+        for lines, tokens in ((self.description_lines, self.description_tokens),
+                              (self.detection_lines, self.detection_tokens)):
+            chosen = set()
+            for position, row in enumerate(technique_rows):
+                if lines[row] is not None and tokens[row] <= remaining:
+                    chosen.add(position)
+                    remaining -= tokens[row]
+            included.append((lines, chosen))
+
+        output = []
+        for position, (row, label) in enumerate(zip(technique_rows, labels)):
+            output.append(label)
+            output.extend(lines[row] for lines, chosen in included if position in chosen)
+        return "\n".join(output)
+
+
+def context_budget(config, messages, max_tokens=None, limit=DEFAULT_CONTEXT_TOKENS):
+    """Tokens of technique detail that can be added to ``messages``.
+
+    At most ``limit``, and never more than fits in ``config.model``'s context
+    window alongside the messages and ``max_tokens`` of output.
+    """
+    available = context_window(config.model) - count_message_tokens(messages) - (max_tokens or 0) - SAFETY_MARGIN
+    return max(0, min(limit, available))
+
+
+def build_messages_within_budget(build_messages, technique_rows, labels, context, config, max_tokens=None,
+                                 limit=DEFAULT_CONTEXT_TOKENS):
+    """Build prompt messages with as much technique detail as fits in the token budget.
+
+    ``build_messages`` takes the technique text and returns the messages, e.g.
+    ``lambda text: custom_messages(text, industry, company_size)``. Each
+    technique is given by its row and the label line used for it in the prompt.
+    """
+    messages = build_messages("\n".join(labels))
+    budget = context_budget(config, messages, max_tokens, limit)
+    if budget <= 0 or len(technique_rows) == 0:
+        return messages
+    return build_messages(context.render(technique_rows, labels, budget))
@@ -0,0 +1,160 @@
+"""
+Process-wide access to the ATT&CK data shared by every page.
+
+Each page used to cache its own copy of the ATT&CK data, so a server where
+both pages were used held two copies in memory. ``get_attack_data()`` keeps a
+single store per process, keyed by the source JSON, and swaps it out when the
+JSON is replaced.
+"""
+
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+
+from attackgen.index import AttackIndex
+from attackgen.snapshot import DEFAULT_SNAPSHOT, DEFAULT_SOURCE, AttackSnapshot, load_snapshot
+
+
+DEFAULT_GROUPS = os.path.join("data", "groups.json")
+
+
+@dataclass(frozen=True)
+class AttackStore:
+    """A loaded ATT&CK snapshot, its lookup index, version and footprint."""
+    snapshot: AttackSnapshot
+    index: AttackIndex
+    version: str
+    source_path: str
+    size_bytes: int
+
+    @cached_property
+    def catalog(self):
+        """Per-technique display columns, built on first use."""
+        from attackgen.catalog import TechniqueCatalog
+
+        return TechniqueCatalog(self.snapshot, self.index)
+
+    @cached_property
+    def context(self):
+        """Token-counted technique descriptions and detection notes for prompts, built on first use."""
+        from attackgen.context import TechniqueContext
+
+        return TechniqueContext(self.snapshot)
+
+
+_lock = threading.Lock()
+_store = None
+_store_key = None
+_groups = {}
+
+
+def _source_key(source_path):
+    stat = os.stat(source_path)
+    return os.path.abspath(source_path), stat.st_size, stat.st_mtime_ns
+
+
+def _deep_sizeof(obj):
+    """Approximate the memory held by a tree of builtin containers."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        # getsizeof includes the data buffer for arrays that own their memory
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return total
+
+
+def get_attack_store(source_path=DEFAULT_SOURCE, snapshot_path=DEFAULT_SNAPSHOT):
+    """Return the shared ``AttackStore``, loading or reloading it if needed.
+
+    The store is reloaded when the source JSON's size or modification time
+    changes; otherwise every caller in the process gets the same object.
+    """
+    global _store, _store_key
+
+    key = _source_key(source_path)
+    if _store is not None and _store_key == key:
+        return _store
+
+    with _lock:
+        if _store is None or _store_key != key:
+            snapshot = load_snapshot(source_path, snapshot_path)
+            index = AttackIndex(snapshot)
+            _store = AttackStore(
+                snapshot=snapshot,
+                index=index,
+                version=f"{snapshot.attack_version}+{snapshot.source_sha256[:12]}",
+                source_path=source_path,
+                size_bytes=_deep_sizeof(snapshot.payload) + _deep_sizeof(vars(index)),
+            )
+            _store_key = key
+        return _store
+
+
+def get_attack_data(source_path=DEFAULT_SOURCE, snapshot_path=DEFAULT_SNAPSHOT):
+    """Return the shared ``AttackSnapshot`` for this process."""
+    return get_attack_store(source_path, snapshot_path).snapshot
+
+
+def load_groups(groups_path=DEFAULT_GROUPS):
+    """Return the threat actor groups listed in ``groups.json`` as a DataFrame."""
+    groups = _groups.get(groups_path)
+    if groups is None:
+        import pandas as pd
+
+        with _lock:
+            groups = _groups.setdefault(groups_path, pd.read_json(groups_path))
+    return groups
+
+
+def _process_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is the peak rather than current RSS, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_usage():
+    """Summarise the shared store's version and memory footprint.
+
+    Returns ``None`` if the ATT&CK data has not been loaded in this process.
+    """
+    store = _store
+    if store is None:
+        return None
+    return {
+        "version": store.version,
+        "attack_version": store.snapshot.attack_version,
+        "store_bytes": store.size_bytes,
+        "process_rss_bytes": _process_rss_bytes(),
+    }
+
+
+def format_memory_usage():
+    """One-line, human readable version of ``memory_usage()``."""
+    usage = memory_usage()
+    if usage is None:
+        return "ATT&CK data not loaded"
+    text = f"ATT&CK v{usage['attack_version']} (data version {usage['version']}) · {usage['store_bytes'] / 2**20:.1f} MB shared store"
+    if usage["process_rss_bytes"] is not None:
+        text += f" · {usage['process_rss_bytes'] / 2**20:.0f} MB process RSS"
+    return text
@@ -0,0 +1,561 @@
+"""
+Provider configuration and scenario generation for the four model providers.
+
+Each provider's SDK is imported only when that provider is used.
+"""
+
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+
+
+OPENAI = "OpenAI API"
+AZURE_OPENAI = "Azure OpenAI Service"
+MISTRAL = "Mistral API"
+OLLAMA = "Ollama"
+
+PROVIDERS = [OPENAI, AZURE_OPENAI, MISTRAL, OLLAMA]
+
+# Base URLs of the provider APIs, e.g. to use a proxy or the local mock server (attackgen.mockserver). The
+# OpenAI and Mistral APIs default to their public endpoints; the Azure OpenAI endpoint is entered on the Welcome page.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL") or None
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Comma-separated Ollama servers to spread generations across (see attackgen.ollama); defaults to OLLAMA_HOST
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS") or OLLAMA_HOST
+
+# How long Ollama keeps a model loaded after a request: a duration such as "30m", a number of seconds, or -1 to keep it
+# until Ollama restarts. Ollama's default is 5 minutes, so models were often unloaded between analysts' runs.
+OLLAMA_KEEP_ALIVE = os.getenv("ATTACKGEN_OLLAMA_KEEP_ALIVE", "30m")
+
+# Short provider names used to tag LangSmith runs
+PROVIDER_TAGS = {
+    OPENAI: "openai",
+    AZURE_OPENAI: "azure",
+    MISTRAL: "mistral",
+    OLLAMA: "ollama",
+}
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    """Settings for one provider.
+
+    ``model`` is the model name, or the deployment name for Azure OpenAI.
+    ``endpoint`` is the Azure OpenAI endpoint, the Ollama base URL, or a base
+    URL replacing the public OpenAI or Mistral API.
+    ``max_tokens`` caps the length of the generated scenario.
+    """
+    provider: str
+    model: str
+    api_key: str = None
+    endpoint: str = None
+    api_version: str = None
+    max_tokens: int = None
+
+    @classmethod
+    def from_env(cls, provider, model=None, max_tokens=None):
+        """Read provider settings from the environment variables the pages use."""
+        config = cls._from_env(provider, model)
+        return replace(config, max_tokens=max_tokens) if max_tokens else config
+
+    @classmethod
+    def _from_env(cls, provider, model):
+        if provider == OPENAI:
+            return cls(provider, model or os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview"),
+                       api_key=os.getenv("OPENAI_API_KEY"), endpoint=OPENAI_BASE_URL)
+        if provider == AZURE_OPENAI:
+            return cls(provider, model or os.getenv("AZURE_DEPLOYMENT"),
+                       api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                       endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                       api_version=os.getenv("OPENAI_API_VERSION", "2023-12-01-preview"))
+        if provider == MISTRAL:
+            return cls(provider, model or os.getenv("MISTRAL_MODEL", "mistral-large-latest"),
+                       api_key=os.getenv("MISTRAL_API_KEY"), endpoint=MISTRAL_BASE_URL)
+        if provider == OLLAMA:
+            return cls(provider, model or os.getenv("OLLAMA_MODEL"), endpoint=OLLAMA_HOSTS)
+        raise ValueError(f"Unsupported model provider: {provider}")
+
+    @classmethod
+    def from_session_state(cls, session_state, provider=None):
+        """Read provider settings from the keys the Welcome page stores in session state.
+
+        Settings are taken from the caller's own session rather than the
+        process environment so that concurrent users never share credentials.
+        ``provider`` defaults to the provider chosen on the Welcome page.
+        """
+        provider = provider or session_state.get("chosen_model_provider", OPENAI)
+        max_tokens = session_state.get("max_tokens")
+        if provider == AZURE_OPENAI:
+            return cls(provider, session_state.get("azure_deployment"),
+                       api_key=session_state.get("AZURE_OPENAI_API_KEY"),
+                       endpoint=session_state.get("AZURE_OPENAI_ENDPOINT"),
+                       api_version=session_state.get("openai_api_version"), max_tokens=max_tokens)
+        if provider == MISTRAL:
+            return cls(provider, session_state.get("mistral_model"), api_key=session_state.get("MISTRAL_API_KEY"),
+                       endpoint=MISTRAL_BASE_URL, max_tokens=max_tokens)
+        if provider == OLLAMA:
+            return cls(provider, session_state.get("ollama_model"), endpoint=OLLAMA_HOSTS, max_tokens=max_tokens)
+        return cls(OPENAI, session_state.get("model_name"), api_key=session_state.get("openai_api_key"),
+                   endpoint=OPENAI_BASE_URL, max_tokens=max_tokens)
+
+    def missing_settings(self):
+        """Return a message for each setting that must be provided before generating."""
+        missing = []
+        if self.provider == AZURE_OPENAI:
+            if not self.api_key:
+                missing.append("Please add your Azure OpenAI Service API key to continue.")
+            if not self.endpoint:
+                missing.append("Please add your Azure OpenAI Service API endpoint to continue.")
+            if not self.model:
+                missing.append("Please add the name of your Azure OpenAI Service Deployment to continue.")
+            return missing
+        if self.provider == OPENAI and not self.api_key:
+            missing.append("Please add your OpenAI API key to continue.")
+        if self.provider == MISTRAL and not self.api_key:
+            missing.append("Please add your Mistral API key to continue.")
+        if not self.model:
+            missing.append("Please select a model to continue.")
+        return missing
+
+
+def alternative_configs(session_state):
+    """Configs for every provider other than the chosen one whose settings are complete, by provider."""
+    chosen = session_state.get("chosen_model_provider", OPENAI)
+    configs = [ProviderConfig.from_session_state(session_state, provider) for provider in PROVIDERS if provider != chosen]
+    return {config.provider: config for config in configs if not config.missing_settings()}
+
+
+def to_openai_messages(messages):
+    """Convert LangChain message objects to OpenAI chat completion messages."""
+    formatted_messages = []
+    for message in messages:
+        if hasattr(message, 'role') and hasattr(message, 'content'):
+            role = message.role
+        elif hasattr(message, 'type') and hasattr(message, 'content'):
+            role = message.type
+        else:
+            raise ValueError(f"Unsupported message format: {message}")
+        if role == 'human':
+            role = 'user'  # Replace 'human' with 'user'
+        elif role == 'ai':
+            role = 'assistant'
+        formatted_messages.append({"role": role, "content": message.content})
+    return formatted_messages
+
+
+# Registries of provider backends. Each backend imports its provider's SDK when
+# it is first called, so a process only ever loads the SDKs of the providers it
+# uses. Streaming backends are generators that yield text chunks as they arrive.
+_BACKENDS = {}
+_STREAM_BACKENDS = {}
+
+# Client factories, one per provider. Each returns ``(client, close)`` for the
+# shared client pool in ``attackgen.clients``.
+_CLIENT_FACTORIES = {}
+
+
+def register_backend(provider, streaming=False):
+    """Register the decorated function as the (streaming) backend for ``provider``."""
+    def decorator(func):
+        (_STREAM_BACKENDS if streaming else _BACKENDS)[provider] = func
+        return func
+    return decorator
+
+
+def register_client_factory(provider):
+    """Register the decorated function as the client factory for ``provider``."""
+    def decorator(func):
+        _CLIENT_FACTORIES[provider] = func
+        return func
+    return decorator
+
+
+def pooled_client(config):
+    """Use the pooled client for ``config`` in a ``with`` block, creating it on first use.
+
+    Clients are reused across reruns and sessions, but only by callers with
+    the same provider, endpoint, model and API key. Keep the block open while
+    a response is streamed so the client is not closed under it.
+
+    A request made in a ``clients.CancelScope`` (such as a hedged request)
+    gets a client of its own instead, which cancelling the scope closes.
+    """
+    from attackgen.clients import client_key, client_pool, current_cancel_scope
+
+    def factory():
+        return _CLIENT_FACTORIES[config.provider](config)
+
+    scope = current_cancel_scope()
+    if scope is not None:
+        return scope.client(factory)
+    return client_pool.checkout(client_key(config), factory)
+
+
+@register_client_factory(OPENAI)
+def _openai_client(config):
+    from langchain_openai import ChatOpenAI
+    from attackgen.clients import http_client
+
+    http = http_client()
+    return ChatOpenAI(openai_api_key=config.api_key, model_name=config.model, openai_api_base=config.endpoint,
+                      http_client=http), http.close
+
+
+@register_client_factory(AZURE_OPENAI)
+def _azure_client(config):
+    from openai import AzureOpenAI
+    from attackgen.clients import http_client
+
+    llm = AzureOpenAI(api_key=config.api_key, azure_endpoint=config.endpoint, api_version=config.api_version,
+                      http_client=http_client())
+    return llm, llm.close
+
+
+@register_client_factory(MISTRAL)
+def _mistral_client(config):
+    from langchain_mistralai.chat_models import ChatMistralAI
+
+    endpoint = {"endpoint": config.endpoint} if config.endpoint else {}
+    llm = ChatMistralAI(mistral_api_key=config.api_key, model=config.model, **endpoint)
+    # langchain-mistralai does not check response statuses, so an error would surface as a KeyError or SSEError
+    llm.client.event_hooks["response"].append(_raise_for_status)
+    return llm, llm.client.close
+
+
+def _raise_for_status(response):
+    """httpx response hook raising ``httpx.HTTPStatusError`` for error responses, with the error body."""
+    if response.is_error:
+        response.read()
+        response.raise_for_status()
+
+
+@register_client_factory(OLLAMA)
+def _ollama_client(config):
+    from attackgen.clients import requests_session
+    from attackgen.ollama import split_hosts
+
+    session = requests_session(pool_connections=len(split_hosts(config.endpoint)))
+    return session, session.close
+
+
+def _limits(config):
+    """Keyword arguments limiting the response length, for the OpenAI and Mistral APIs."""
+    return {"max_tokens": config.max_tokens} if config.max_tokens else {}
+
+
+def ollama_keep_alive(keep_alive=OLLAMA_KEEP_ALIVE):
+    """``keep_alive`` as sent to Ollama, which reads a bare number as seconds but a string as a duration."""
+    try:
+        seconds = float(keep_alive)
+    except (TypeError, ValueError):
+        return keep_alive
+    return int(seconds) if seconds.is_integer() else seconds
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(keep_alive=OLLAMA_KEEP_ALIVE):
+    """Seconds Ollama keeps a model loaded for a ``keep_alive`` value; None means until Ollama restarts."""
+    value = ollama_keep_alive(keep_alive)
+    if isinstance(value, (int, float)):
+        return None if value < 0 else float(value)
+    if value.startswith("-"):
+        return None
+    parts = _DURATION.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return 300.0  # Ollama rejects values it cannot parse and uses its default of 5 minutes
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+@contextmanager
+def _ollama_chat(config, messages, stream):
+    """POST ``messages`` to Ollama's chat API using the pooled session; yields (server URL, response).
+
+    ``config.endpoint`` may list several Ollama servers. The request goes to
+    the least busy healthy server with the model, and is counted as in
+    progress there until the ``with`` block ends. A server that cannot be
+    reached is marked as down and the next one is tried.
+    """
+    import requests
+
+    from attackgen.clients import CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS, close_on_cancel
+    from attackgen.ollama import get_ollama_pool
+
+    pool = get_ollama_pool(config.endpoint)
+    last_error = None
+    for host in pool.candidates(config.model):
+        with pool.slot(host), pooled_client(config) as session:
+            try:
+                response = session.post(
+                    f"{host}/api/chat",
+                    json={"model": config.model, "messages": to_openai_messages(messages), "stream": stream,
+                          "keep_alive": ollama_keep_alive(),
+                          "options": {"num_predict": config.max_tokens} if config.max_tokens else {}},
+                    timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS),
+                    stream=stream,
+                )
+            except requests.ConnectionError as e:
+                pool.mark_down(host, e)
+                last_error = e
+                continue
+            # Closing a requests session leaves connections in use open, so a cancelled request closes its response
+            close_on_cancel(response.close)
+            with response:
+                response.raise_for_status()
+                yield host, response
+            return
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError(f"No Ollama server has the model {config.model}.")
+
+
+@register_backend(OPENAI)
+def _generate_openai(config, messages):
+    with pooled_client(config) as llm:
+        response = llm.generate(messages=[messages], **_limits(config))
+    return response.generations[0][0].text
+
+
+@register_backend(AZURE_OPENAI)
+def _generate_azure(config, messages):
+    with pooled_client(config) as llm:
+        response = llm.chat.completions.create(model=config.model, messages=to_openai_messages(messages),
+                                               **_limits(config))
+    return response.choices[0].message.content
+
+
+@register_backend(MISTRAL)
+def _generate_mistral(config, messages):
+    with pooled_client(config) as llm:
+        response = llm.invoke(messages, **_limits(config))
+    return response.content
+
+
+@register_backend(OLLAMA)
+def _generate_ollama(config, messages):
+    from attackgen.ollama import record_timings
+
+    with _ollama_chat(config, messages, stream=False) as (host, response):
+        result = response.json()
+    record_timings(config, result, host)
+    return result["message"]["content"]
+
+
+@register_backend(OPENAI, streaming=True)
+def _stream_openai(config, messages):
+    with pooled_client(config) as llm:
+        for chunk in llm.stream(messages, **_limits(config)):
+            yield chunk.content
+
+
+@register_backend(AZURE_OPENAI, streaming=True)
+def _stream_azure(config, messages):
+    with pooled_client(config) as llm:
+        response = llm.chat.completions.create(model=config.model, messages=to_openai_messages(messages),
+                                               stream=True, **_limits(config))
+        for chunk in response:
+            # Azure sends an initial chunk with no choices containing the content filter results
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+@register_backend(MISTRAL, streaming=True)
+def _stream_mistral(config, messages):
+    with pooled_client(config) as llm:
+        for chunk in llm.stream(messages, **_limits(config)):
+            yield chunk.content
+
+
+@register_backend(OLLAMA, streaming=True)
+def _stream_ollama(config, messages):
+    from attackgen.ollama import record_timings
+
+    with _ollama_chat(config, messages, stream=True) as (host, response):
+        # Ollama streams one JSON object per line
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            if chunk.get("done"):
+                # The final chunk reports how long Ollama spent loading the model and generating
+                record_timings(config, chunk, host)
+            yield chunk.get("message", {}).get("content", "")
+
+
+def generate_text(config, messages):
+    """Generate a scenario for ``messages`` with the configured provider and return its text."""
+    try:
+        backend = _BACKENDS[config.provider]
+    except KeyError:
+        raise ValueError(f"Unsupported model provider: {config.provider}") from None
+    return backend(config, messages)
+
+
+def stream_text(config, messages):
+    """Generate a scenario for ``messages``, yielding the text in chunks as it is produced."""
+    try:
+        backend = _STREAM_BACKENDS[config.provider]
+    except KeyError:
+        raise ValueError(f"Unsupported model provider: {config.provider}") from None
+    yield from backend(config, messages)
+
+
+def generate_chunks(config, messages, stream=True):
+    """Yield the scenario text in chunks as it streams in, or in one chunk if ``stream`` is False."""
+    if stream:
+        yield from stream_text(config, messages)
+    else:
+        yield generate_text(config, messages)
+
+
+def _store_when_complete(chunks, cache, config, messages):
+    """Pass ``chunks`` through and cache the full text, but only once the stream has finished."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    # A hedged stream is cached under the provider that actually answered
+    cache.put(getattr(chunks, "winner", None) or config, messages, "".join(parts))
+
+
+def timed_generation(config, messages, stream=True, cache=None, refresh=False, hedge=None, hedge_percentile=None,
+                     fallbacks=None, coalesce=True):
+    """Return a ``TimedStream`` over the scenario text for ``messages``.
+
+    With a ``cache`` (see ``attackgen.cache``) a previously generated response
+    to the same request is returned instead of calling the provider, unless
+    ``refresh`` is True; new responses are stored once they are complete.
+
+    The request is routed through the providers' circuit breakers, failing
+    over to the ``fallbacks`` configs in order if ``config`` fails or is
+    unavailable (see ``attackgen.routing``). With a ``hedge`` provider config,
+    the request is also sent to that provider if ``config`` is slower than its
+    usual ``hedge_percentile`` latency, and the first to answer is used (see
+    ``attackgen.hedging``).
+
+    If ``coalesce`` is True and an identical request is already in progress
+    in this process when the stream is first read, its text is shared instead
+    of calling the provider again (see ``attackgen.coalescing``). A request
+    with ``refresh`` set is never shared, so that it always generates a new
+    response.
+    """
+    if cache is not None and not refresh:
+        cached_text = cache.get(config, messages)
+        if cached_text is not None:
+            return TimedStream(iter([cached_text]), config, cached=True)
+
+    if hedge is not None:
+        from attackgen.hedging import DEFAULT_PERCENTILE, HedgedStream
+
+        chunks = HedgedStream(config, hedge, messages, stream=stream, percentile=hedge_percentile or DEFAULT_PERCENTILE,
+                              fallbacks=fallbacks)
+    else:
+        from attackgen.routing import RoutedStream
+
+        chunks = RoutedStream([config] + list(fallbacks or []), messages, stream=stream)
+    source = chunks
+    if cache is not None:
+        chunks = _store_when_complete(chunks, cache, config, messages)
+    if coalesce and not refresh:
+        from attackgen.cache import cache_key
+        from attackgen.coalescing import in_flight_requests
+
+        # The streams above only call the provider once iterated, so they are simply dropped if not needed
+        chunks = source = in_flight_requests.stream(cache_key(config, messages), config, chunks, source)
+    return TimedStream(chunks, config, source=source)
+
+
+class TimedStream:
+    """Iterate over a stream of text chunks, recording time to first token and total duration.
+
+    Timing starts when iteration starts, so it includes the request to the
+    provider. ``stats()`` can be read once the stream has been consumed. For
+    Ollama, it also includes Ollama's own model load, prompt evaluation and
+    generation times, unless the request was hedged (the hedged requests run
+    on other threads).
+    """
+
+    def __init__(self, chunks, config=None, cached=False, source=None):
+        self.chunks = chunks
+        self.config = config
+        self.cached = cached
+        self.source = source  # The HedgedStream, RoutedStream or CoalescedStream producing the chunks, if any
+        self.first_token_s = None
+        self.total_s = None
+        self.output_chars = 0
+        self.ollama_timings = {}
+
+    def __iter__(self):
+        from attackgen.ollama import take_timings
+
+        take_timings()  # Discard timings left by an earlier request on this thread
+        start = time.perf_counter()
+        try:
+            for chunk in self.chunks:
+                if not chunk:
+                    continue
+                if self.first_token_s is None:
+                    self.first_token_s = time.perf_counter() - start
+                self.output_chars += len(chunk)
+                yield chunk
+        finally:
+            self.total_s = time.perf_counter() - start
+            self.ollama_timings = take_timings()
+
+    def stats(self):
+        # Report the provider that actually answered a hedged or failed-over request
+        config = self.source.winner if self.source is not None and self.source.winner else self.config
+        return {
+            "provider": config.provider if config else None,
+            "model": config.model if config else None,
+            "time_to_first_token_s": self.first_token_s,
+            "total_s": self.total_s,
+            "output_chars": self.output_chars,
+            "cached": self.cached,
+            "hedged": self.source.hedged if self.source is not None else False,
+            "failed_over": getattr(self.source, "failed_over", False),
+            # True if the text was shared from an identical request already in progress
+            "coalesced": getattr(self.source, "coalesced", False),
+            **self.ollama_timings,
+        }
+
+
+def format_generation_stats(stats):
+    """One-line summary of ``TimedStream.stats()`` for display."""
+    if stats.get("total_s") is None:
+        return ""
+    if stats.get("cached"):
+        text = f"Loaded {stats['output_chars']:,} characters from the scenario cache in {stats['total_s'] * 1000:.0f}ms"
+        if stats.get("provider"):
+            text += f" · {stats['provider']} ({stats['model']})"
+        return text
+    text = f"Generated {stats['output_chars']:,} characters in {stats['total_s']:.1f}s"
+    if stats.get("time_to_first_token_s") is not None:
+        text += f" · first token after {stats['time_to_first_token_s']:.1f}s"
+    if stats.get("provider"):
+        text += f" · {stats['provider']} ({stats['model']})"
+    if stats.get("load_s") is not None:
+        text += f" · model load {stats['load_s']:.1f}s"
+        if stats.get("eval_s") is not None:
+            text += f", prompt {stats.get('prompt_eval_s') or 0:.1f}s, generation {stats['eval_s']:.1f}s"
+    if stats.get("sections"):
+        # Phased generation (see attackgen.phased): the outline, then the other sections in parallel
+        sections = stats["sections"][1:]
+        text += f" · outline {stats['outline_s']:.1f}s"
+        if sections:
+            text += f", {len(sections)} sections in parallel (slowest {max(s['total_s'] or 0 for s in sections):.1f}s)"
+    if stats.get("hedged"):
+        text += " · hedged"
+    if stats.get("failed_over"):
+        text += " · failed over"
+    if stats.get("coalesced"):
+        text += " · shared with an identical request already in progress"
+    return text
@@ -0,0 +1,222 @@
+"""
+Hedged generation across two providers.
+
+Provider latency has a long tail: at peak times one endpoint can take far
+longer than usual to start answering. ``HedgedStream`` sends the request to
+the primary provider and, if it has not produced its first token by a
+deadline, sends the same messages to a secondary provider as well. Whichever
+answers first wins and the other is cancelled by closing its connection.
+
+The deadline is a percentile of the primary provider's recent latencies,
+tracked by ``LatencyTracker``, so hedges only fire for requests that are
+slower than usual. Per-provider latencies and win rates are kept for tuning.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from attackgen.clients import CancelScope
+from attackgen.routing import RoutedStream, router
+
+
+DEFAULT_PERCENTILE = float(os.getenv("ATTACKGEN_HEDGE_PERCENTILE", "95"))
+
+# Deadlines used until a provider has MIN_SAMPLES latencies, for the first token and for a whole response
+DEFAULT_STREAM_DEADLINE_SECONDS = float(os.getenv("ATTACKGEN_HEDGE_STREAM_DEADLINE", "10"))
+DEFAULT_RESPONSE_DEADLINE_SECONDS = float(os.getenv("ATTACKGEN_HEDGE_RESPONSE_DEADLINE", "60"))
+MIN_SAMPLES = 5
+WINDOW = 200
+
+_CHUNK, _END, _ERROR = "chunk", "end", "error"
+
+
+class LatencyTracker:
+    """Rolling first-token latencies and hedge outcomes per provider and model."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._latencies = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, config, stream, seconds):
+        with self._lock:
+            self._latencies.setdefault((config.provider, config.model, stream), deque(maxlen=self.window)).append(seconds)
+
+    def count(self, config, outcome):
+        """Count a hedge outcome ('requests', 'hedged' or 'wins') for the provider."""
+        with self._lock:
+            counts = self._counts.setdefault((config.provider, config.model), {"requests": 0, "hedged": 0, "wins": 0})
+            counts[outcome] += 1
+
+    def deadline(self, config, stream, percentile=DEFAULT_PERCENTILE):
+        """Seconds to wait for the provider before hedging: the given percentile of its recent latencies."""
+        with self._lock:
+            latencies = sorted(self._latencies.get((config.provider, config.model, stream), ()))
+        if len(latencies) < MIN_SAMPLES:
+            return DEFAULT_STREAM_DEADLINE_SECONDS if stream else DEFAULT_RESPONSE_DEADLINE_SECONDS
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def stats(self):
+        """Per-provider latency percentiles, hedge counts and win rates."""
+        with self._lock:
+            latencies = {key: sorted(values) for key, values in self._latencies.items()}
+            counts = {key: dict(values) for key, values in self._counts.items()}
+
+        stats = []
+        for provider, model in sorted(set(counts) | {key[:2] for key in latencies}):
+            row = {"provider": provider, "model": model, "requests": 0, "hedged": 0, "wins": 0}
+            row.update(counts.get((provider, model), {}))
+            row["win_rate"] = row["wins"] / row["requests"] if row["requests"] else None
+            for stream, label in ((True, "first_token"), (False, "response")):
+                values = latencies.get((provider, model, stream))
+                row[f"{label}_p50_s"] = values[len(values) // 2] if values else None
+                row[f"{label}_p95_s"] = values[min(len(values) - 1, int(len(values) * 0.95))] if values else None
+            stats.append(row)
+        return stats
+
+
+latency_tracker = LatencyTracker()
+
+
+def _produce(leg, events, scope):
+    """Run one hedged request on a worker thread, putting (leg, kind, payload) events on ``events``."""
+    with scope.activate():
+        chunks = iter(leg)
+        try:
+            for chunk in chunks:
+                if scope.cancelled:
+                    return
+                events.put((leg, _CHUNK, chunk))
+            events.put((leg, _END, None))
+        except Exception as e:
+            events.put((leg, _ERROR, e))
+        finally:
+            # Closing the generator closes the provider's streaming response
+            chunks.close()
+
+
+class HedgedStream:
+    """Iterate over the scenario text from whichever of two providers answers first.
+
+    Both requests are routed through the circuit breakers like any other
+    (see ``attackgen.routing``), and the primary one fails over to the
+    ``fallbacks`` configs. They are always streamed from the providers, with
+    clients of their own, so that the slower one can be cancelled by closing
+    its connection as soon as the other produces its first token; with
+    ``stream=False`` the text is yielded in one piece once it is complete.
+
+    ``winner`` is the config of the provider that answered, ``hedged`` is
+    True if the secondary provider was called and ``failed_over`` is True if
+    the primary request was answered by a fallback.
+    """
+
+    def __init__(self, primary, secondary, messages, stream=True, percentile=DEFAULT_PERCENTILE,
+                 tracker=latency_tracker, fallbacks=None, router=router):
+        self.primary = primary
+        self.secondary = secondary
+        self.messages = messages
+        self.stream = stream
+        self.percentile = percentile
+        self.tracker = tracker
+        self.winner = None
+        self.hedged = False
+        self.failed_over = False
+        fallbacks = [config for config in fallbacks or [] if config not in (primary, secondary)]
+        self._legs = (RoutedStream([primary] + fallbacks, messages, router=router),
+                      RoutedStream([secondary], messages, router=router))
+
+    def _start(self, leg, events, scopes, started):
+        scopes[leg] = CancelScope()
+        started[leg] = time.perf_counter()
+        threading.Thread(target=_produce, args=(leg, events, scopes[leg]),
+                         daemon=True, name=f"attackgen-hedge-{leg.configs[0].provider}").start()
+        self.tracker.count(leg.configs[0], "requests")
+
+    def __iter__(self):
+        events = queue.Queue()
+        scopes = {}
+        started = {}
+        deadline = time.perf_counter() + self.tracker.deadline(self.primary, True, self.percentile)
+        self._start(self._legs[0], events, scopes, started)
+        finished = set()
+        winner = None
+
+        try:
+            # Wait for the first chunk from either provider, hedging once the deadline passes
+            while winner is None:
+                timeout = None if self.hedged else max(0.0, deadline - time.perf_counter())
+                try:
+                    leg, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    self._hedge(events, scopes, started)
+                    continue
+
+                if kind == _CHUNK and payload:
+                    winner = leg
+                elif kind in (_END, _ERROR):
+                    finished.add(leg)
+                    if not self.hedged:
+                        # The primary failed (or returned nothing) before its deadline; try the secondary now
+                        self._hedge(events, scopes, started)
+                    elif finished >= set(scopes):
+                        if kind == _ERROR:
+                            raise payload
+                        return
+
+            self.winner = winner.winner
+            self.failed_over = winner is self._legs[0] and winner.failed_over
+            now = time.perf_counter()
+            self.tracker.record(self.winner, True, now - started[winner])
+            self.tracker.count(winner.configs[0], "wins")
+            for leg, scope in scopes.items():
+                if leg is not winner and leg not in finished:
+                    # Close the slower request's connection so that the provider stops generating
+                    scope.cancel()
+                    # The loser took at least this long, so count it as a (lower bound) latency sample
+                    self.tracker.record(leg.configs[0], True, now - started[leg])
+
+            parts = [payload]
+            if self.stream:
+                yield payload
+            while True:
+                leg, kind, payload = events.get()
+                if leg is not winner:
+                    continue
+                if kind == _CHUNK:
+                    if self.stream:
+                        yield payload
+                    else:
+                        parts.append(payload)
+                elif kind == _ERROR:
+                    raise payload
+                else:
+                    break
+            if not self.stream:
+                yield "".join(parts)
+        finally:
+            for scope in scopes.values():
+                scope.cancel()
+
+    def _hedge(self, events, scopes, started):
+        self.hedged = True
+        self.tracker.count(self.primary, "hedged")
+        self._start(self._legs[1], events, scopes, started)
+
+
+def format_hedging_stats(stats):
+    """One line per provider summarising ``LatencyTracker.stats()`` for display."""
+    lines = []
+    for row in stats:
+        text = f"{row['provider']} ({row['model']}): {row['wins']}/{row['requests']} wins"
+        if row["win_rate"] is not None:
+            text += f" ({row['win_rate']:.0%})"
+        text += f", hedged {row['hedged']} times"
+        for label, name in (("first_token", "first token"), ("response", "response")):
+            if row[f"{label}_p50_s"] is not None:
+                text += f" · {name} p50 {row[f'{label}_p50_s']:.1f}s, p95 {row[f'{label}_p95_s']:.1f}s"
+        lines.append(text)
+    return "\n\n".join(lines)
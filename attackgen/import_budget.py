@@ -0,0 +1,105 @@
+"""
+Import-time budget check for the AttackGen pages.
+
+Each page's top-level imports are timed in a fresh interpreter and compared
+with a budget, and the check fails if any of them pulls in a provider SDK
+(provider SDKs must only be imported on first use, see
+``attackgen.generation``). Run it before deploying with:
+
+    python -m attackgen.import_budget
+
+The same check runs as part of the test suite (``tests/test_import_budget.py``).
+Budgets are in seconds and can be overridden with the
+``ATTACKGEN_PAGE_IMPORT_BUDGET`` and ``ATTACKGEN_PACKAGE_IMPORT_BUDGET``
+environment variables for slower machines.
+"""
+
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE_BUDGET_SECONDS = float(os.getenv("ATTACKGEN_PAGE_IMPORT_BUDGET", "1.5"))
+PACKAGE_BUDGET_SECONDS = float(os.getenv("ATTACKGEN_PACKAGE_IMPORT_BUDGET", "0.1"))
+
+# Modules that must never be imported just by loading a page
+EAGER_IMPORT_FORBIDDEN = ("langchain_openai", "langchain_mistralai", "langchain_community", "openai",
+                          "mitreattack", "stix2")
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile(sys.argv[1], "<imports>", "exec"))
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+
+def page_paths():
+    """The Welcome page and every page under ``pages/``."""
+    return sorted(glob.glob(os.path.join(ROOT, "*.py"))) + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+
+
+def top_level_imports(path):
+    """Return the module-level import statements of a script as source code."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure_imports(code, repeat=3):
+    """Time ``code`` in fresh interpreters; returns (best seconds, modules imported)."""
+    best, modules = None, []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _MEASURE, code], cwd=ROOT, capture_output=True, text=True,
+                                check=True)
+        measurement = json.loads(result.stdout)
+        if best is None or measurement["seconds"] < best:
+            best = measurement["seconds"]
+        modules = measurement["modules"]
+    return best, modules
+
+
+def targets():
+    """(name, import code, budget seconds) for the package and every page."""
+    return ([("import attackgen", "import attackgen", PACKAGE_BUDGET_SECONDS)]
+            + [(os.path.relpath(path, ROOT), top_level_imports(path), PAGE_BUDGET_SECONDS) for path in page_paths()])
+
+
+def check_target(code, budget):
+    """Time ``code`` and return (seconds, problems), where problems is empty if it is within budget."""
+    seconds, modules = measure_imports(code)
+    problems = []
+    if seconds > budget:
+        problems.append(f"took {seconds:.2f}s, budget is {budget:.2f}s")
+    eager = sorted({module.split(".")[0] for module in modules} & set(EAGER_IMPORT_FORBIDDEN))
+    if eager:
+        problems.append("imports " + ", ".join(eager) + " eagerly")
+    return seconds, problems
+
+
+def check():
+    """Run every check and return a list of (name, seconds, budget, problems) rows."""
+    rows = []
+    for name, code, budget in targets():
+        seconds, problems = check_target(code, budget)
+        rows.append((name, seconds, budget, problems))
+    return rows
+
+
+def main():
+    failed = False
+    for name, seconds, budget, problems in check():
+        status = "FAIL: " + "; ".join(problems) if problems else "ok"
+        print(f"{name}: {seconds:.3f}s (budget {budget:.2f}s) {status}")
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Precomputed lookup tables over an ATT&CK snapshot.
+
+Querying the snapshot for a group's techniques walks every relationship, and
+the Threat Group page does that on every rerun. ``AttackIndex`` resolves the
+relationships once at load into an alias map and CSR-style integer arrays:
+
+* ``group_offsets``/``group_techniques``: the techniques used by group ``g``
+  are ``group_techniques[group_offsets[g]:group_offsets[g + 1]]``, ordered by
+  primary tactic.
+* ``technique_offsets``/``technique_tactics``: the tactics of technique ``t``
+  in the order they are listed on the technique.
+
+Technique rows follow ``snapshot.techniques`` and tactic columns follow
+``snapshot.tactics`` (matrix order).
+"""
+
+import numpy as np
+
+
+def _csr(rows, dtype=np.int32):
+    """Pack a list of integer lists into (offsets, values) arrays."""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    values = np.fromiter((value for row in rows for value in row), dtype=dtype, count=int(offsets[-1]))
+    return offsets, values
+
+
+class AttackIndex:
+    def __init__(self, snapshot):
+        self.technique_ids = [technique["id"] for technique in snapshot.techniques]
+        self.group_ids = [group["id"] for group in snapshot.groups]
+        self.tactic_shortnames = [tactic["shortname"] for tactic in snapshot.tactics]
+
+        self.technique_rows = technique_rows = {stix_id: row for row, stix_id in enumerate(self.technique_ids)}
+        group_rows = {stix_id: row for row, stix_id in enumerate(self.group_ids)}
+        tactic_columns = {shortname: column for column, shortname in enumerate(self.tactic_shortnames)}
+
+        # Technique -> tactics
+        technique_tactics = [[tactic_columns[phase] for phase in technique["phases"] if phase in tactic_columns]
+                             for technique in snapshot.techniques]
+        self.technique_offsets, self.technique_tactics = _csr(technique_tactics, np.int16)
+
+        # Primary (first listed) tactic of each technique, or -1 if it has none
+        self.primary_tactic = np.array([tactics[0] if tactics else -1 for tactics in technique_tactics],
+                                       dtype=np.int16)
+
+        # Alias -> group, preferring active groups and the first group listing the alias
+        self.alias_to_group = {}
+        for active_pass in (True, False):
+            for row, group in enumerate(snapshot.groups):
+                if group["active"] == active_pass:
+                    for alias in group["aliases"]:
+                        self.alias_to_group.setdefault(alias, row)
+
+        # Group -> techniques, including techniques used by campaigns attributed to the group
+        campaign_groups = {}
+        for source, rel_type, target in snapshot.relationships:
+            if rel_type == "attributed-to" and target in group_rows:
+                campaign_groups.setdefault(source, []).append(group_rows[target])
+
+        group_techniques = [set() for _ in self.group_ids]
+        for source, rel_type, target in snapshot.relationships:
+            if rel_type != "uses" or target not in technique_rows:
+                continue
+            row = technique_rows[target]
+            if not snapshot.techniques[row]["active"]:
+                continue
+            if source in group_rows:
+                group_techniques[group_rows[source]].add(row)
+            for group_row in campaign_groups.get(source, ()):
+                group_techniques[group_row].add(row)
+
+        # Order each group's techniques by primary tactic (no tactic last) so a gather is already sorted
+        n_tactics = len(self.tactic_shortnames)
+        sort_key = np.where(self.primary_tactic < 0, n_tactics, self.primary_tactic)
+        self.group_offsets, self.group_techniques = _csr(
+            [sorted(rows, key=lambda row: (sort_key[row], row)) for rows in group_techniques])
+
+    def group_for_alias(self, alias):
+        """Return the row of the group known by ``alias``, or None."""
+        return self.alias_to_group.get(alias)
+
+    def techniques_for_group(self, group):
+        """Technique rows used by group row ``group`` (a view, not a copy)."""
+        return self.group_techniques[self.group_offsets[group]:self.group_offsets[group + 1]]
+
+    def tactics_for_technique(self, technique):
+        """Tactic columns of technique row ``technique`` (a view, not a copy)."""
+        return self.technique_tactics[self.technique_offsets[technique]:self.technique_offsets[technique + 1]]
@@ -0,0 +1,128 @@
+"""
+Background generation jobs.
+
+A scenario takes 30-50 seconds to generate. Running the provider call on
+the Streamlit script thread ties up a server thread for that long, and any
+click during generation reruns the script and throws away the result.
+``JobQueue`` runs generations on a shared worker pool instead; the page keeps
+only the job ID in session state and polls the job, so results survive
+reruns and page switches.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+
+DEFAULT_MAX_WORKERS = int(os.getenv("ATTACKGEN_GENERATION_WORKERS", "16"))
+
+# Finished jobs are kept this long for their page to collect the result
+DEFAULT_KEEP_SECONDS = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class GenerationJob:
+    """One background generation.
+
+    The job function appends text to ``parts`` as it arrives, so the page can
+    show progress, and may set ``stats`` and ``run_id``.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.parts = []
+        self.result = None
+        self.error = None
+        self.stats = None
+        self.run_id = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return f"GenerationJob(id={self.id!r}, status={self.status!r})"
+
+    def append(self, chunk):
+        self.parts.append(chunk)
+
+    @property
+    def text(self):
+        """The text generated so far."""
+        return "".join(self.parts)
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def elapsed(self):
+        """Seconds since the job was submitted, or how long it took once finished."""
+        return (self.finished or time.time()) - self.created
+
+
+class JobQueue:
+    """Run generation jobs on a bounded thread pool and look them up by ID."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, keep_seconds=DEFAULT_KEEP_SECONDS):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attackgen-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Run ``func(job, *args, **kwargs)`` in the background and return the job.
+
+        The return value of ``func`` becomes ``job.result``; an exception marks
+        the job as failed with its message in ``job.error``.
+        """
+        job = GenerationJob()
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            job.result = func(job, *args, **kwargs)
+            status = DONE
+        except Exception as e:
+            job.error = str(e)
+            status = FAILED
+        # Set the finish time first, so that a job is never done without one
+        job.finished = time.time()
+        job.status = status
+
+    def _expire(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done and job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return the job with ``job_id``, or None if it is unknown or has expired."""
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+@lru_cache(maxsize=None)
+def get_job_queue():
+    """Return the job queue shared by every session in this process."""
+    return JobQueue()
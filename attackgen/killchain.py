@@ -0,0 +1,82 @@
+"""
+Seedable, vectorised kill chain sampling.
+
+A kill chain is one technique per ATT&CK phase, chosen at random from the
+techniques a group is known to use. ``KillChainSampler`` groups the
+techniques by phase once, then draws any number of kill chains in a single
+NumPy call, so the same seed always gives the same kill chains.
+"""
+
+import numpy as np
+
+
+class KillChainSampler:
+    """Draw kill chains from a set of technique rows.
+
+    ``technique_rows`` are technique rows (as used by ``AttackIndex`` and
+    ``TechniqueCatalog``) and ``phase_codes`` their phase positions in
+    ``PHASE_NAME_ORDER``; rows with a negative code have no phase and are never
+    sampled.
+    """
+
+    def __init__(self, technique_rows, phase_codes):
+        technique_rows = np.asarray(technique_rows)
+        phase_codes = np.asarray(phase_codes)
+
+        keep = phase_codes >= 0
+        technique_rows, phase_codes = technique_rows[keep], phase_codes[keep]
+        order = np.argsort(phase_codes, kind="stable")
+
+        # Per-phase technique index: rows grouped by phase, with start offsets and counts
+        self.rows = technique_rows[order]
+        self.phases, self.starts, self.counts = np.unique(phase_codes[order], return_index=True, return_counts=True)
+
+    @classmethod
+    def from_catalog(cls, catalog, technique_rows):
+        """Build a sampler over ``technique_rows`` using the catalog's phase names."""
+        phase_codes = catalog.frame["Phase Name"].cat.codes.to_numpy()[technique_rows]
+        return cls(technique_rows, phase_codes)
+
+    def __len__(self):
+        return len(self.phases)
+
+    def sample(self, n=1, seed=None, replace=True):
+        """Return an ``(n, phases)`` array of technique rows, one kill chain per row.
+
+        With ``replace=True`` each kill chain is drawn independently. With
+        ``replace=False`` no technique is reused for a phase until every
+        technique in that phase has been used, which makes the kill chains as
+        distinct as the group's techniques allow.
+        """
+        rng = np.random.default_rng(seed)
+        if len(self.phases) == 0:
+            return np.empty((n, 0), dtype=self.rows.dtype)
+
+        if replace:
+            offsets = rng.integers(0, self.counts, size=(n, len(self.counts)))
+        else:
+            offsets = np.empty((n, len(self.counts)), dtype=np.int64)
+            for column, count in enumerate(self.counts):
+                # Concatenate enough shuffled permutations of the phase to cover n chains
+                rounds = -(-n // count)
+                offsets[:, column] = rng.random((rounds, count)).argsort(axis=1).ravel()[:n]
+
+        return self.rows[self.starts + offsets]
+
+
+def build_kill_chain(group_alias, seed=None, store=None):
+    """Return a kill chain table for the group known by ``group_alias``.
+
+    Returns None if the group is unknown. The table has 'Technique Name',
+    'ATT&CK ID' and 'Phase Name' columns, one row per phase.
+    """
+    if store is None:
+        from attackgen.data import get_attack_store
+
+        store = get_attack_store()
+
+    group = store.index.group_for_alias(group_alias)
+    if group is None:
+        return None
+    sampler = KillChainSampler.from_catalog(store.catalog, store.index.techniques_for_group(group))
+    return store.catalog.table(sampler.sample(1, seed=seed)[0]).reset_index(drop=True)
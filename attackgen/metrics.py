@@ -0,0 +1,121 @@
+"""
+Prometheus metrics for reruns, ATT&CK lookups, prompt building and provider calls.
+
+LangSmith traces individual runs, but says nothing about how long reruns,
+data lookups or provider calls take on our own servers. The metrics below
+are recorded in-process and served for Prometheus to scrape by
+``start_metrics_server()``, which every page calls and which only starts one
+server per process:
+
+    http://127.0.0.1:9464/metrics
+
+The address and port are set with ``ATTACKGEN_METRICS_ADDR`` and
+``ATTACKGEN_METRICS_PORT``; set the port to 0 to turn the endpoint off.
+Provider metrics are labelled by provider and model.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+
+METRICS_ADDR = os.getenv("ATTACKGEN_METRICS_ADDR", "127.0.0.1")
+METRICS_PORT = int(os.getenv("ATTACKGEN_METRICS_PORT", "9464"))
+
+# Buckets in seconds: fast in-process work, and provider calls that can take minutes
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_PROVIDER_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0, 240.0, 600.0)
+
+RERUN_SECONDS = Histogram("attackgen_rerun_seconds", "Duration of a full page rerun.", ["page"],
+                          buckets=_FAST_BUCKETS + (5.0, 10.0))
+ATTACK_QUERY_SECONDS = Histogram("attackgen_attack_query_seconds", "Duration of ATT&CK data lookups.", ["query"],
+                                 buckets=_FAST_BUCKETS)
+PROMPT_BUILD_SECONDS = Histogram("attackgen_prompt_build_seconds", "Duration of building a scenario prompt.",
+                                 ["page"], buckets=_FAST_BUCKETS)
+PROVIDER_LATENCY_SECONDS = Histogram("attackgen_provider_latency_seconds",
+                                     "Time from sending a request to a provider to receiving the whole response.",
+                                     ["provider", "model", "stream"], buckets=_PROVIDER_BUCKETS)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram("attackgen_time_to_first_token_seconds",
+                                        "Time from sending a streamed request to receiving the first text.",
+                                        ["provider", "model"], buckets=_PROVIDER_BUCKETS)
+TOKENS_PER_SECOND = Histogram("attackgen_tokens_per_second",
+                              "Output tokens per second, after the first token when streaming.",
+                              ["provider", "model"], buckets=(5, 10, 20, 30, 40, 60, 80, 120, 160, 250, 500))
+OUTPUT_TOKENS = Histogram("attackgen_output_tokens", "Tokens in each generated response.", ["provider", "model"],
+                          buckets=(64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192))
+OLLAMA_LOAD_SECONDS = Histogram("attackgen_ollama_load_seconds",
+                                "Time Ollama spent loading the model, for warm-ups and for generation requests.",
+                                ["model", "request"], buckets=(0.01, 0.1, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0, 300.0))
+OLLAMA_IN_PROGRESS = Gauge("attackgen_ollama_in_progress", "Requests in progress on each Ollama server.", ["host"])
+PROVIDER_ERRORS = Counter("attackgen_provider_errors", "Failed provider requests, by exception type.",
+                          ["provider", "model", "error"])
+COALESCED_REQUESTS = Counter("attackgen_coalesced_requests",
+                             "Generation requests that shared an identical request already in progress, saving a "
+                             "provider call.", ["provider", "model"])
+CACHE_LOOKUPS = Counter("attackgen_cache_lookups", "Scenario cache lookups.", ["provider", "model", "result"])
+FEEDBACK = Counter("attackgen_feedback", "Scenario ratings submitted.", ["page", "feedback"])
+LANGSMITH_EVENTS = Counter("attackgen_langsmith_events", "LangSmith runs and feedback sent, spooled or dropped.",
+                           ["kind", "result"])
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def start_metrics_server(port=METRICS_PORT, addr=METRICS_ADDR):
+    """Serve ``/metrics`` from a background thread, once per process. Returns True if it is being served."""
+    global _server_started
+
+    if not port:
+        return False
+    with _server_lock:
+        if not _server_started:
+            try:
+                start_http_server(port, addr=addr)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit server) already has the port
+                print(f"AttackGen metrics endpoint not started on {addr}:{port}: {e}", file=sys.stderr)
+            _server_started = True
+    return True
+
+
+@contextmanager
+def observe_seconds(histogram, **labels):
+    """Record the duration of the ``with`` block in ``histogram``, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def observe_rerun(page, start):
+    """Record a page rerun that started at ``start`` (a ``time.perf_counter()`` value)."""
+    RERUN_SECONDS.labels(page=page).observe(time.perf_counter() - start)
+
+
+def observe_response(config, stream, seconds, first_token_seconds, text):
+    """Record a completed provider response of ``text``."""
+    from attackgen.tokens import count_tokens
+
+    labels = {"provider": config.provider, "model": config.model or ""}
+    PROVIDER_LATENCY_SECONDS.labels(stream=str(stream).lower(), **labels).observe(seconds)
+    if stream and first_token_seconds is not None:
+        TIME_TO_FIRST_TOKEN_SECONDS.labels(**labels).observe(first_token_seconds)
+
+    tokens = count_tokens(text)
+    OUTPUT_TOKENS.labels(**labels).observe(tokens)
+    generating_seconds = seconds - first_token_seconds if stream and first_token_seconds is not None else seconds
+    if tokens and generating_seconds > 0:
+        TOKENS_PER_SECOND.labels(**labels).observe(tokens / generating_seconds)
+
+
+def count_error(config, error):
+    PROVIDER_ERRORS.labels(provider=config.provider, model=config.model or "", error=type(error).__name__).inc()
+
+
+def count_cache_lookup(config, hit):
+    CACHE_LOOKUPS.labels(provider=config.provider, model=config.model or "", result="hit" if hit else "miss").inc()
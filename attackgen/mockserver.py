@@ -0,0 +1,464 @@
+"""
+Local stand-in for the OpenAI, Azure OpenAI, Mistral and Ollama APIs.
+
+Load tests and benchmarks of the generation paths should not spend real
+tokens, and test machines may have no outbound network. ``MockLLMServer``
+answers the chat endpoints of all four providers with canned scenarios,
+streamed at a configurable number of tokens per second after a first-token
+delay drawn from a latency distribution, and can inject 401, 429 and 500
+errors and timeouts at configurable rates. For Ollama it can also simulate the
+time taken to load a model that is not already in memory.
+
+Run it with:
+
+    python -m attackgen.mockserver --port 8765 --latency lognormal:0.8:0.5 \\
+        --tokens-per-second 40 --error-rate 429=0.05 --error-rate timeout=0.01 \\
+        --ollama-load-seconds 5
+
+then point the app at it:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1      (any OpenAI API key)
+    MISTRAL_BASE_URL=http://127.0.0.1:8765/v1     (any Mistral API key)
+    OLLAMA_HOST=http://127.0.0.1:8765
+    Azure OpenAI endpoint: http://127.0.0.1:8765  (any key and deployment)
+
+Endpoints:
+
+- ``POST /v1/chat/completions`` (OpenAI and Mistral) and
+  ``POST /openai/deployments/<deployment>/chat/completions`` (Azure OpenAI),
+  streamed as server-sent events when ``"stream": true``.
+- ``GET /api/tags``, ``POST /api/chat`` and ``POST /api/generate`` (Ollama),
+  streamed as JSON lines unless ``"stream": false``. A model is "loaded"
+  (taking ``ollama_load_seconds``) on its first request and kept for the
+  request's ``keep_alive``; a generate request without a prompt only loads it.
+- ``GET /v1/models`` and ``GET /mock/stats`` (request counts by route and status).
+"""
+
+import argparse
+import glob
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from attackgen.generation import keep_alive_seconds
+
+
+ERROR_KINDS = ("401", "429", "500", "timeout")
+
+# Injected error status -> (message, OpenAI error type, OpenAI error code)
+_ERRORS = {
+    401: ("Incorrect API key provided (mock)", "invalid_request_error", "invalid_api_key"),
+    429: ("Rate limit reached (mock)", "rate_limit_error", "rate_limit_exceeded"),
+    500: ("Internal server error (mock)", "server_error", None),
+}
+
+DEFAULT_MODELS = ["llama3:latest", "mistral:latest"]
+
+DEFAULT_SCENARIO = """# Incident Response Testing Scenario
+
+## Background
+A {industry} organisation is targeted by a threat actor group. This scenario was generated by the AttackGen mock
+server and contains no real analysis.
+
+## Timeline
+1. **Initial Access:** A member of staff opens a phishing attachment, giving the attacker a foothold.
+2. **Execution:** A script runs from the attachment and downloads a second-stage payload.
+3. **Persistence:** A scheduled task is created so the payload survives a reboot.
+4. **Discovery:** The attacker enumerates domain accounts and file shares.
+5. **Lateral Movement:** Stolen credentials are used to reach a file server over remote services.
+6. **Exfiltration:** Sensitive files are compressed and sent to an external server over HTTPS.
+
+## Questions for the Incident Response Team
+- How would the phishing email and the scheduled task be detected?
+- Who decides when to isolate the file server, and how quickly can it be done?
+- What evidence must be preserved before systems are restored?
+"""
+
+
+# Whitespace-preserving word pieces, as a stand-in for tokens
+_TOKEN = re.compile(r"\s*\S+|\s+")
+
+
+def split_tokens(text):
+    """Split ``text`` into roughly token-sized pieces that join back to the original."""
+    return _TOKEN.findall(text)
+
+
+class Latency:
+    """A first-token delay distribution, parsed from a spec such as ``lognormal:0.8:0.5``.
+
+    Supported specs, in seconds: ``constant:S``, ``uniform:LOW:HIGH``,
+    ``normal:MEAN:STDDEV`` and ``lognormal:MEDIAN:SIGMA`` (a long-tailed
+    distribution like real provider latency). A bare number is a constant.
+    """
+
+    def __init__(self, spec="constant:0"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        if not args:
+            kind, args = "constant", kind
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(":")]
+        expected = {"constant": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self.args) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self, rng=random):
+        if self.kind == "constant":
+            seconds = self.args[0]
+        elif self.kind == "uniform":
+            seconds = rng.uniform(*self.args)
+        elif self.kind == "normal":
+            seconds = rng.gauss(*self.args)
+        else:
+            median, sigma = self.args
+            seconds = rng.lognormvariate(0, sigma) * median
+        return max(0.0, seconds)
+
+
+@dataclass
+class MockSettings:
+    """Behaviour of the mock server; may be changed while it is running."""
+    latency: Latency = field(default_factory=Latency)
+    tokens_per_second: float = 50.0
+    error_rates: dict = field(default_factory=dict)  # error kind -> probability
+    timeout_seconds: float = 30.0
+    scenarios: list = field(default_factory=lambda: [DEFAULT_SCENARIO])
+    models: list = field(default_factory=lambda: list(DEFAULT_MODELS))
+    ollama_load_seconds: float = 0.0
+    seed: int = None
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (injected error kind or None, first-token delay, scenario text) for one request."""
+        with self._lock:
+            roll = self.rng.random()
+            error = None
+            for kind in ERROR_KINDS:
+                rate = self.error_rates.get(kind, 0.0)
+                if roll < rate:
+                    error = kind
+                    break
+                roll -= rate
+            return error, self.latency.sample(self.rng), self.rng.choice(self.scenarios)
+
+
+def _keep_alive_seconds(keep_alive):
+    """Seconds an Ollama ``keep_alive`` value keeps a model loaded (Ollama's default is 5 minutes)."""
+    if keep_alive is None:
+        return 300.0
+    seconds = keep_alive_seconds(keep_alive)
+    return float("inf") if seconds is None else seconds
+
+
+def _industry(messages):
+    match = re.search(r"operates in the '([^']+)' industry", " ".join(str(m.get("content", "")) for m in messages))
+    return match.group(1) if match else "mid-sized"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AttackGenMock/1.0"
+
+    # ------------------ Routing ------------------ #
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "":
+            self._send_text(200, "Ollama is running")
+        elif path == "/api/tags":
+            self._send_json(200, {"models": [{"name": model, "model": model, "size": 0, "digest": uuid.uuid4().hex,
+                                              "modified_at": "2024-01-01T00:00:00Z"}
+                                             for model in self.server.settings.models]})
+        elif path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "mock"}
+                                                             for model in self.server.settings.models]})
+        elif path == "/mock/stats":
+            with self.server.stats_lock:
+                self._send_json(200, {f"{route} {status}": count for (route, status), count
+                                      in sorted(self.server.stats.items())})
+        else:
+            self._send_json(404, {"error": f"Not found: {path}"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "Request body is not valid JSON"})
+            return
+
+        if path.endswith("/chat/completions"):
+            deployment = re.search(r"/deployments/([^/]+)/", path)
+            self._chat_completions(body, deployment.group(1) if deployment else body.get("model", "mock"))
+        elif path in ("/api/chat", "/api/generate"):
+            self._ollama(body, chat=path == "/api/chat")
+        else:
+            self._send_json(404, {"error": f"Not found: {path}"})
+
+    # ------------------ Responses ------------------ #
+
+    def _prepare(self, messages, max_tokens, route, ollama):
+        """Apply error injection and the first-token delay; returns the response tokens or None if handled."""
+        settings = self.server.settings
+        error, delay, scenario = settings.draw()
+        if error == "timeout":
+            self._count(route, "timeout")
+            time.sleep(settings.timeout_seconds)
+            self.close_connection = True
+            return None
+        if error is not None:
+            status = int(error)
+            message, kind, code = _ERRORS[status]
+            payload = {"error": message} if ollama else {"error": {"message": message, "type": kind, "code": code}}
+            self._send_json(status, payload, headers={"Retry-After": "1"} if status == 429 else None, route=route)
+            return None
+
+        time.sleep(delay)
+        tokens = split_tokens(scenario.format(industry=_industry(messages)))
+        if max_tokens:
+            tokens = tokens[:max_tokens]
+        return tokens
+
+    def _pace(self, tokens):
+        """Yield ``tokens`` at the configured tokens per second."""
+        interval = 1 / self.server.settings.tokens_per_second if self.server.settings.tokens_per_second else 0
+        start = time.perf_counter()
+        for position, token in enumerate(tokens):
+            wait = start + position * interval - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            yield token
+
+    def _chat_completions(self, body, model):
+        route = "chat/completions"
+        tokens = self._prepare(body.get("messages", []), body.get("max_tokens"), route, ollama=False)
+        if tokens is None:
+            return
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        finish_reason = "length" if body.get("max_tokens") and len(tokens) >= body["max_tokens"] else "stop"
+        usage = {"prompt_tokens": sum(len(split_tokens(str(m.get("content", "")))) for m in body.get("messages", [])),
+                 "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        def chunk(delta, finish=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish, "logprobs": None}]}
+
+        if not body.get("stream"):
+            text = "".join(self._pace(tokens))
+            self._send_json(200, {"id": completion_id, "object": "chat.completion", "created": created,
+                                  "model": model, "usage": usage,
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                               "finish_reason": finish_reason, "logprobs": None}]}, route=route)
+            return
+
+        self._start_stream("text/event-stream", route)
+        self._write_chunk(b"data: " + json.dumps(chunk({"role": "assistant", "content": ""})).encode() + b"\n\n")
+        for token in self._pace(tokens):
+            self._write_chunk(b"data: " + json.dumps(chunk({"content": token})).encode() + b"\n\n")
+        final = chunk({}, finish_reason)
+        final["usage"] = usage
+        self._write_chunk(b"data: " + json.dumps(final).encode() + b"\n\n")
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+    def _load_model(self, model, keep_alive):
+        """Simulate Ollama loading ``model`` unless it is still loaded; returns the load time in seconds."""
+        server = self.server
+        with server.stats_lock:
+            loaded = server.ollama_loaded.get(model, 0) > time.monotonic()
+        load_s = 0.0 if loaded else server.settings.ollama_load_seconds
+        time.sleep(load_s)
+        with server.stats_lock:
+            server.ollama_loaded[model] = time.monotonic() + _keep_alive_seconds(keep_alive)
+        return load_s
+
+    def _ollama(self, body, chat):
+        route = "api/chat" if chat else "api/generate"
+        model = body.get("model", "mock")
+        load_s = self._load_model(model, body.get("keep_alive"))
+        if not chat and not body.get("prompt"):
+            # A generate request without a prompt only loads the model
+            self._send_json(200, {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                                  "response": "", "done": True, "done_reason": "load",
+                                  "load_duration": int(load_s * 1e9)}, route=route)
+            return
+        messages = body.get("messages", []) if chat else [{"content": body.get("prompt", "")}]
+        prompt_start = time.perf_counter()
+        tokens = self._prepare(messages, (body.get("options") or {}).get("num_predict"), route, ollama=True)
+        if tokens is None:
+            return
+        start = time.perf_counter()
+
+        def piece(text, done):
+            message = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": done}
+            if chat:
+                message["message"] = {"role": "assistant", "content": text}
+            else:
+                message["response"] = text
+            if done:
+                eval_s = time.perf_counter() - start
+                message.update({"done_reason": "stop", "eval_count": len(tokens),
+                                "load_duration": int(load_s * 1e9),
+                                "prompt_eval_duration": int((start - prompt_start) * 1e9),
+                                "eval_duration": int(eval_s * 1e9),
+                                "total_duration": int((load_s + time.perf_counter() - prompt_start) * 1e9)})
+            return message
+
+        if body.get("stream") is False:
+            self._send_json(200, piece("".join(self._pace(tokens)), True), route=route)
+            return
+
+        self._start_stream("application/x-ndjson", route)
+        for token in self._pace(tokens):
+            self._write_chunk(json.dumps(piece(token, False)).encode() + b"\n")
+        self._write_chunk(json.dumps(piece("", True)).encode() + b"\n")
+        self._end_stream()
+
+    # ------------------ HTTP helpers ------------------ #
+
+    def _count(self, route, status):
+        with self.server.stats_lock:
+            self.server.stats[(route, str(status))] += 1
+
+    def _send_json(self, status, payload, headers=None, route=None):
+        self._send(status, json.dumps(payload).encode(), "application/json", headers, route)
+
+    def _send_text(self, status, text):
+        self._send(status, text.encode(), "text/plain")
+
+    def _send(self, status, data, content_type, headers=None, route=None):
+        if route:
+            self._count(route, status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type, route):
+        self._count(route, 200)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """The mock provider API server. Use ``start()`` to serve from a background thread, e.g. in a load test."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=8765, settings=None, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.settings = settings or MockSettings()
+        self.verbose = verbose
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.ollama_loaded = {}  # Ollama model -> time.monotonic() when it is unloaded
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="attackgen-mockserver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _error_rate(value):
+    kind, _, rate = value.partition("=")
+    if kind not in ERROR_KINDS or not rate:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(ERROR_KINDS)}=RATE, e.g. 429=0.05")
+    return kind, float(rate)
+
+
+def _load_scenarios(paths):
+    scenarios = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, encoding="utf-8") as f:
+                # Braces in canned scenarios are kept literally; only {industry} is filled in
+                scenarios.append(f.read().replace("{", "{{").replace("}", "}}").replace("{{industry}}", "{industry}"))
+    return scenarios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI, Azure OpenAI, Mistral and Ollama APIs.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--latency", type=Latency, default=Latency("constant:0.5"),
+                        help="First-token delay in seconds: constant:S, uniform:LOW:HIGH, normal:MEAN:STDDEV or "
+                             "lognormal:MEDIAN:SIGMA.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Rate at which response tokens are sent (0 for no delay).")
+    parser.add_argument("--error-rate", type=_error_rate, action="append", default=[],
+                        help="Probability of an injected error, e.g. 429=0.05, 500=0.01, 401=1 or timeout=0.01. Repeatable.")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0,
+                        help="How long an injected timeout stalls before the connection is dropped.")
+    parser.add_argument("--scenario", action="append", default=[],
+                        help="Markdown file (or glob) of a canned scenario to return; {industry} is filled in. "
+                             "Repeatable; one is chosen at random per request.")
+    parser.add_argument("--ollama-load-seconds", type=float, default=0.0,
+                        help="How long Ollama takes to load a model that is not already loaded.")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS, help="Models listed by /api/tags and /v1/models.")
+    parser.add_argument("--seed", type=int, help="Seed for latencies, errors and scenario choice.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            error_rates=dict(args.error_rate), timeout_seconds=args.timeout_seconds,
+                            scenarios=_load_scenarios(args.scenario) or [DEFAULT_SCENARIO], models=args.models,
+                            ollama_load_seconds=args.ollama_load_seconds, seed=args.seed)
+    server = MockLLMServer(args.host, args.port, settings, verbose=args.verbose)
+    print(f"Mock provider APIs listening on {server.url}\n"
+          f"  OPENAI_BASE_URL={server.url}/v1\n"
+          f"  MISTRAL_BASE_URL={server.url}/v1\n"
+          f"  OLLAMA_HOST={server.url}\n"
+          f"  Azure OpenAI endpoint: {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
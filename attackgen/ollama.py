@@ -0,0 +1,405 @@
+"""
+Ollama servers: cached model discovery, model warm-up and load balancing.
+
+The Welcome sidebar used to call Ollama's ``/api/tags`` with no timeout on
+every rerun, so every widget change waited on Ollama and the sidebar hung
+while the daemon was busy loading a model. ``OllamaModels`` keeps the last
+known model list for the process, shared by every page and session, and
+refreshes it from a background thread once it is older than
+``ATTACKGEN_OLLAMA_MODELS_TTL`` seconds. The first list is fetched in the
+background too, with a strict connect and read timeout; until it arrives
+the server is reported as still being checked.
+
+The first request after Ollama has been idle also waits while the model's
+weights are loaded into memory, which can take longer than generating the
+scenario. ``ModelWarmer`` loads a model ahead of time with an empty request
+when it is selected on the Welcome page (or, for the models listed in
+``ATTACKGEN_OLLAMA_PRELOAD``, when the first page is loaded), and every
+request asks Ollama to keep the model loaded for ``OLLAMA_KEEP_ALIVE``
+(``ATTACKGEN_OLLAMA_KEEP_ALIVE``, 30 minutes by default, rather than
+Ollama's 5). Ollama reports how long each request spent loading the model
+and generating; those timings are added to the run's stats.
+
+``OLLAMA_HOSTS`` can list several Ollama servers. ``OllamaPool`` treats a
+server as healthy while its last model list request succeeded, sends each
+generation to the healthy server with the model that has the fewest
+requests in progress, and tries the next one if a server cannot be reached.
+"""
+
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+
+from contextlib import contextmanager
+
+from attackgen import metrics
+from attackgen.generation import OLLAMA_HOST, OLLAMA_HOSTS, OLLAMA_KEEP_ALIVE, keep_alive_seconds, ollama_keep_alive
+
+
+MODELS_TTL_SECONDS = float(os.getenv("ATTACKGEN_OLLAMA_MODELS_TTL", "30"))
+TIMEOUT = (0.5, 2)
+
+# Preload the selected model when it is chosen on the Welcome page
+WARM_UP = os.getenv("ATTACKGEN_OLLAMA_WARM_UP", "1").lower() not in ("0", "false", "no")
+# Models to load when the first page is loaded, e.g. "llama3:latest,mistral:latest"
+PRELOAD_MODELS = [model.strip() for model in os.getenv("ATTACKGEN_OLLAMA_PRELOAD", "").split(",") if model.strip()]
+# Loading a large model from disk can take minutes
+WARM_UP_TIMEOUT = (3.05, 600)
+# Wait this long after a failed warm-up before trying again
+WARM_UP_RETRY_SECONDS = 60
+
+class OllamaModels:
+    """The model list of one Ollama server, refreshed in the background."""
+
+    def __init__(self, host=OLLAMA_HOST, ttl_seconds=MODELS_TTL_SECONDS, timeout=TIMEOUT):
+        self.host = host.rstrip("/")
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self._models = None
+        self._fetched_at = None  # time.monotonic() of the last successful fetch
+        self._checked_at = None  # time.monotonic() of the last attempt
+        self.error = None  # Message from the last attempt, if it failed
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._session = None
+
+    def models(self):
+        """Return the last known list of model names, or None if Ollama has not responded yet.
+
+        Never waits: the first call starts fetching the list in the
+        background, and later calls refresh a stale list in the background.
+        """
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.ttl_seconds:
+            self.refresh_in_background()
+        return self._models
+
+    @property
+    def cached_models(self):
+        """The last known list of model names, or None, without refreshing it."""
+        return self._models
+
+    def has_model(self, model):
+        """False only if Ollama has reported its models and ``model`` is not among them."""
+        return self._models is None or model in self._models
+
+    @property
+    def age_seconds(self):
+        """Seconds since the model list was last fetched successfully, or None."""
+        return None if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="attackgen-ollama-models", daemon=True).start()
+
+    @property
+    def checked(self):
+        """True once the model list has been requested, whether or not Ollama responded."""
+        return self._checked_at is not None
+
+    @property
+    def healthy(self):
+        """True if the last request for the model list succeeded."""
+        return self._models is not None and self.error is None
+
+    def mark_down(self, error):
+        """Record that a request to this server failed to connect, and check it again in the background."""
+        self.error = str(error)
+        self.refresh_in_background()
+
+    def refresh(self):
+        """Fetch the model list now. Returns True on success."""
+        from attackgen.clients import requests_session
+
+        with self._lock:
+            self._refreshing = True
+            if self._session is None:
+                self._session = requests_session()
+        try:
+            response = self._session.get(f"{self.host}/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            self._models = [model["name"] for model in response.json()["models"]]
+            self._fetched_at = time.monotonic()
+            self.error = None
+            return True
+        except Exception as e:
+            print(f"Could not list the Ollama models at {self.host}: {e}", file=sys.stderr)
+            self.error = str(e)
+            return False
+        finally:
+            self._checked_at = time.monotonic()
+            with self._lock:
+                self._refreshing = False
+
+
+class ModelWarmer:
+    """Loads Ollama models into memory ahead of their first request, from a background thread."""
+
+    def __init__(self, host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE, timeout=WARM_UP_TIMEOUT):
+        self.host = host.rstrip("/")
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._models = {}  # model -> {"state": "loading", "loaded" or "failed", "at", "load_s", "error"}
+        self._session = None
+
+    def warm_up_in_background(self, model):
+        """Start loading ``model`` unless it is loading, was loaded recently, or recently failed to load."""
+        with self._lock:
+            if not self._needs_warm_up(model):
+                return
+            self._models[model] = {"state": "loading", "at": time.monotonic(), "load_s": None, "error": None}
+        threading.Thread(target=self.warm_up, args=(model,), name="attackgen-ollama-warm-up", daemon=True).start()
+
+    def _needs_warm_up(self, model):
+        status = self._models.get(model)
+        if status is None:
+            return True
+        age = time.monotonic() - status["at"]
+        if status["state"] == "loading":
+            return False
+        if status["state"] == "failed":
+            return age >= WARM_UP_RETRY_SECONDS
+        # Reload before Ollama would unload it; a keep-alive of 0 unloads it at once, so there is no point
+        resident = keep_alive_seconds(self.keep_alive)
+        return resident is not None and resident > 0 and age >= resident / 2
+
+    def warm_up(self, model):
+        """Load ``model`` now and keep it loaded for ``keep_alive``. Returns the load time in seconds, or None."""
+        from attackgen.clients import requests_session
+
+        with self._lock:
+            if self._session is None:
+                self._session = requests_session()
+            self._models[model] = {"state": "loading", "at": time.monotonic(), "load_s": None, "error": None}
+        start = time.perf_counter()
+        try:
+            # A request without a prompt only loads the model
+            response = self._session.post(f"{self.host}/api/generate", timeout=self.timeout,
+                                          json={"model": model, "keep_alive": ollama_keep_alive(self.keep_alive)})
+            response.raise_for_status()
+            load_duration = response.json().get("load_duration")
+        except Exception as e:
+            print(f"Could not preload the Ollama model {model} at {self.host}: {e}", file=sys.stderr)
+            with self._lock:
+                self._models[model] = {"state": "failed", "at": time.monotonic(), "load_s": None, "error": str(e)}
+            return None
+        load_s = load_duration / 1e9 if load_duration is not None else time.perf_counter() - start
+        metrics.OLLAMA_LOAD_SECONDS.labels(model=model, request="warm_up").observe(load_s)
+        self.mark_loaded(model, load_s)
+        return load_s
+
+    def mark_loaded(self, model, load_s=None):
+        """Record that Ollama has just loaded (or used) ``model``, restarting its keep-alive."""
+        with self._lock:
+            previous = self._models.get(model) or {}
+            self._models[model] = {"state": "loaded", "at": time.monotonic(), "error": None,
+                                   "load_s": load_s if load_s is not None else previous.get("load_s")}
+
+    def status(self, model):
+        """The warm-up state of ``model`` (see ``_models``), or None if it has not been loaded by AttackGen."""
+        with self._lock:
+            status = self._models.get(model)
+            return dict(status) if status else None
+
+
+def split_hosts(hosts):
+    """The Ollama base URLs in a comma-separated ``hosts`` string."""
+    return [host.strip().rstrip("/") for host in hosts.split(",") if host.strip()]
+
+
+class OllamaPool:
+    """Ollama servers hosting the same models, with requests routed to the least busy healthy server."""
+
+    def __init__(self, hosts=OLLAMA_HOSTS):
+        self.hosts = split_hosts(hosts) or [OLLAMA_HOST.rstrip("/")]
+        self._lock = threading.Lock()
+        self._outstanding = {host: 0 for host in self.hosts}
+        self._requests = {host: 0 for host in self.hosts}
+        self._failures = {host: 0 for host in self.hosts}
+        self._turn = 0  # Rotates between equally busy servers
+
+    def servers(self):
+        """The ``OllamaModels`` of each server."""
+        return [get_ollama_models(host) for host in self.hosts]
+
+    def models(self):
+        """Names of the models on any server, or None if no server has ever responded."""
+        lists = [models for models in (server.models() for server in self.servers()) if models is not None]
+        if not lists:
+            return None
+        return list(dict.fromkeys(model for models in lists for model in models))
+
+    def has_model(self, model):
+        return any(server.has_model(model) for server in self.servers())
+
+    @property
+    def error(self):
+        """The last error if no server is healthy, else None."""
+        servers = self.servers()
+        if any(server.healthy for server in servers):
+            return None
+        return next((server.error for server in servers if server.error), None)
+
+    @property
+    def age_seconds(self):
+        """Seconds since a model list was last fetched from any server, or None."""
+        ages = [server.age_seconds for server in self.servers() if server.age_seconds is not None]
+        return min(ages) if ages else None
+
+    def _has_model(self, host, model):
+        server = get_ollama_models(host)
+        return server.healthy and model in server.cached_models
+
+    def candidates(self, model):
+        """Servers to send a request for ``model`` to, in order of preference.
+
+        Healthy servers with the model come first, those with the fewest
+        requests in progress first. Servers that are down are only tried if no
+        healthy server has the model, in case they have recovered.
+        """
+        with self._lock:
+            self._turn = (self._turn + 1) % len(self.hosts)
+            rotated = self.hosts[self._turn:] + self.hosts[:self._turn]
+            outstanding = dict(self._outstanding)
+        servers = dict(zip(self.hosts, self.servers()))
+        healthy, down = [], []
+        for host in rotated:
+            server = servers[host]
+            models = server.models()
+            if server.healthy:
+                if model in models:
+                    healthy.append(host)
+            elif models is None or model in models:
+                down.append(host)
+        return sorted(healthy, key=outstanding.get) or down
+
+    @contextmanager
+    def slot(self, host):
+        """Count a request to ``host`` as in progress for the duration of the ``with`` block."""
+        with self._lock:
+            self._outstanding[host] += 1
+            self._requests[host] += 1
+        metrics.OLLAMA_IN_PROGRESS.labels(host=host).inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._outstanding[host] -= 1
+            metrics.OLLAMA_IN_PROGRESS.labels(host=host).dec()
+
+    def mark_down(self, host, error):
+        with self._lock:
+            self._failures[host] += 1
+        get_ollama_models(host).mark_down(error)
+
+    def warm_up_in_background(self, model):
+        """Start loading ``model`` on every healthy server that has it."""
+        for host in self.hosts:
+            if self._has_model(host, model):
+                get_model_warmer(host).warm_up_in_background(model)
+
+    def warm_up_status(self, model):
+        """The ``ModelWarmer.status()`` of ``model`` on each healthy server that has it."""
+        return {host: get_model_warmer(host).status(model) for host in self.hosts if self._has_model(host, model)}
+
+    @property
+    def checked(self):
+        """True once a model list has been requested from any server, i.e. Ollama has been used."""
+        return any(get_ollama_models(host).checked for host in self.hosts)
+
+    @property
+    def pending(self):
+        """True while no server has reported its models and some are still being asked for the first time."""
+        servers = self.servers()
+        return (all(server.cached_models is None for server in servers)
+                and not all(server.checked for server in servers))
+
+    def stats(self):
+        """One dict per server for display. Does not contact the servers."""
+        with self._lock:
+            outstanding, requests, failures = dict(self._outstanding), dict(self._requests), dict(self._failures)
+        stats = []
+        for host in self.hosts:
+            server = get_ollama_models(host)
+            stats.append({"host": host, "healthy": server.healthy, "models": len(server.cached_models or []),
+                          "in_progress": outstanding[host], "requests": requests[host], "failures": failures[host],
+                          "seen_s": server.age_seconds, "last_error": server.error})
+        return stats
+
+
+def format_warm_up_status(model, statuses):
+    """One-line summary of ``OllamaPool.warm_up_status()`` for display."""
+    # A warm-up that has just been started may not have recorded its state yet
+    states = [status["state"] if status else "loading" for status in statuses.values()]
+    if not states:
+        return ""
+    if "loading" in states:
+        return f"Loading {model} into memory..."
+    failed = [status for status in statuses.values() if status["state"] == "failed"]
+    if len(failed) == len(states):
+        return f"Could not preload {model}: {failed[0]['error']}"
+    if len(states) > 1:
+        return f"{model} is loaded on {len(states) - len(failed)} of {len(states)} Ollama servers."
+    load_s = next(iter(statuses.values()))["load_s"]
+    return f"{model} is loaded (took {load_s:.1f}s)." if load_s is not None else f"{model} is loaded."
+
+
+@lru_cache(maxsize=None)
+def get_ollama_models(host=OLLAMA_HOST):
+    """Return the ``OllamaModels`` for ``host`` shared by every session in this process."""
+    return OllamaModels(host)
+
+
+@lru_cache(maxsize=None)
+def get_model_warmer(host=OLLAMA_HOST):
+    """Return the ``ModelWarmer`` for ``host`` shared by every session in this process."""
+    return ModelWarmer(host)
+
+
+@lru_cache(maxsize=None)
+def get_ollama_pool(hosts=OLLAMA_HOSTS):
+    """Return the ``OllamaPool`` for the comma-separated ``hosts`` shared by every session in this process."""
+    return OllamaPool(hosts)
+
+
+def _preload(pool, models):
+    # The warm-ups go to the servers that have reported the model, so wait for the first model lists
+    for server in pool.servers():
+        if not server.checked:
+            server.refresh()
+    for model in models:
+        pool.warm_up_in_background(model)
+
+
+@lru_cache(maxsize=None)
+def preload_models():
+    """Start loading the ``ATTACKGEN_OLLAMA_PRELOAD`` models on every server in the background, once per process."""
+    if PRELOAD_MODELS:
+        threading.Thread(target=_preload, args=(get_ollama_pool(), PRELOAD_MODELS),
+                         name="attackgen-ollama-preload", daemon=True).start()
+
+
+# Ollama's load and generation timings for the last request on each thread (see record_timings)
+_timings = threading.local()
+_TIMING_FIELDS = (("load_s", "load_duration"), ("prompt_eval_s", "prompt_eval_duration"), ("eval_s", "eval_duration"))
+
+
+def record_timings(config, response, host):
+    """Record the timings in the final chunk of a response from ``host`` for ``take_timings()`` and metrics."""
+    timings = {name: response[field] / 1e9 for name, field in _TIMING_FIELDS if response.get(field) is not None}
+    _timings.last = timings
+    if "load_s" in timings:
+        metrics.OLLAMA_LOAD_SECONDS.labels(model=config.model, request="generation").observe(timings["load_s"])
+    get_model_warmer(host).mark_loaded(config.model)
+
+
+def take_timings():
+    """Return and clear the Ollama timings recorded on this thread since the last call."""
+    timings = getattr(_timings, "last", None) or {}
+    _timings.last = None
+    return timings
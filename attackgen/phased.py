@@ -0,0 +1,169 @@
+"""
+Phased scenario generation: an outline, then every kill chain phase in parallel.
+
+A scenario covering a long kill chain takes 30-50 seconds because the model
+produces its output tokens one after another. ``PhasedGeneration`` first
+asks for a short outline (title, background and one line per phase), then
+asks for the section of each phase, and the closing questions, all at the
+same time, and joins them in kill chain order. Once the outline is written,
+the wall-clock time is roughly that of the slowest section rather than the
+sum of them all.
+
+Each part is an ordinary request through ``timed_generation``, so it is
+cached, routed, hedged and coalesced like a whole scenario, and the time
+taken by each section is reported in ``stats()["sections"]``.
+
+The parts share the config's ``max_tokens`` so that the whole scenario is
+no longer than one written in a single request: the outline gets up to
+``OUTLINE_MAX_TOKENS`` and the rest is split evenly between the sections.
+If that would leave a section fewer than ``MIN_SECTION_TOKENS``,
+consecutive phases are written together in one section instead.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from attackgen.generation import timed_generation
+from attackgen.prompts import CLOSING_HEADING, closing_messages, outline_messages, section_messages
+
+
+# Sections generated at the same time for one scenario
+SECTION_WORKERS = int(os.getenv("ATTACKGEN_SECTION_WORKERS", "8"))
+
+OUTLINE_MAX_TOKENS = 512
+MIN_SECTION_TOKENS = 256
+
+
+class PhasedGeneration:
+    """Iterate over a scenario generated as an outline followed by sections written in parallel.
+
+    ``phases`` is a list of (phase name, technique labels), e.g. from
+    ``prompts.kill_chain_phases``. The outline is streamed as it arrives;
+    each section follows, in order, once it is complete. Like ``TimedStream``,
+    ``stats()`` can be read once the scenario has been consumed. The other
+    arguments are passed to ``timed_generation`` for each part.
+    """
+
+    def __init__(self, config, messages, phases, max_workers=SECTION_WORKERS, **options):
+        self.config = config
+        self.messages = messages
+        self.phases = phases
+        self.max_workers = max_workers
+        self.options = options
+        self.first_token_s = None
+        self.total_s = None
+        self.output_chars = 0
+        self.outline_stats = None
+        self.section_stats = []
+
+    def _plan(self):
+        """(outline config, phase sections, section config), keeping the parts' total within ``max_tokens``.
+
+        The outline and sections together never ask for more than the
+        config's ``max_tokens``. There is one section per phase, plus the
+        closing questions, unless that would leave each fewer than
+        ``MIN_SECTION_TOKENS``; then consecutive phases are merged into as
+        many sections as the budget allows (at least one).
+        """
+        total = self.config.max_tokens
+        if not total:
+            return replace(self.config, max_tokens=OUTLINE_MAX_TOKENS), self.phases, self.config
+        # Leave room for at least one phase section and the closing questions
+        outline_tokens = min(OUTLINE_MAX_TOKENS, max(total - 2 * MIN_SECTION_TOKENS, total // 3))
+        remaining = total - outline_tokens
+        sections = min(len(self.phases) + 1, max(2, remaining // MIN_SECTION_TOKENS))
+        phases = merge_phases(self.phases, sections - 1)
+        return (replace(self.config, max_tokens=outline_tokens), phases,
+                replace(self.config, max_tokens=remaining // sections))
+
+    def _generate(self, title, heading, config, messages):
+        timed_stream = timed_generation(config, messages, **self.options)
+        text = "".join(timed_stream).strip()
+        # Models sometimes leave out the requested heading
+        if not text.startswith("#"):
+            text = f"{heading}\n\n{text}"
+        return text, dict(timed_stream.stats(), section=title)
+
+    def __iter__(self):
+        start = time.perf_counter()
+        executor = None
+        try:
+            outline_config, phases, section_config = self._plan()
+            outline_stream = timed_generation(outline_config, outline_messages(self.messages), **self.options)
+            parts = []
+            for chunk in outline_stream:
+                if chunk and self.first_token_s is None:
+                    self.first_token_s = time.perf_counter() - start
+                parts.append(chunk)
+                self.output_chars += len(chunk)
+                yield chunk
+            self.outline_stats = dict(outline_stream.stats(), section="Outline")
+            outline = "".join(parts).strip()
+
+            requests = [(phase_name, f"## {number}. {phase_name}", section_config,
+                         section_messages(self.messages, outline, f"## {number}. {phase_name}", labels))
+                        for number, (phase_name, labels) in enumerate(phases, start=1)]
+            requests.append(("Closing questions", CLOSING_HEADING, section_config,
+                             closing_messages(self.messages, outline)))
+
+            executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(requests))),
+                                          thread_name_prefix="attackgen-section")
+            futures = [executor.submit(self._generate, *request) for request in requests]
+            for future in futures:
+                text, stats = future.result()
+                self.section_stats.append(stats)
+                chunk = "\n\n" + text
+                self.output_chars += len(chunk)
+                yield chunk
+        finally:
+            if executor is not None:
+                # Don't start sections that are no longer needed after a failure
+                executor.shutdown(wait=False, cancel_futures=True)
+            self.total_s = time.perf_counter() - start
+
+    def stats(self):
+        parts = ([self.outline_stats] if self.outline_stats else []) + self.section_stats
+        first = self.outline_stats or {}
+        return {
+            "provider": first.get("provider", self.config.provider),
+            "model": first.get("model", self.config.model),
+            "time_to_first_token_s": self.first_token_s,
+            "total_s": self.total_s,
+            "output_chars": self.output_chars,
+            "cached": bool(parts) and all(part["cached"] for part in parts),
+            "hedged": any(part["hedged"] for part in parts),
+            "failed_over": any(part["failed_over"] for part in parts),
+            "coalesced": bool(parts) and all(part.get("coalesced") for part in parts),
+            "outline_s": first.get("total_s"),
+            "sections": [{"section": part["section"], "total_s": part["total_s"],
+                          "time_to_first_token_s": part["time_to_first_token_s"],
+                          "output_chars": part["output_chars"], "cached": part["cached"]}
+                         for part in parts],
+        }
+
+
+def merge_phases(phases, sections):
+    """Merge consecutive (phase name, technique labels) into at most ``sections`` of similar size."""
+    if len(phases) <= sections:
+        return list(phases)
+    size, extra = divmod(len(phases), sections)
+    merged, start = [], 0
+    for index in range(sections):
+        end = start + size + (index < extra)
+        group = phases[start:end]
+        merged.append((" / ".join(name for name, _ in group), [label for _, labels in group for label in labels]))
+        start = end
+    return merged
+
+
+def section_table(stats):
+    """Rows of a per-section timing table for display, from ``PhasedGeneration.stats()``."""
+    return [{"Section": section["section"],
+             "First Token (s)": None if section["time_to_first_token_s"] is None
+             else round(section["time_to_first_token_s"], 1),
+             "Time (s)": round(section["total_s"] or 0, 1),
+             "Characters": section["output_chars"],
+             "Cached": "✅" if section["cached"] else ""}
+            for section in stats.get("sections") or []]
@@ -0,0 +1,138 @@
+"""
+Prompt construction shared by the Streamlit pages and the batch CLI.
+"""
+
+from functools import lru_cache
+
+
+INDUSTRIES = sorted(['Aerospace / Defense', 'Agriculture / Food Services',
+                     'Automotive', 'Construction', 'Education',
+                     'Energy / Utilities', 'Finance / Banking',
+                     'Government / Public Sector', 'Healthcare',
+                     'Hospitality / Tourism', 'Insurance',
+                     'Legal Services', 'Manufacturing',
+                     'Media / Entertainment', 'Non-profit',
+                     'Real Estate', 'Retail / E-commerce',
+                     'Technology / IT', 'Telecommunication',
+                     'Transportation / Logistics'])
+
+COMPANY_SIZES = ['Small (1-50 employees)', 'Medium (51-200 employees)', 'Large (201-1,000 employees)',
+                 'Enterprise (1,001-10,000 employees)', 'Large Enterprise (10,000+ employees)']
+
+SYSTEM_TEMPLATE = "You are a cybersecurity expert. Your task is to produce a comprehensive incident response testing scenario based on the information provided."
+
+THREAT_GROUP_TEMPLATE = ("""
+**Background information:**
+The company operates in the '{industry}' industry and is of size '{company_size}'.
+
+**Threat actor information:**
+Threat actor group '{selected_group_alias}' is planning to target the company using the following kill chain
+{kill_chain_string}
+
+**Your task:**
+Create an incident response testing scenario based on the information provided. The goal of the scenario is to test the company's incident response capabilities against the identified threat actor group.
+
+Your response should be well structured and formatted using Markdown. Write in British English.
+""")
+
+CUSTOM_TEMPLATE = ("""
+**Background information:**
+The company operates in the '{industry}' industry and is of size '{company_size}'.
+
+**Threat actor information:**
+The threat actor is known to use the following ATT&CK techniques:
+{selected_techniques_string}
+
+**Your task:**
+Create a custom incident response testing scenario based on the information provided. The goal of the scenario is to test the company's incident response capabilities against a threat actor group that uses the identified ATT&CK techniques.
+
+Your response should be well structured and formatted using Markdown. Write in British English.
+""")
+
+
+# Instructions added to a scenario prompt for phased generation (see attackgen.phased)
+OUTLINE_INSTRUCTIONS = """Before the full scenario is written, write only a short outline of it in Markdown: a title as a level 1 heading, a '## Background' section of two or three sentences setting the scene, and a '## Scenario Overview' section with one bullet per phase of the attack saying in a sentence what happens. Do not write anything else."""
+
+SECTION_INSTRUCTIONS = """Using the outline above, write only the part of the scenario covering this phase of the attack:
+{phase_techniques}
+
+Start with the heading '{heading}'. Describe what the attacker does, what evidence the company's defenders would see, and the injects and questions for the incident response team at this point. Keep it consistent with the outline, and do not repeat the background or write about other phases."""
+
+CLOSING_INSTRUCTIONS = """Using the outline above, write only the final part of the scenario: start with the heading '{heading}' and list the questions the incident response team should discuss after the exercise, and the lessons it is designed to draw out. Do not repeat the outline or describe the phases again."""
+
+CLOSING_HEADING = "## Questions for the Incident Response Team"
+
+
+@lru_cache(maxsize=None)
+def chat_prompt(human_template):
+    """Return the ChatPromptTemplate for a human template, built once per process."""
+    from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+
+    system_message_prompt = SystemMessagePromptTemplate.from_template(SYSTEM_TEMPLATE)
+    human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
+    return ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
+
+
+def kill_chain_labels(selected_techniques_df):
+    """One 'Phase: Technique (ID)' label per row of a kill chain table."""
+    return [f"{phase_name}: {technique_name} ({attack_id})"
+            for phase_name, technique_name, attack_id
+            in zip(selected_techniques_df['Phase Name'],
+                   selected_techniques_df['Technique Name'],
+                   selected_techniques_df['ATT&CK ID'])]
+
+
+def format_kill_chain(selected_techniques_df):
+    """Format a kill chain table as one 'Phase: Technique (ID)' line per phase."""
+    return "\n".join(kill_chain_labels(selected_techniques_df))
+
+
+def threat_group_messages(selected_group_alias, kill_chain_string, industry, company_size):
+    """Messages for a scenario based on a threat actor group's kill chain."""
+    return chat_prompt(THREAT_GROUP_TEMPLATE).format_prompt(selected_group_alias=selected_group_alias,
+                                                            kill_chain_string=kill_chain_string,
+                                                            industry=industry,
+                                                            company_size=company_size).to_messages()
+
+
+def custom_messages(selected_techniques_string, industry, company_size):
+    """Messages for a scenario based on a custom selection of techniques."""
+    return chat_prompt(CUSTOM_TEMPLATE).format_prompt(selected_techniques_string=selected_techniques_string,
+                                                      industry=industry,
+                                                      company_size=company_size).to_messages()
+
+
+def kill_chain_phases(selected_techniques_df):
+    """Group a kill chain table by phase, in kill chain order: a list of (phase name, technique labels)."""
+    ordered = selected_techniques_df.sort_values('Phase Name', kind='stable')
+    phases = {}
+    for phase_name, label in zip(ordered['Phase Name'], kill_chain_labels(ordered)):
+        phases.setdefault(phase_name, []).append(label)
+    return list(phases.items())
+
+
+def outline_messages(messages):
+    """Messages asking for a short outline of the scenario that ``messages`` ask for."""
+    from langchain_core.messages import HumanMessage
+
+    return list(messages) + [HumanMessage(content=OUTLINE_INSTRUCTIONS)]
+
+
+def section_messages(messages, outline, heading, labels):
+    """Messages asking for the section of the scenario covering one phase, given its ``outline``."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return outline_messages(messages) + [
+        AIMessage(content=outline),
+        HumanMessage(content=SECTION_INSTRUCTIONS.format(phase_techniques="\n".join(labels), heading=heading)),
+    ]
+
+
+def closing_messages(messages, outline):
+    """Messages asking for the closing questions of the scenario, given its ``outline``."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return outline_messages(messages) + [
+        AIMessage(content=outline),
+        HumanMessage(content=CLOSING_INSTRUCTIONS.format(heading=CLOSING_HEADING)),
+    ]
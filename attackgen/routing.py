@@ -0,0 +1,367 @@
+"""
+Provider failover with circuit breakers.
+
+Every provider call goes through ``tracked_chunks``, which records its
+latency and outcome on a ``CircuitBreaker``. After repeated failures (an
+outage, a run of 429s) the breaker opens and the provider is skipped until a
+cool-down has passed; then a single trial request is let through, closing
+the breaker again if it succeeds.
+
+Breakers are kept per endpoint, model and API key, like pooled clients, and
+only server errors, rate limits, connection errors and timeouts count as
+failures. A client error such as a rejected API key (401) or a malformed
+request (400) is the caller's own problem: it is raised straight away and
+never pauses the provider for other users.
+
+``RoutedStream`` sends a request to the healthiest of the configured
+providers, in the router's priority order, and fails over to the next one if
+a provider fails before producing any text. Breaker state is shown on the
+Provider Health page.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from attackgen import metrics
+from attackgen.clients import client_key, is_cancelled
+from attackgen.generation import PROVIDERS, generate_chunks
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+FAILURE_THRESHOLD = int(os.getenv("ATTACKGEN_BREAKER_FAILURES", "3"))
+ERROR_RATE_THRESHOLD = 0.5
+RESET_SECONDS = float(os.getenv("ATTACKGEN_BREAKER_RESET_SECONDS", "60"))
+WINDOW = 50
+MIN_REQUESTS_FOR_ERROR_RATE = 10
+
+# Only results from this many seconds ago count towards error rates and latencies, so that a demoted
+# provider that receives no traffic recovers
+RECENT_SECONDS = 300
+
+# Providers are demoted behind healthy ones when their median latency is this many times the fastest's
+SLOW_FACTOR = 2.0
+
+DEFAULT_PRIORITY = [provider.strip() for provider in os.getenv("ATTACKGEN_PROVIDER_PRIORITY", "").split(",")
+                    if provider.strip() in PROVIDERS] or list(PROVIDERS)
+
+
+# Connection and timeout errors of the HTTP libraries used by the provider backends, by module
+_CONNECTION_ERRORS = {"requests": ("ConnectionError", "Timeout"), "httpx": ("TransportError",),
+                      "openai": ("APIConnectionError",)}
+
+
+def status_code(error):
+    """The HTTP status of a provider error, or None if it has none."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_provider_failure(error):
+    """True if ``error`` says the provider is unhealthy: a 5xx or 429 response, a connection error or a timeout.
+
+    Other errors, notably 4xx responses for a bad API key or request, say
+    nothing about the provider's health for other users.
+    """
+    status = status_code(error)
+    if status is not None:
+        return status >= 500 or status == 429
+    # Only the libraries already loaded by a backend can have raised the error
+    types = [ConnectionError, TimeoutError]
+    for module, names in _CONNECTION_ERRORS.items():
+        if module in sys.modules:
+            types += [getattr(sys.modules[module], name) for name in names]
+    return isinstance(error, tuple(types))
+
+
+def is_client_error(error):
+    """True if ``error`` is a 4xx response other than a rate limit, which no other provider would fix."""
+    status = status_code(error)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class CircuitBreaker:
+    """Rolling latency and error tracking for one provider endpoint, model and API key, with a circuit breaker.
+
+    The breaker opens after ``failure_threshold`` consecutive failures, or when
+    at least half of the recent requests failed. Once ``reset_seconds`` have
+    passed it is half-open and lets one trial request through. ``key_id`` is
+    the start of the API key's hash, to tell breakers for different keys apart.
+    """
+
+    def __init__(self, provider, model, endpoint=None, key_id=None, failure_threshold=FAILURE_THRESHOLD,
+                 reset_seconds=RESET_SECONDS, window=WINDOW):
+        self.provider = provider
+        self.model = model
+        self.endpoint = endpoint
+        self.key_id = key_id
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._results = deque(maxlen=window)  # (time, succeeded, latency seconds, streamed)
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return OPEN
+
+    def allow_request(self):
+        """Return True if a request may be sent now, reserving the trial slot when half-open."""
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency, stream=True):
+        with self._lock:
+            self._results.append((time.monotonic(), True, latency, stream))
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, latency, error=None, stream=True):
+        with self._lock:
+            self._results.append((time.monotonic(), False, latency, stream))
+            self._consecutive_failures += 1
+            self._last_error = str(error) if error is not None else None
+            if self._trial_in_flight or self._consecutive_failures >= self.failure_threshold or \
+                    (len(self._recent()) >= MIN_REQUESTS_FOR_ERROR_RATE and self._error_rate() >= ERROR_RATE_THRESHOLD):
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a trial slot for a request that was abandoned before it finished."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+            self._last_error = None
+
+    def _recent(self):
+        cutoff = time.monotonic() - RECENT_SECONDS
+        return [result[1:] for result in self._results if result[0] >= cutoff]
+
+    def _error_rate(self):
+        recent = self._recent()
+        return sum(not succeeded for succeeded, _, _ in recent) / len(recent) if recent else 0.0
+
+    def _latencies(self, stream):
+        # Time to first token when streaming and time to the whole response otherwise are tracked apart
+        return sorted(latency for succeeded, latency, streamed in self._recent() if succeeded and streamed == stream)
+
+    def median_latency(self, stream=True):
+        with self._lock:
+            latencies = self._latencies(stream)
+        return latencies[len(latencies) // 2] if latencies else None
+
+    def stats(self):
+        with self._lock:
+            latencies = self._latencies(True)
+            state = self._state()
+            return {
+                "provider": self.provider,
+                "model": self.model,
+                "endpoint": self.endpoint,
+                "key_id": self.key_id,
+                "state": state,
+                "requests": len(self._recent()),
+                "error_rate": self._error_rate(),
+                "consecutive_failures": self._consecutive_failures,
+                "p50_s": latencies[len(latencies) // 2] if latencies else None,
+                "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+                "retry_in_s": max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+                if state == OPEN else None,
+                "last_error": self._last_error,
+            }
+
+
+class Router:
+    """Circuit breakers for every provider and model used in this process, and the provider priority order."""
+
+    def __init__(self, priority=None):
+        self.priority = list(priority or DEFAULT_PRIORITY)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, config):
+        # Keyed like pooled clients, so that one user's bad API key never pauses the provider for another
+        key = client_key(config)
+        with self._lock:
+            if key not in self._breakers:
+                key_hash = key[-1]
+                self._breakers[key] = CircuitBreaker(config.provider, config.model, endpoint=config.endpoint,
+                                                     key_id=key_hash[:8] if key_hash else None)
+            return self._breakers[key]
+
+    def breakers(self):
+        with self._lock:
+            return list(self._breakers.values())
+
+    def set_priority(self, priority):
+        """Set the provider priority order; providers left out keep their relative order at the end."""
+        self.priority = list(priority) + [provider for provider in self.priority if provider not in priority]
+
+    def by_priority(self, configs):
+        """Sort ``configs`` by the provider priority order."""
+        return sorted(configs, key=lambda config: self.priority.index(config.provider)
+                      if config.provider in self.priority else len(self.priority))
+
+    def order(self, configs, stream=True):
+        """Return ``configs`` with open circuits removed, healthy providers first and otherwise in the given order.
+
+        Half-open providers, providers with a high recent error rate and
+        providers much slower than the fastest are tried after healthy ones.
+        """
+        candidates = [(config, self.breaker(config)) for config in configs]
+        candidates = [(config, breaker) for config, breaker in candidates if breaker.state != OPEN]
+        latencies = [breaker.median_latency(stream) for _, breaker in candidates]
+        fastest = min((latency for latency in latencies if latency is not None), default=None)
+
+        def degraded(candidate, latency):
+            stats = candidate[1].stats()
+            return (stats["state"] == HALF_OPEN or stats["error_rate"] >= ERROR_RATE_THRESHOLD / 2
+                    or (fastest is not None and latency is not None and latency > SLOW_FACTOR * fastest))
+
+        tiers = [degraded(candidate, latency) for candidate, latency in zip(candidates, latencies)]
+        return [candidate[0] for _, candidate in sorted(zip(tiers, candidates), key=lambda item: item[0])]
+
+    def stats(self):
+        return [breaker.stats() for breaker in self.breakers()]
+
+
+router = Router()
+
+
+def tracked_chunks(config, messages, stream=True, router=router):
+    """Yield the scenario text from ``config``'s provider, recording the outcome on its circuit breaker.
+
+    Latency is the time to the first chunk. Only errors for which
+    ``is_provider_failure`` is True count as failures. A stream that is closed
+    early, or a request that fails because it was cancelled (the slower of two
+    hedged requests), is not counted either way. Completed responses and
+    errors are also recorded in the Prometheus metrics.
+    """
+    breaker = router.breaker(config)
+    start = time.perf_counter()
+    first_chunk_s = None
+    parts = []
+    try:
+        for chunk in generate_chunks(config, messages, stream=stream):
+            if first_chunk_s is None and chunk:
+                first_chunk_s = time.perf_counter() - start
+            parts.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        breaker.release()
+        raise
+    except Exception as e:
+        if is_cancelled():
+            breaker.release()
+            raise
+        if is_provider_failure(e):
+            breaker.record_failure(time.perf_counter() - start, e, stream=stream)
+        else:
+            breaker.release()
+        metrics.count_error(config, e)
+        raise
+    seconds = time.perf_counter() - start
+    breaker.record_success(first_chunk_s if first_chunk_s is not None else seconds, stream=stream)
+    metrics.observe_response(config, stream, seconds, first_chunk_s, "".join(parts))
+
+
+class ProvidersUnavailable(RuntimeError):
+    """Raised when no configured provider could generate a response."""
+
+
+class RoutedStream:
+    """Iterate over the scenario text from the healthiest of ``configs``, failing over on errors.
+
+    A provider that fails before producing any text is skipped and the next
+    one is tried; a failure after text has been streamed is raised, since the
+    partial scenario has already been shown, and so is a client error (such
+    as a rejected API key), which is the caller's to fix. ``winner`` is the config of the
+    provider that answered and ``failed_over`` is True if it was not the
+    first choice.
+    """
+
+    hedged = False
+
+    def __init__(self, configs, messages, stream=True, router=router):
+        self.configs = configs
+        self.messages = messages
+        self.stream = stream
+        self.router = router
+        self.winner = None
+        self.failed_over = False
+
+    def __iter__(self):
+        errors = []
+        last_error = None
+        ordered = self.router.order(self.configs, stream=self.stream)
+        if not ordered:
+            raise ProvidersUnavailable(_unavailable_message(self.router, self.configs))
+
+        for config in ordered:
+            if not self.router.breaker(config).allow_request():
+                continue
+            produced = False
+            try:
+                for chunk in tracked_chunks(config, self.messages, stream=self.stream, router=self.router):
+                    if chunk and not produced:
+                        produced = True
+                        self.winner = config
+                        self.failed_over = config != self.configs[0]
+                    yield chunk
+                return
+            except Exception as e:
+                if produced or is_cancelled() or is_client_error(e):
+                    raise
+                errors.append(f"{config.provider}: {e}")
+                last_error = e
+
+        if last_error is not None and len(errors) == 1 and len(self.configs) == 1:
+            raise last_error
+        if last_error is None:
+            raise ProvidersUnavailable(_unavailable_message(self.router, self.configs))
+        raise ProvidersUnavailable("All configured providers failed. " + "; ".join(errors)) from last_error
+
+
+def _unavailable_message(router, configs):
+    waits = [f"{stats['provider']} in {stats['retry_in_s']:.0f}s"
+             for stats in (router.breaker(config).stats() for config in configs) if stats["retry_in_s"] is not None]
+    message = "Every configured provider is failing and has been paused (circuit breaker open)."
+    if waits:
+        message += " Retrying " + ", ".join(waits) + "."
+    return message
+
+
+def format_breaker_state(stats):
+    """Short label for a breaker state, for display."""
+    return {CLOSED: "🟢 Closed", HALF_OPEN: "🟡 Half-open", OPEN: "🔴 Open"}[stats["state"]]
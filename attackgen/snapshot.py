@@ -0,0 +1,326 @@
+"""
+Compiled binary snapshot of the MITRE ATT&CK Enterprise dataset.
+
+Parsing ``enterprise-attack.json`` into a stix2 MemoryStore takes several
+seconds, so the parts of the bundle that AttackGen uses (techniques, groups,
+campaigns, tactics, relationships and ATT&CK IDs) are compiled once into a
+small versioned file that loads in milliseconds. Technique descriptions and
+detection notes are reduced to their first paragraph, without citations, for
+use in prompts. The snapshot records the
+SHA-256 of the JSON it was built from and is rebuilt automatically when the
+JSON changes.
+
+Build it ahead of time with:
+
+    python -m attackgen.snapshot
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import struct
+import sys
+import tempfile
+import time
+
+
+DEFAULT_SOURCE = os.path.join("data", "enterprise-attack.json")
+DEFAULT_SNAPSHOT = os.path.join("data", "enterprise-attack.snapshot")
+
+# Bump FORMAT_VERSION whenever the payload layout changes so that existing
+# snapshots are treated as stale and rebuilt.
+FORMAT_VERSION = 2
+MAGIC = b"ATKGSNAP"
+
+# magic, format version, source size, source mtime (ns), source SHA-256
+_HEADER = struct.Struct(">8sHQQ32s")
+
+_ATTACK_SOURCES = ("mitre-attack", "mitre-mobile-attack", "mitre-ics-attack")
+
+_CITATION = re.compile(r"\(Citation:[^)]*\)")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_HTML_TAG = re.compile(r"</?\w+[^>]*>")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, corrupt or out of date."""
+
+
+# ------------------ Compilation ------------------ #
+
+def _is_active(obj):
+    return not obj.get("revoked", False) and not obj.get("x_mitre_deprecated", False)
+
+
+def _first_paragraph(text):
+    """The first paragraph of an ATT&CK description as plain text, without citations or links."""
+    paragraph = next((line for line in (text or "").split("\n") if line.strip()), "")
+    paragraph = _MARKDOWN_LINK.sub(r"\1", _CITATION.sub("", paragraph))
+    paragraph = _HTML_TAG.sub("", paragraph)
+    return _WHITESPACE.sub(" ", paragraph).replace(" .", ".").replace(" ,", ",").strip()
+
+
+def _attack_id(obj):
+    for reference in obj.get("external_references", []):
+        if reference.get("source_name") in _ATTACK_SOURCES and "external_id" in reference:
+            return reference["external_id"]
+    return None
+
+
+def compile_bundle(bundle):
+    """Reduce a parsed STIX bundle to the plain-Python snapshot payload."""
+    objects = bundle.get("objects", [])
+
+    tactics_by_id = {}
+    tactic_order = []
+    techniques = []
+    groups = []
+    campaigns = []
+    relationships = []
+    attack_version = None
+
+    for obj in objects:
+        obj_type = obj.get("type")
+
+        if obj_type == "attack-pattern":
+            techniques.append({
+                "id": obj["id"],
+                "name": obj.get("name", ""),
+                "attack_id": _attack_id(obj),
+                "external_ids": [reference["external_id"] for reference in obj.get("external_references", [])
+                                 if "external_id" in reference],
+                "phases": [phase["phase_name"] for phase in obj.get("kill_chain_phases", [])],
+                "description": _first_paragraph(obj.get("description")),
+                "detection": _first_paragraph(obj.get("x_mitre_detection")),
+                "is_subtechnique": obj.get("x_mitre_is_subtechnique", False),
+                "active": _is_active(obj),
+            })
+
+        elif obj_type == "intrusion-set":
+            groups.append({
+                "id": obj["id"],
+                "name": obj.get("name", ""),
+                "aliases": list(obj.get("aliases", [])),
+                "attack_id": _attack_id(obj),
+                "active": _is_active(obj),
+            })
+
+        elif obj_type == "campaign":
+            campaigns.append({
+                "id": obj["id"],
+                "name": obj.get("name", ""),
+                "attack_id": _attack_id(obj),
+                "active": _is_active(obj),
+            })
+
+        elif obj_type == "x-mitre-tactic":
+            tactics_by_id[obj["id"]] = {
+                "id": obj["id"],
+                "name": obj.get("name", ""),
+                "shortname": obj.get("x_mitre_shortname", ""),
+                "attack_id": _attack_id(obj),
+            }
+
+        elif obj_type == "x-mitre-matrix" and _is_active(obj):
+            tactic_order.extend(obj.get("tactic_refs", []))
+
+        elif obj_type == "x-mitre-collection":
+            attack_version = obj.get("x_mitre_version", attack_version)
+
+        elif obj_type == "relationship" and _is_active(obj):
+            relationships.append((obj["source_ref"], obj["relationship_type"], obj["target_ref"]))
+
+    # Order tactics as they appear in the matrix, then any stragglers
+    tactics = [tactics_by_id.pop(tactic_id) for tactic_id in tactic_order if tactic_id in tactics_by_id]
+    tactics.extend(tactics_by_id.values())
+
+    # Only keep relationships between objects the snapshot knows about
+    known_ids = {obj["id"] for obj in techniques}
+    known_ids.update(obj["id"] for obj in groups)
+    known_ids.update(obj["id"] for obj in campaigns)
+    relationships = [rel for rel in relationships if rel[0] in known_ids and rel[2] in known_ids]
+
+    return {
+        "attack_version": attack_version,
+        "tactics": tactics,
+        "techniques": techniques,
+        "groups": groups,
+        "campaigns": campaigns,
+        "relationships": relationships,
+    }
+
+
+def _source_fingerprint(source_path):
+    stat = os.stat(source_path)
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return stat.st_size, stat.st_mtime_ns, digest.digest()
+
+
+def build_snapshot(source_path=DEFAULT_SOURCE, snapshot_path=DEFAULT_SNAPSHOT):
+    """Compile the STIX JSON at ``source_path`` and write it to ``snapshot_path``.
+
+    Returns the compiled ``AttackSnapshot``. The file is written atomically so
+    concurrent server processes never read a half-written snapshot. If the
+    snapshot cannot be written (e.g. a read-only filesystem) the compiled data
+    is still returned.
+    """
+    size, mtime_ns, sha256 = _source_fingerprint(source_path)
+    with open(source_path, "rb") as f:
+        payload = compile_bundle(json.load(f))
+    payload["source_sha256"] = sha256.hex()
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, size, mtime_ns, sha256)
+    body = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(body)
+            os.replace(tmp_path, snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Unable to write ATT&CK snapshot to {snapshot_path}: {e}", file=sys.stderr)
+
+    return AttackSnapshot(payload)
+
+
+# ------------------ Loading ------------------ #
+
+def read_snapshot(snapshot_path=DEFAULT_SNAPSHOT, source_path=None):
+    """Read a snapshot from disk, validating it against ``source_path`` if given.
+
+    Raises ``SnapshotError`` if the file is missing, corrupt, was written by a
+    different format version, or no longer matches the source JSON.
+    """
+    try:
+        with open(snapshot_path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise SnapshotError(f"{snapshot_path} is truncated")
+            magic, version, size, mtime_ns, sha256 = _HEADER.unpack(header)
+            if magic != MAGIC:
+                raise SnapshotError(f"{snapshot_path} is not an AttackGen snapshot")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"{snapshot_path} has format version {version}, expected {FORMAT_VERSION}")
+
+            if source_path is not None:
+                stat = os.stat(source_path)
+                # The size and mtime avoid hashing the JSON on every start; the
+                # hash only needs checking when the file appears to have changed.
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                    if _source_fingerprint(source_path)[2] != sha256:
+                        raise SnapshotError(f"{snapshot_path} is out of date with {source_path}")
+
+            try:
+                payload = pickle.load(f)
+                return AttackSnapshot(payload)
+            except Exception as e:
+                # A damaged or stale pickle can raise almost anything (ValueError, AttributeError,
+                # ModuleNotFoundError, ...); whatever it is, the snapshot needs rebuilding
+                raise SnapshotError(f"{snapshot_path} is corrupt: {e!r}") from e
+    except FileNotFoundError as e:
+        raise SnapshotError(f"{snapshot_path} does not exist") from e
+    except struct.error as e:
+        raise SnapshotError(f"{snapshot_path} is corrupt: {e}") from e
+
+
+def load_snapshot(source_path=DEFAULT_SOURCE, snapshot_path=DEFAULT_SNAPSHOT):
+    """Load the ATT&CK snapshot, rebuilding it first if it is missing or stale."""
+    try:
+        return read_snapshot(snapshot_path, source_path)
+    except SnapshotError:
+        return build_snapshot(source_path, snapshot_path)
+
+
+class AttackSnapshot:
+    """Read-only view over a compiled snapshot.
+
+    The query methods mirror the subset of ``mitreattack.stix20.MitreAttackData``
+    used by the pages, but return the plain dictionaries stored in the snapshot.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.attack_version = payload["attack_version"]
+        self.source_sha256 = payload["source_sha256"]
+        self.tactics = payload["tactics"]
+        self.techniques = payload["techniques"]
+        self.groups = payload["groups"]
+        self.campaigns = payload["campaigns"]
+        self.relationships = payload["relationships"]
+
+        self._by_id = {obj["id"]: obj for obj in self.techniques}
+        self._by_id.update((obj["id"], obj) for obj in self.groups)
+        self._by_id.update((obj["id"], obj) for obj in self.campaigns)
+        self._by_id.update((obj["id"], obj) for obj in self.tactics)
+
+    def get_object_by_stix_id(self, stix_id):
+        return self._by_id.get(stix_id)
+
+    def get_attack_id(self, stix_id):
+        obj = self._by_id.get(stix_id)
+        return obj["attack_id"] if obj else None
+
+    def get_techniques(self, remove_revoked_deprecated=False):
+        if remove_revoked_deprecated:
+            return [technique for technique in self.techniques if technique["active"]]
+        return list(self.techniques)
+
+    def get_groups_by_alias(self, alias):
+        return [group for group in self.groups if group["active"] and alias in group["aliases"]]
+
+    def get_techniques_used_by_group(self, group_stix_id):
+        """Techniques used by a group directly or through its attributed campaigns."""
+        campaign_ids = {source for source, rel_type, target in self.relationships
+                        if rel_type == "attributed-to" and target == group_stix_id}
+        users = campaign_ids | {group_stix_id}
+
+        techniques = []
+        seen = set()
+        for source, rel_type, target in self.relationships:
+            if rel_type != "uses" or source not in users or target in seen:
+                continue
+            technique = self._by_id.get(target)
+            if technique is not None and "phases" in technique and technique["active"]:
+                seen.add(target)
+                techniques.append({"object": technique})
+        return techniques
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile enterprise-attack.json into an AttackGen snapshot.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Path to the ATT&CK STIX bundle.")
+    parser.add_argument("--output", default=DEFAULT_SNAPSHOT, help="Path of the snapshot to write.")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the snapshot is up to date.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if not args.force:
+        try:
+            snapshot = read_snapshot(args.output, args.source)
+            print(f"{args.output} is up to date (ATT&CK v{snapshot.attack_version}).")
+            return 0
+        except SnapshotError:
+            pass
+
+    snapshot = build_snapshot(args.source, args.output)
+    print(f"Built {args.output} from {args.source} in {time.perf_counter() - start:.2f}s: "
+          f"ATT&CK v{snapshot.attack_version}, {len(snapshot.techniques)} techniques, "
+          f"{len(snapshot.groups)} groups, {len(snapshot.relationships)} relationships.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Background submission of LangSmith traces and feedback, with an offline spool.
+
+Sending feedback from the 👍/👎 handlers, or traces from the generation
+wrappers, used to make the page wait on api.smith.langchain.com, and hang
+when it was unreachable. ``LangSmithQueue`` puts runs and feedback on an
+in-process queue instead. A background thread sends them in batches, runs
+through LangSmith's batch ingest endpoint, and anything that cannot be sent
+is appended to a spool file and retried with backoff, including after a
+restart. Events LangSmith rejects outright (e.g. an invalid API key) are
+dropped rather than retried forever. Feedback on a run LangSmith has not
+ingested yet is retried a few times before it is dropped.
+
+Each API key has its own spool file, ``.cache/langsmith-spool-<key hash>.jsonl``
+by default (the path in ``ATTACKGEN_LANGSMITH_SPOOL`` is used the same way),
+and processes sharing one take a lock on it where the platform supports it.
+"""
+
+import atexit
+import functools
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from attackgen import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+DEFAULT_ENDPOINT = os.getenv("LANGCHAIN_ENDPOINT", "https://api.smith.langchain.com")
+DEFAULT_PROJECT = os.getenv("LANGCHAIN_PROJECT", "AttackGen")
+DEFAULT_SPOOL_PATH = os.getenv("ATTACKGEN_LANGSMITH_SPOOL", os.path.join(".cache", "langsmith-spool.jsonl"))
+
+BATCH_SIZE = 50
+FLUSH_SECONDS = 2.0
+MAX_QUEUED = 10_000
+MAX_SPOOLED = 10_000
+
+# Retry spooled events after this long, doubling after each failed retry up to MAX_RETRY_SECONDS
+RETRY_SECONDS = 30.0
+MAX_RETRY_SECONDS = 600.0
+
+# LangSmith requests never hold up the worker for long; unsent events are spooled instead
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Responses that mean the event will never be accepted, so it is dropped rather than spooled
+_PERMANENT_FAILURES = {400, 401, 403, 413, 422}
+
+# Feedback is sent this many times while LangSmith answers 404 because it has not ingested the run yet
+FEEDBACK_ATTEMPTS = 5
+
+
+def spool_path_for(api_key, path=DEFAULT_SPOOL_PATH):
+    """The spool file for ``api_key``: ``path`` with a hash of the key added, so keys never share events."""
+    root, extension = os.path.splitext(path)
+    return f"{root}-{hashlib.sha256(api_key.encode()).hexdigest()[:12]}{extension}"
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on ``path`` against other processes, where the platform supports it."""
+    if fcntl is None:
+        yield
+        return
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+
+class TracedRun:
+    """A LangSmith run recorded locally; ``id`` is known before anything is sent."""
+
+    def __init__(self, name, run_type, inputs, tags=None, project=DEFAULT_PROJECT):
+        self.id = uuid.uuid4()
+        self.name = name
+        self.run_type = run_type
+        self.inputs = inputs
+        self.tags = list(tags or [])
+        self.project = project
+        self.start_time = _utc_now()
+        self.end_time = None
+        self.outputs = None
+        self.error = None
+        self.metadata = {}
+
+    def to_dict(self):
+        return {
+            "id": str(self.id),
+            "trace_id": str(self.id),
+            "dotted_order": f"{self.start_time:%Y%m%dT%H%M%S%f}Z{self.id}",
+            "name": self.name,
+            "run_type": self.run_type,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "error": self.error,
+            "start_time": self.start_time.isoformat(),
+            "end_time": (self.end_time or _utc_now()).isoformat(),
+            "tags": self.tags,
+            "extra": {"metadata": self.metadata},
+            "session_name": self.project,
+        }
+
+
+class LangSmithQueue:
+    """Queue of LangSmith runs and feedback, sent in batches from a background thread."""
+
+    def __init__(self, api_key, endpoint=DEFAULT_ENDPOINT, project=DEFAULT_PROJECT, spool_path=None,
+                 batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.api_key = api_key
+        self.endpoint = endpoint.rstrip("/")
+        self.project = project
+        self.spool_path = spool_path or spool_path_for(api_key)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=MAX_QUEUED)
+        self._spool_lock = threading.Lock()
+        self._spooled = self._count_spooled()
+        self._retry_at = time.monotonic()
+        self._retry_seconds = RETRY_SECONDS
+        self._session = None
+        self._thread = threading.Thread(target=self._run, name="attackgen-langsmith", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------ Submitting ------------------ #
+
+    def submit(self, kind, payload):
+        """Queue an event of ``kind`` ("run" or "feedback"); never blocks on the network."""
+        event = {"kind": kind, "payload": payload}
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._spool([event])
+
+    def create_feedback(self, run_id, key, score=None, comment=""):
+        """Queue feedback on a run and return its ID."""
+        feedback_id = str(uuid.uuid4())
+        self.submit("feedback", {"id": feedback_id, "run_id": str(run_id), "key": key, "score": score,
+                                 "comment": comment, "feedback_source": {"type": "api"}})
+        return feedback_id
+
+    def traced_generation(self, name, tags=None):
+        """Decorator recording a scenario generation ``func(job, config, messages, run_tree=None)`` as a run.
+
+        ``run_tree`` is passed the ``TracedRun``, so the run ID is available
+        (e.g. for feedback) before the run has been sent.
+        """
+        from attackgen.generation import to_openai_messages
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(job, config, messages, *args, **kwargs):
+                run = TracedRun(name, "llm", {"messages": to_openai_messages(messages)}, tags, self.project)
+                run.metadata.update({"provider": config.provider, "model": config.model})
+                try:
+                    result = func(job, config, messages, *args, run_tree=run, **kwargs)
+                    run.outputs = {"output": result}
+                    run.metadata.update(getattr(job, "stats", None) or {})
+                    return result
+                except Exception as e:
+                    run.error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    run.end_time = _utc_now()
+                    self.submit("run", run.to_dict())
+            return wrapper
+        return decorator
+
+    # ------------------ Sending ------------------ #
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                try:
+                    self._send(batch)
+                except Exception as e:
+                    print(f"Could not send LangSmith events: {e}", file=sys.stderr)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            if self._spooled and time.monotonic() >= self._retry_at:
+                self._retry_spool()
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _post(self, path, body):
+        """POST ``body``; returns "sent", "spool", "drop" or "missing" (404)."""
+        if self._session is None:
+            from attackgen.clients import requests_session
+
+            self._session = requests_session()
+        try:
+            response = self._session.post(f"{self.endpoint}{path}", json=body, timeout=REQUEST_TIMEOUT,
+                                          headers={"x-api-key": self.api_key})
+        except Exception as e:
+            print(f"LangSmith unreachable, spooling events: {e}", file=sys.stderr)
+            return "spool"
+        if response.status_code < 300 or response.status_code == 409:  # 409: already received on an earlier try
+            return "sent"
+        if response.status_code == 404:
+            return "missing"
+        if response.status_code in _PERMANENT_FAILURES:
+            print(f"LangSmith rejected {path} ({response.status_code}), dropping: {response.text[:200]}",
+                  file=sys.stderr)
+            return "drop"
+        return "spool"
+
+    def _send(self, events):
+        """Send ``events``, spooling the ones to try again. Returns False if LangSmith was unavailable."""
+        unsent = []
+        available = True
+        runs = [event for event in events if event["kind"] == "run"]
+        if runs:
+            outcome = self._post("/runs/batch", {"post": [event["payload"] for event in runs]})
+            if outcome == "missing":
+                outcome = "drop"
+                print("LangSmith has no batch ingest endpoint at this address, dropping runs", file=sys.stderr)
+            self._count("run", outcome, len(runs))
+            if outcome == "spool":
+                unsent.extend(runs)
+                available = False
+
+        feedback = [event for event in events if event["kind"] == "feedback"]
+        for position, event in enumerate(feedback):
+            outcome = self._post("/feedback", event["payload"])
+            if outcome == "spool":
+                # LangSmith is unavailable, so don't wait on it for the rest
+                self._count("feedback", outcome, len(feedback) - position)
+                unsent.extend(feedback[position:])
+                available = False
+                break
+            if outcome == "missing":
+                # LangSmith ingests runs asynchronously, so the run may not exist yet; try again later
+                event["attempts"] = event.get("attempts", 1) + 1
+                if event["attempts"] <= FEEDBACK_ATTEMPTS:
+                    outcome = "spool"
+                    unsent.append(event)
+                else:
+                    outcome = "drop"
+                    print(f"LangSmith has no run {event['payload']['run_id']}, dropping its feedback", file=sys.stderr)
+            self._count("feedback", outcome, 1)
+
+        if unsent:
+            self._spool(unsent)
+        return available
+
+    def _count(self, kind, outcome, n):
+        metrics.LANGSMITH_EVENTS.labels(kind=kind, result={"spool": "spooled"}.get(outcome, outcome)).inc(n)
+
+    # ------------------ Spooling ------------------ #
+
+    def _count_spooled(self):
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
+
+    def _spool(self, events):
+        with self._spool_lock:
+            keep = events[:max(0, MAX_SPOOLED - self._spooled)]
+            if len(keep) < len(events):
+                print(f"LangSmith spool is full, dropping {len(events) - len(keep)} events", file=sys.stderr)
+            if not keep:
+                return
+            with _file_lock(self.spool_path), open(self.spool_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(event) + "\n" for event in keep)
+            self._spooled += len(keep)
+
+    def _retry_spool(self):
+        with self._spool_lock:
+            try:
+                with _file_lock(self.spool_path):
+                    with open(self.spool_path, encoding="utf-8") as f:
+                        events = [json.loads(line) for line in f if line.strip()]
+                    os.remove(self.spool_path)
+            except (OSError, ValueError) as e:
+                print(f"Could not read the LangSmith spool: {e}", file=sys.stderr)
+                events = []
+            self._spooled = 0
+
+        sent = all([self._send(events[start:start + self.batch_size])
+                    for start in range(0, len(events), self.batch_size)])
+        self._retry_seconds = RETRY_SECONDS if sent else min(self._retry_seconds * 2, MAX_RETRY_SECONDS)
+        self._retry_at = time.monotonic() + self._retry_seconds
+
+    # ------------------ Shutdown ------------------ #
+
+    def flush(self, timeout=10.0):
+        """Wait until every queued event has been sent or spooled. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self):
+        """Spool anything still queued so it is sent after a restart."""
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if events:
+            self._spool(events)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "spooled": self._spooled}
+
+
+@lru_cache(maxsize=None)
+def get_langsmith_queue(api_key, endpoint=DEFAULT_ENDPOINT, project=DEFAULT_PROJECT):
+    """Return the LangSmith queue for ``api_key`` shared by every session in this process."""
+    return LangSmithQueue(api_key, endpoint, project)
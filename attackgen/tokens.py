@@ -0,0 +1,71 @@
+"""
+Token counting and per-model context windows.
+
+Counts use tiktoken's ``cl100k_base`` encoding when it is available. Other
+providers' tokenizers differ, and tiktoken may be unable to download its
+encoding offline, so in those cases counts fall back to an estimate of four
+characters per token. Budgets built on these counts keep a safety margin.
+"""
+
+import math
+import os
+from functools import lru_cache
+
+
+# Default maximum length of a generated scenario, in tokens
+DEFAULT_MAX_TOKENS = int(os.getenv("ATTACKGEN_MAX_TOKENS", "2048"))
+
+# Context window of models by name prefix, longest prefix first; unknown models get DEFAULT_CONTEXT_WINDOW
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "mistral-large": 32000,
+    "mistral-medium": 32000,
+    "mistral-small": 32000,
+    "open-mixtral": 32000,
+    "open-mistral": 32000,
+    "llama3": 8192,
+    "llama2": 4096,
+    "mistral": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens kept free for message framing and tokenizer differences between providers
+SAFETY_MARGIN = 256
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """Number of tokens in ``text`` (estimated if tiktoken is unavailable)."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages):
+    """Number of tokens in a list of chat messages, including a few per message for framing."""
+    return sum(count_tokens(message.content) + 4 for message in messages)
+
+
+def context_window(model):
+    """Context window of ``model`` in tokens."""
+    model = (model or "").lower()
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
@@ -1,59 +1,47 @@
 import os
+import random
+import time
 import pandas as pd
 import streamlit as st
 
-from langchain.callbacks.manager import collect_runs
-from langchain_community.llms import Ollama
-from langchain_core.messages import HumanMessage
-from langchain_mistralai.chat_models import ChatMistralAI
-from langchain_openai import ChatOpenAI
-from langchain.prompts.chat import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langsmith import Client, RunTree, traceable
-from mitreattack.stix20 import MitreAttackData
-from openai import AzureOpenAI
+from attackgen.cache import format_cache_stats, get_response_cache
+from attackgen.catalog import TABLE_COLUMNS
+from attackgen.context import DEFAULT_CONTEXT_TOKENS, build_messages_within_budget
+from attackgen.data import format_memory_usage, get_attack_store, load_groups
+from attackgen.generation import (OLLAMA, OPENAI, PROVIDER_TAGS, ProviderConfig, alternative_configs, format_generation_stats,
+                                  timed_generation)
+from attackgen.hedging import DEFAULT_PERCENTILE, format_hedging_stats, latency_tracker
+from attackgen.jobs import get_job_queue
+from attackgen.killchain import KillChainSampler
+from attackgen.metrics import (ATTACK_QUERY_SECONDS, FEEDBACK, PROMPT_BUILD_SECONDS, observe_rerun, observe_seconds,
+                               start_metrics_server)
+from attackgen.ollama import get_ollama_pool, preload_models
+from attackgen.phased import PhasedGeneration, section_table
+from attackgen.prompts import kill_chain_labels, kill_chain_phases, threat_group_messages
+from attackgen.routing import router
+from attackgen.telemetry import get_langsmith_queue
+from attackgen.tokens import DEFAULT_MAX_TOKENS, count_message_tokens
 
 
 # ------------------ Streamlit UI Configuration ------------------ #
 
-# Add environment variables for LangSmith
-os.environ["LANGCHAIN_TRACING_V2"]="true"
-os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGCHAIN_PROJECT"] = "AttackGen"
+# Time the whole rerun, and serve the Prometheus metrics endpoint (once per process)
+rerun_start = time.perf_counter()
+start_metrics_server()
+preload_models()
 
-# Initialise the LangSmith client if an API key is available
-api_key = os.getenv('LANGSMITH_API_KEY') # TODO: Test if this is required since LANGCHAIN_API_KEY is set below
+# Scenario runs and feedback are sent to LangSmith in the background by the queue below. LangChain's own tracing
+# would send a second copy of every run, so it is turned off.
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
 
-client = Client(api_key=api_key) if api_key else None
-
-# Initialise the LangSmith client conditionally based on the presence of an API key
+# Get the LangSmith queue conditionally based on the presence of an API key. Runs and feedback are sent from a
+# background thread and spooled to disk while LangSmith is unreachable, so the page never waits on it.
 if "LANGCHAIN_API_KEY" in st.secrets:
-    langchain_api_key = st.secrets["LANGCHAIN_API_KEY"]
-    client = Client(api_key=langchain_api_key)
+    langsmith_queue = get_langsmith_queue(st.secrets["LANGCHAIN_API_KEY"])
 else:
-    client = None
-
-# Add environment variables from session state for Azure OpenAI Service
-if "AZURE_OPENAI_API_KEY" in st.session_state:
-    os.environ["AZURE_OPENAI_API_KEY"] = st.session_state["AZURE_OPENAI_API_KEY"]
-if "AZURE_OPENAI_ENDPOINT" in st.session_state:
-    os.environ["AZURE_OPENAI_ENDPOINT"] = st.session_state["AZURE_OPENAI_ENDPOINT"]
-if "azure_deployment" in st.session_state:
-    os.environ["AZURE_DEPLOYMENT"] = st.session_state["azure_deployment"]
-if "openai_api_version" in st.session_state:
-    os.environ["OPENAI_API_VERSION"] = st.session_state["openai_api_version"]
-
-# Add environment variables from session state for Mistral API
-if "MISTRAL_API_KEY" in st.session_state:
-    os.environ["MISTRAL_API_KEY"] = st.session_state["MISTRAL_API_KEY"]
-if "mistral_model" in st.session_state:
-    os.environ["MISTRAL_MODEL"] = st.session_state["mistral_model"]
-
-# Add environment variables from session state for Ollama
-if "ollama_model" in st.session_state:
-    os.environ["OLLAMA_MODEL"] = st.session_state["ollama_model"]
-
-# Get the model provider and other required session state variables
-model_provider = st.session_state["chosen_model_provider"]
+    langsmith_queue = None
+
+# Get the required session state variables
 industry = st.session_state["industry"]
 company_size = st.session_state["company_size"]
 
@@ -61,6 +49,10 @@ company_size = st.session_state["company_size"]
 if "scenario_generated" not in st.session_state:
     st.session_state["scenario_generated"] = False
 
+# Set a random default seed for the kill chain so that it stays the same across reruns
+if "kill_chain_seed" not in st.session_state:
+    st.session_state["kill_chain_seed"] = random.randrange(1_000_000)
+
 st.set_page_config(
     page_title="Generate Scenario",
     page_icon="🛡️",
@@ -68,212 +60,84 @@ st.set_page_config(
 
 # ------------------ Helper Functions ------------------ #
 
-# Load and cache the MITRE ATT&CK data
-@st.cache_resource
-def load_attack_data():
-    attack_data = MitreAttackData("./data/enterprise-attack.json")
-    return attack_data
-
-attack_data = load_attack_data()
-
-# Load and cache the list of threat actor groups
-@st.cache_resource
-def load_groups():
-    groups = pd.read_json("./data/groups.json")
-    return groups
+# Get the MITRE ATT&CK data from the store shared by all pages in this process
+attack_store = get_attack_store()
+attack_data = attack_store.snapshot
+attack_index = attack_store.index
+technique_catalog = attack_store.catalog
 
+# Get the list of threat actor groups
 groups = load_groups()
 
-def generate_scenario_wrapper(openai_api_key, model_name, messages):
-    if client is not None:  # If LangChain client has been initialized
-        @traceable(run_type="llm", name="Threat Group Scenario", tags=["openai", "threat_group_scenario"], client=client)
-        def generate_scenario(openai_api_key, model_name, messages, *, run_tree: RunTree):
-            model_name = st.session_state["model_name"]
-            try:
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = ChatOpenAI(openai_api_key=openai_api_key, model_name=model_name, streaming=False)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.generate(messages=[messages])
-                    st.write("Scenario generated successfully.")
-                    st.session_state['run_id'] = str(run_tree.id)  # Store the run ID in the session state
-                    return response
-            except Exception as e:
-                st.error("An error occurred while generating the scenario: " + str(e))
-                st.session_state['run_id'] = str(run_tree.id)  # Ensure run_id is updated even on failure
-                return None
-    else:  # If LangChain client has not been initialized
-        def generate_scenario(openai_api_key, model_name, messages):
-            model_name = st.session_state["model_name"]
-            try:
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = ChatOpenAI(openai_api_key=openai_api_key, model_name=model_name, streaming=False)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.generate(messages=[messages])
-                    st.write("Scenario generated successfully.")
-                    return response
-            except Exception as e:
-                st.error("An error occurred while generating the scenario: " + str(e))
-                return None
-    
-    return generate_scenario(openai_api_key, model_name, messages)
-
-def generate_scenario_azure_wrapper(messages):
-    if client is not None:  # LangSmith client has been initialised
-        @traceable(run_type="llm", name="Threat Group Scenario (Azure OpenAI)", tags=["azure", "threat_group_scenario"], client=client if client is not None else None)
-        def generate_scenario_azure(messages, *, run_tree: RunTree):
-            try:
-                azure_api_key = os.getenv('AZURE_OPENAI_API_KEY')
-                azure_api_endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
-                azure_deployment_name = os.getenv('AZURE_DEPLOYMENT')
-                azure_api_version = os.getenv('OPENAI_API_VERSION')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = AzureOpenAI(api_key=azure_api_key,
-                                      azure_endpoint=azure_api_endpoint,
-                                      api_version=azure_api_version)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    
-                    # Convert message objects to the expected format
-                    formatted_messages = []
-                    for message in messages:
-                        if hasattr(message, 'role') and hasattr(message, 'content'):
-                            role = message.role
-                            if role == 'human':
-                                role = 'user'  # Replace 'human' with 'user'
-                            formatted_messages.append({"role": role, "content": message.content})
-                        elif hasattr(message, 'type') and hasattr(message, 'content'):
-                            role = message.type
-                            if role == 'human':
-                                role = 'user'  # Replace 'human' with 'user'
-                            formatted_messages.append({"role": role, "content": message.content})
-                        else:
-                            raise ValueError(f"Unsupported message format: {message}")
-                    
-                    response = llm.chat.completions.create(
-                        model=azure_deployment_name,
-                        messages=formatted_messages
-                    )
-                    st.write("Scenario generated successfully.")
-                    st.session_state['run_id'] = str(run_tree.id)  # Store the run ID in the session state
-                    return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                st.session_state['run_id'] = str(run_tree.id)  # Ensure run_id is updated even on failure
-                return None
-    else:  # LangSmith client has not been initialised
-        def generate_scenario_azure(messages):
-            try:
-                azure_api_key = os.getenv('AZURE_OPENAI_API_KEY')
-                azure_api_endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
-                azure_deployment_name = os.getenv('AZURE_DEPLOYMENT')
-                azure_api_version = os.getenv('OPENAI_API_VERSION')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = AzureOpenAI(api_key=azure_api_key,
-                                      azure_endpoint=azure_api_endpoint,
-                                      api_version=azure_api_version)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    
-                    # Convert message objects to the expected format
-                    formatted_messages = []
-                    for message in messages:
-                        if hasattr(message, 'role') and hasattr(message, 'content'):
-                            role = message.role
-                            if role == 'human':
-                                role = 'user'  # Replace 'human' with 'user'
-                            formatted_messages.append({"role": role, "content": message.content})
-                        elif hasattr(message, 'type') and hasattr(message, 'content'):
-                            role = message.type
-                            if role == 'human':
-                                role = 'user'  # Replace 'human' with 'user'
-                            formatted_messages.append({"role": role, "content": message.content})
-                        else:
-                            raise ValueError(f"Unsupported message format: {message}")
-                    
-                    response = llm.chat.completions.create(
-                        model=azure_deployment_name,
-                        messages=formatted_messages
-                    )
-                    st.write("Scenario generated successfully.")
-                    return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                return None
-    return generate_scenario_azure(messages)
-
-def generate_scenario_mistral_wrapper(mistral_api_key, model_name, messages):
-    if client is not None: # If LangSmith client has been initialised
-        @traceable(run_type="llm", name="Threat Group Scenario (Mistral API)", tags=["mistral", "threat_group_scenario"], client=client)
-        def generate_scenario_mistral(mistral_api_key, model_name, messages, *, run_tree: RunTree):
-            try:
-                mistral_api_key = os.getenv('MISTRAL_API_KEY')
-                model = os.getenv('MISTRAL_MODEL')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = ChatMistralAI(mistral_api_key=mistral_api_key)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.invoke(messages, model=model)
-                    st.write("Scenario generated successfully.")
-                    st.session_state['run_id'] = str(run_tree.id) # Store the run ID in the session state
-                    return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                st.session_state['run_id'] = str(run_tree.id) # Ensure run_id is updated even on failure
-                return None
-    else: # If LangSmith client has not been initialised
-        def generate_scenario_mistral(mistral_api_key, model_name, messages):
-            try:
-                mistral_api_key = os.getenv('MISTRAL_API_KEY')
-                model = os.getenv('MISTRAL_MODEL')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = ChatMistralAI(mistral_api_key=mistral_api_key)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.invoke(messages, model=model)
-                    st.write("Scenario generated successfully.")
-                    return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                return None
-    
-    return generate_scenario_mistral(mistral_api_key, model_name, messages)
-
-def generate_scenario_ollama_wrapper(model):
-    if client is not None: # If LangSmith client has been initialised
-        @traceable(run_type="llm", name="Threat Group Scenario (Ollama)", tags=["ollama", "threat_group_scenario"], client=client)
-        def generate_scenario_ollama(model, *, run_tree: RunTree):
-            try:
-                model = os.getenv('OLLAMA_MODEL')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = Ollama(model=model)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.invoke(messages, model=model)
-                    st.write("Scenario generated successfully.")
-                    st.session_state['run_id'] = str(run_tree.id)  # Store the run ID in the session state
-                return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                st.session_state['run_id'] = str(run_tree.id)  # Ensure run_id is updated even on failure
-                return None
-    else: # If LangSmith client has not been initialised
-        def generate_scenario_ollama(model):
-            try:
-                model = os.getenv('OLLAMA_MODEL')
-                with st.status('Generating scenario...', expanded=True):
-                    st.write("Initialising AI model.")
-                    llm = Ollama(model=model)
-                    st.write("Model initialised. Generating scenario, please wait.")
-                    response = llm.invoke(messages, model=model)
-                    st.write("Scenario generated successfully.")
-                return response
-            except Exception as e:
-                st.error(f"An error occurred while generating the scenario: {str(e)}")
-                return None
-
-    return generate_scenario_ollama(model)
+# Get the scenario cache and background job queue shared by all sessions in this process
+response_cache = get_response_cache()
+generation_jobs = get_job_queue()
+
+# Streamlit 1.37 renamed st.experimental_fragment to st.fragment
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+def generate_scenario_wrapper(config, messages, stream=True, refresh=False, hedge=None, hedge_percentile=None,
+                              fallbacks=None, phases=None):
+    """Start generating a scenario in the background and return the job."""
+    # Runs on a worker thread, so it must not use st.* calls
+    def generate_scenario(job, config, messages, run_tree=None):
+        if run_tree is not None:
+            job.run_id = str(run_tree.id)  # Store the run ID on the job, even on failure
+        # Serve repeat requests from the scenario cache unless a fresh scenario was requested
+        options = dict(stream=stream, cache=response_cache, refresh=refresh, hedge=hedge,
+                       hedge_percentile=hedge_percentile, fallbacks=fallbacks)
+        if phases:
+            # Write an outline, then the section for each phase of the kill chain at the same time
+            timed_stream = PhasedGeneration(config, messages, phases, **options)
+        else:
+            timed_stream = timed_generation(config, messages, **options)
+        for chunk in timed_stream:
+            job.append(chunk)
+        # Record the time to first token and total duration of this run
+        job.stats = timed_stream.stats()
+        return job.text
+
+    if langsmith_queue is not None:  # If LangSmith has been set up
+        run_name = "Threat Group Scenario" if config.provider == OPENAI else f"Threat Group Scenario ({config.provider})"
+        generate_scenario = langsmith_queue.traced_generation(run_name, tags=[PROVIDER_TAGS[config.provider], "threat_group_scenario"])(generate_scenario)
+
+    return generation_jobs.submit(generate_scenario, config, messages)
+
+@fragment(run_every=1)
+def show_scenario_progress(job_id, stream=True):
+    """Poll a running job, showing the scenario so far, and rerun the page once it finishes."""
+    job = generation_jobs.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.markdown("---")
+    with st.status(f"Generating scenario... ({job.elapsed:.0f}s)", expanded=not (stream and job.parts)):
+        st.write(f"Generating scenario with {st.session_state['scenario_job_provider']}, please wait. You can keep using the page; the scenario will appear here when it is ready.")
+    if stream and job.parts:
+        # Render the Markdown received so far
+        st.markdown(job.text)
+
+def collect_scenario_job():
+    """Move the result of a finished job into session state; returns True while a job is still running."""
+    job_id = st.session_state.get('scenario_job_id')
+    if job_id is None:
+        return False
+    job = generation_jobs.get(job_id)
+    if job is None:
+        del st.session_state['scenario_job_id']
+        st.warning("The scenario generation job could not be found, for example because the server restarted. Please generate the scenario again.")
+        return False
+    if not job.done:
+        return True
+    del st.session_state['scenario_job_id']
+    if job.run_id:
+        st.session_state['run_id'] = job.run_id
+    if job.error is not None:
+        st.error("An error occurred while generating the scenario: " + job.error)
+    else:
+        st.session_state['scenario_generated'] = True
+        st.session_state['scenario_text'] = job.result  # Store the generated scenario in the session state
+        st.session_state['threat_group_generation_stats'] = job.stats
+    return False
 
 # ------------------ Streamlit UI ------------------ #
 
@@ -290,86 +154,53 @@ st.markdown("""
 selected_group_alias = st.selectbox("Select a threat actor group for the scenario",
                                      sorted(groups['group'].unique()),placeholder="Select Group", index=17, label_visibility="hidden") # Set APT41 as the default group as the default group has no Enterprise ATT&CK techniques
 
-phase_name_order = ['Reconnaissance', 'Resource Development', 'Initial Access', 'Execution', 'Persistence', 
-                    'Privilege Escalation', 'Defense Evasion', 'Credential Access', 'Discovery', 'Lateral Movement', 
-                    'Collection', 'Command and Control', 'Exfiltration', 'Impact']
-
-phase_name_category = pd.CategoricalDtype(categories=phase_name_order, ordered=True)
-
+kill_chain_seed = st.number_input("Kill chain seed", min_value=0, step=1, key="kill_chain_seed",
+                                  help="A technique is chosen at random for each phase of the kill chain. The same seed always gives the same kill chain for a group; change it to choose different techniques.")
 
+# Limit the size of the prompt and of the generated scenario
+with st.expander("Prompt and scenario size"):
+    context_tokens = st.number_input("Technique detail (tokens)", min_value=0, max_value=8000, value=DEFAULT_CONTEXT_TOKENS, step=250, key="context_tokens",
+                                     help="Technique descriptions and detection notes are added to the prompt up to this many tokens, as far as the selected model's context window allows. Set to 0 to list the technique names only.")
+    st.number_input("Maximum scenario length (tokens)", min_value=256, max_value=8192, value=DEFAULT_MAX_TOKENS, step=256, key="max_tokens",
+                    help="Longer scenarios take longer to generate.")
 
 try:
     # Define techniques_df as an empty dataframe
     techniques_df = pd.DataFrame()
 
-    # define selected_techniques_df as an empty dataframe before the if condition
-    selected_techniques_df = pd.DataFrame()
+    # Define selected_techniques_df as an empty kill chain table before the if condition, so that the prompt can
+    # still be built for a group that is not found or has no techniques
+    selected_techniques_df = pd.DataFrame(columns=TABLE_COLUMNS)
+    kill_chain_rows = []
 
     if selected_group_alias != "Select Group":
-        # Get the group by the selected alias
-        group = attack_data.get_groups_by_alias(selected_group_alias)
+        # Get the group by the selected alias from the precomputed index
+        group = attack_index.group_for_alias(selected_group_alias)
         group_url = groups[groups['group'] == selected_group_alias]['url'].values[0]
 
         # Display the URL as a clickable link
         st.markdown( f"[View {selected_group_alias}'s page on attack.mitre.org]({group_url})")
 
         # Check if the group was found
-        if group:
-            # Get the STIX ID of the group
-            group_stix_id = group[0].id
-
-            # Get all techniques used by the group
-            techniques = attack_data.get_techniques_used_by_group(group_stix_id)
+        if group is not None:
+            # Get the rows of all techniques used by the group
+            with observe_seconds(ATTACK_QUERY_SECONDS, query="group_techniques"):
+                technique_rows = attack_index.techniques_for_group(group)
 
             # Check if there are any techniques for the group
-            if not techniques:
+            if len(technique_rows) == 0:
                 st.info(f"There are no Enterprise ATT&CK techniques associated with the threat group: {selected_group_alias}")
             else:
-                # Update techniques_df with the techniques
-                techniques_df = pd.DataFrame(techniques)
-
-            # Create a copy of the DataFrame for generating the LLM prompt
-            techniques_df_llm = techniques_df.copy()
-
-            # Add a 'Technique Name' column to both DataFrames
-            techniques_df['Technique Name'] = techniques_df_llm['Technique Name'] = techniques_df['object'].apply(lambda x: x['name'])
-
-            # Add a 'ATT&CK ID' column to both DataFrames
-            techniques_df['ATT&CK ID'] = techniques_df_llm['ATT&CK ID'] = techniques_df['object'].apply(lambda x: attack_data.get_attack_id(x['id']))
-
-            # Add a 'Phase Name' column to both DataFrames
-            techniques_df['Phase Name'] = techniques_df_llm['Phase Name'] = techniques_df['object'].apply(lambda x: x['kill_chain_phases'][0]['phase_name'])
-
-            # Drop duplicate techniques based on Phase Name, Technique Name and ATT&CK ID
-            techniques_df = techniques_df.drop_duplicates(['Phase Name', 'Technique Name', 'ATT&CK ID'])
-
-            # Convert the 'Phase Name' to title case and replace hyphens with spaces
-            techniques_df['Phase Name'] = techniques_df['Phase Name'].str.replace('-', ' ').str.title()
-            techniques_df_llm['Phase Name'] = techniques_df_llm['Phase Name'].str.replace('-', ' ').str.title()
-
-            # Replace 'Command And Control' with 'Command and Control'
-            techniques_df['Phase Name'] = techniques_df['Phase Name'].replace('Command And Control', 'Command and Control')
-            techniques_df_llm['Phase Name'] = techniques_df_llm['Phase Name'].replace('Command And Control', 'Command and Control')
-
-            # Convert the 'Phase Name' column to the ordered category in both DataFrames
-            techniques_df['Phase Name'] = techniques_df['Phase Name'].astype(phase_name_category)
-            techniques_df_llm['Phase Name'] = techniques_df_llm['Phase Name'].astype(phase_name_category)
-
-            # Sort the DataFrame by the 'Phase Name' column
-            techniques_df = techniques_df.sort_values('Phase Name')
-            techniques_df_llm = techniques_df_llm.sort_values('Phase Name')
-
-            # Group by 'Phase Name' and randomly select one technique from each group
-            # Filter the groups to include only those that have at least one row in the LLM DataFrame
-            selected_techniques_df = (techniques_df_llm.groupby('Phase Name', observed=False)
-                                        .apply(lambda x: x.sample(n=1) if len(x) > 0 else None)
-                                        .reset_index(drop=True))
+                # Gather the group's 'Technique Name', 'ATT&CK ID' and 'Phase Name' columns from the precomputed
+                # catalog. The rows are unique and already sorted by 'Phase Name'.
+                with observe_seconds(ATTACK_QUERY_SECONDS, query="group_table"):
+                    techniques_df = technique_catalog.table(technique_rows)
 
-            # Sort the DataFrame by the 'Phase Name' column
-            techniques_df = techniques_df.sort_values('Phase Name')
-
-            # Select only the 'Technique Name', 'ATT&CK ID', and 'Phase Name' columns
-            techniques_df = techniques_df[['Technique Name', 'ATT&CK ID', 'Phase Name']]
+                # Randomly select one technique from each phase that has at least one technique, using the seed
+                with observe_seconds(ATTACK_QUERY_SECONDS, query="kill_chain"):
+                    kill_chain_sampler = KillChainSampler.from_catalog(technique_catalog, technique_rows)
+                    kill_chain_rows = kill_chain_sampler.sample(1, seed=kill_chain_seed)[0]
+                    selected_techniques_df = technique_catalog.table(kill_chain_rows).reset_index(drop=True)
 
         if not techniques_df.empty:
             # Create an expander for the techniques
@@ -377,50 +208,18 @@ try:
                 # Use the st.table function to display the DataFrame
                 st.dataframe(data=techniques_df, height=200, use_container_width=True, hide_index=True)
 
-        # Create an empty list to hold the kill chain information
-        kill_chain = []
-
-        # Iterate over the rows in the DataFrame
-        for index, row in selected_techniques_df.iterrows():
-            # Extract the phase and technique information
-            phase_name = row['Phase Name']
-            technique_name = row['Technique Name']
-            attack_id = row['ATT&CK ID']
-
-            # Add a string with this information to the kill chain list
-            kill_chain.append(f"{phase_name}: {technique_name} ({attack_id})")
-
-        # Convert the kill chain list to a string with newline characters between each item
-        kill_chain_string = "\n".join(kill_chain)
-
-        # Create System Message Template
-        system_template = "You are a cybersecurity expert. Your task is to produce a comprehensive incident response testing scenario based on the information provided."
-        system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
-
-        # Create Human Message Template
-        human_template = ("""
-**Background information:**
-The company operates in the '{industry}' industry and is of size '{company_size}'. 
-                    
-**Threat actor information:**
-Threat actor group '{selected_group_alias}' is planning to target the company using the following kill chain
-{kill_chain_string}
-
-**Your task:**
-Create an incident response testing scenario based on the information provided. The goal of the scenario is to test the company's incident response capabilities against the identified threat actor group. 
-
-Your response should be well structured and formatted using Markdown. Write in British English.
-""")
-        human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
-
-        # Construct the ChatPromptTemplate
-        chat_prompt = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
-
-        # Format the prompt
-        messages = chat_prompt.format_prompt(selected_group_alias=selected_group_alias, 
-                                            kill_chain_string=kill_chain_string, 
-                                            industry=industry, 
-                                            company_size=company_size).to_messages()
+        # Format the prompt with one 'Phase: Technique (ID)' line per phase, adding technique descriptions and
+        # detection notes within the token budget for the selected model
+        prompt_config = ProviderConfig.from_session_state(st.session_state)
+        with observe_seconds(PROMPT_BUILD_SECONDS, page="threat_group"):
+            messages = build_messages_within_budget(
+                lambda kill_chain_string: threat_group_messages(selected_group_alias=selected_group_alias,
+                                                                kill_chain_string=kill_chain_string,
+                                                                industry=industry,
+                                                                company_size=company_size),
+                kill_chain_rows, kill_chain_labels(selected_techniques_df), attack_store.context, prompt_config,
+                max_tokens=prompt_config.max_tokens, limit=context_tokens)
+        st.caption(f"Prompt size: about {count_message_tokens(messages):,} tokens")
 
 # Error handling for group selection
 except Exception as e:
@@ -438,127 +237,65 @@ st.markdown("""
             """)
 
 try:
-    if model_provider == "Azure OpenAI Service":
-        if st.button('Generate Scenario', key='generate_scenario_azure'):
-            if not os.environ["AZURE_OPENAI_API_KEY"]:
-                st.info("Please add your Azure OpenAI Service API key to continue.")
-            if not os.environ["AZURE_OPENAI_ENDPOINT"]:
-                st.info("Please add your Azure OpenAI Service API endpoint to continue.")
-            if not os.environ["AZURE_DEPLOYMENT"]:
-                st.info("Please add the name of your Azure OpenAI Service Deployment to continue.")
-            elif not industry:
-                st.info("Please select your company's industry to continue.")
-            elif not company_size:
-                st.info("Please select your company's size to continue.")
-            elif techniques_df.empty:
-                st.info("Please select a threat group with associated Enterprise ATT&CK techniques.")
-            else:
-                response = generate_scenario_azure_wrapper(messages)
-                st.markdown("---")
-                if response is not None:
-                    st.session_state['scenario_generated'] = True
-                    scenario_text = response.choices[0].message.content
-                    st.session_state['scenario_text'] = scenario_text  # Store the generated scenario in the session state
-                    st.markdown(scenario_text)
-                    st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-                else:
-                    # If a scenario has been generated previously, display it
-                    if 'scenario_text' in st.session_state and st.session_state['scenario_generated']:
-                        st.markdown("---")
-                        st.markdown(st.session_state['scenario_text'])
-                        st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-    elif model_provider == "Mistral API":
-        if st.button('Generate Scenario', key='generate_scenario_mistral'):
-            if not os.environ["MISTRAL_API_KEY"]:
-                st.info("Please add your Mistral API key to continue.")
-            if not os.environ["MISTRAL_MODEL"]:
-                st.info("Please select a model to continue.")
-            elif not industry:
-                st.info("Please select your company's industry to continue.")
-            elif not company_size:
-                st.info("Please select your company's size to continue.")
-            elif techniques_df.empty:
-                st.info("Please select a threat group with associated Enterprise ATT&CK techniques.")
-            else:
-                mistral_api_key = st.session_state.get('mistral_api_key')
-                model_name = os.getenv('MISTRAL_MODEL')
-                response = generate_scenario_mistral_wrapper(mistral_api_key, model_name, messages)
-                st.markdown("---")
-                if response is not None:
-                    st.session_state['scenario_generated'] = True
-                    scenario_text = response.content
-                    st.session_state['scenario_text'] = scenario_text  # Store the generated scenario in the session state
-                    st.markdown(scenario_text)
-                    st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-                else:
-                    # If a scenario has been generated previously, display it
-                    if 'scenario_text' in st.session_state and st.session_state['scenario_generated']:
-                        st.markdown("---")
-                        st.markdown(st.session_state['scenario_text'])
-                        st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-    
-    elif model_provider == "Ollama":
-        if st.button('Generate Scenario', key='generate_scenario_ollama'):
-            if not os.environ["OLLAMA_MODEL"]:
-                st.info("Please select a model to continue.")
-            elif not industry:
-                st.info("Please select your company's industry to continue.")
-            elif not company_size:
-                st.info("Please select your company's size to continue.")
-            elif techniques_df.empty:
-                st.info("Please select a threat group with associated Enterprise ATT&CK techniques.")
-            else:
-                model = os.getenv('OLLAMA_MODEL')
-                response = generate_scenario_ollama_wrapper(model)
-                st.markdown("---")
-                if response is not None:
-                    st.session_state['scenario_generated'] = True
-                    scenario_text = response
-                    st.session_state['scenario_text'] = scenario_text  # Store the generated scenario in the session state
-                    st.markdown(scenario_text)
-                    st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-                else:
-                    # If a scenario has been generated previously, display it
-                    if 'scenario_text' in st.session_state and st.session_state['scenario_generated']:
-                        st.markdown("---")
-                        st.markdown(st.session_state['scenario_text'])
-                        st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-    else: 
-        if st.button('Generate Scenario', key='generate_scenario'):
-            openai_api_key = st.session_state.get('openai_api_key')
-            model_name = st.session_state.get('model_name')
-            if not openai_api_key:
-                st.info("Please add your OpenAI API key to continue.")
-            if not model_name:
-                st.info("Please select a model to continue.")
-            elif not industry:
-                st.info("Please select your company's industry to continue.")
-            elif not company_size:
-                st.info("Please select your company's size to continue.")
-            elif techniques_df.empty:
-                st.info("Please select a threat group with associated Enterprise ATT&CK techniques.")
-            else:
-                response = generate_scenario_wrapper(openai_api_key, model_name, messages)
-                st.markdown("---")
-                if response is not None:
-                    st.session_state['scenario_generated'] = True
-                    scenario_text = response.generations[0][0].text
-                    st.session_state['scenario_text'] = scenario_text  # Store the generated scenario in the session state
-                    st.markdown(scenario_text)
-                    st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-
-                else:
-                    # If a scenario has been generated previously, display it
-                    if 'scenario_text' in st.session_state and st.session_state['scenario_generated']:
-                        st.markdown("---")
-                        st.markdown(st.session_state['scenario_text'])
-                        st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
-    
+    stream_scenario = st.toggle("Stream the scenario as it is generated", value=True, key="stream_scenario")
+    phased_generation = st.toggle("Generate the kill chain phases in parallel", value=False, key="phased_generation",
+                                  help="Writes a short outline of the scenario first, then the section for each phase of the kill chain at the same time, and joins them together. This is usually much faster for long kill chains, although the sections may read less smoothly than a scenario written in one go.")
+    bypass_cache = st.toggle("Bypass the cache and regenerate", value=False, key="bypass_cache",
+                             help="Repeat requests are answered from the scenario cache. Turn this on to generate a new scenario instead.")
+
+    # Providers other than the selected one whose settings have been entered, for failover and hedging
+    other_configs = alternative_configs(st.session_state)
+    failover = st.toggle("Fail over to other providers if the selected provider is unavailable", value=True, key="failover",
+                         help="If the selected provider fails or is paused after repeated errors, the scenario is generated with the next healthy provider whose settings have been entered on the Welcome page, in the order set on the Provider Health page.")
+
+    # Optionally send slow requests to a second provider as well and use whichever answers first
+    with st.expander("Hedge slow requests with a second provider"):
+        hedge_provider = st.selectbox("Secondary provider", ["Off"] + list(other_configs), key="hedge_provider",
+                                      help="If the selected provider is slower than usual to respond, the same request is also sent to this provider and whichever answers first is used. Providers are listed once their settings have been entered on the Welcome page.")
+        hedge_percentile = st.slider("Hedge when the response is slower than this percentile of recent responses", 50, 99,
+                                     int(DEFAULT_PERCENTILE), key="hedge_percentile")
+        hedging_stats = format_hedging_stats(latency_tracker.stats())
+        if hedging_stats:
+            st.caption(hedging_stats)
+
+    if st.button('Generate Scenario', key='generate_scenario'):
+        config = ProviderConfig.from_session_state(st.session_state)
+        running_job = generation_jobs.get(st.session_state.get('scenario_job_id'))
+        missing_settings = config.missing_settings()
+        if missing_settings:
+            for message in missing_settings:
+                st.info(message)
+        elif not industry:
+            st.info("Please select your company's industry to continue.")
+        elif not company_size:
+            st.info("Please select your company's size to continue.")
+        elif config.provider == OLLAMA and not get_ollama_pool(config.endpoint).has_model(config.model):
+            st.info(f"The Ollama model '{config.model}' is no longer available. Please select another model on the Welcome page.")
+        elif running_job is not None and not running_job.done:
+            st.info("A scenario is already being generated. Please wait for it to finish.")
+        elif techniques_df.empty:
+            st.info("Please select a threat group with associated Enterprise ATT&CK techniques.")
+        else:
+            job = generate_scenario_wrapper(config, messages, stream=stream_scenario, refresh=bypass_cache,
+                                       hedge=other_configs.get(hedge_provider), hedge_percentile=hedge_percentile,
+                                       fallbacks=router.by_priority(other_configs.values()) if failover else None,
+                                       phases=kill_chain_phases(selected_techniques_df) if phased_generation else None)
+            st.session_state['scenario_job_id'] = job.id
+            st.session_state['scenario_job_provider'] = f"{config.provider} ({config.model})"
+
+    if collect_scenario_job():
+        show_scenario_progress(st.session_state['scenario_job_id'], stream=stream_scenario)
+    elif 'scenario_text' in st.session_state and st.session_state['scenario_generated']:
+        # Display the latest scenario, which is kept across reruns
+        st.markdown("---")
+        st.markdown(st.session_state['scenario_text'])
+        st.download_button(label="Download Scenario", data=st.session_state['scenario_text'], file_name="threat_group_scenario.md", mime="text/markdown")
+        if st.session_state.get('threat_group_generation_stats'):
+            st.caption(format_generation_stats(st.session_state['threat_group_generation_stats']))
+            if st.session_state['threat_group_generation_stats'].get('sections'):
+                with st.expander("Section timings"):
+                    st.dataframe(pd.DataFrame(section_table(st.session_state['threat_group_generation_stats'])), use_container_width=True, hide_index=True)
+
     # Display an info message if no API key is set
     if 'LANGCHAIN_API_KEY' not in st.secrets:
         st.info("ℹ️ No LangChain API key has been set. This run will not be logged to LangSmith.")                
@@ -568,8 +305,8 @@ try:
 
     # Show the thumbs_up and thumbs_down buttons only when a scenario has been generated
     st.markdown("---")
-    # Show the feedback buttons only if a scenario has been generated and the LangSmith client is initialized
-    if st.session_state.get('scenario_generated', False) and client is not None:
+    # Show the feedback buttons only if a scenario has been generated and LangSmith has been set up
+    if st.session_state.get('scenario_generated', False) and langsmith_queue is not None:
         st.markdown("Rate the scenario to help improve this tool.")
         col1, col2, col3 = st.columns([0.5,0.5,5])
         with col1:
@@ -582,19 +319,20 @@ try:
                         score = 1  # or 0
                         comment = ""
 
-                        # Record the feedback
-                        feedback_record = client.create_feedback(
+                        # Queue the feedback to be sent in the background
+                        feedback_id = langsmith_queue.create_feedback(
                             run_id,
                             feedback_type_str,
                             score=score,
                             comment=comment,
                         )
                         st.session_state.feedback = {
-                            "feedback_id": str(feedback_record.id),
+                            "feedback_id": feedback_id,
                             "score": score,
                         }
                         # Update the feedback message in the placeholder
                         feedback_placeholder.success("Feedback submitted. Thank you.")
+                        FEEDBACK.labels(page="threat_group", feedback=feedback_type_str).inc()
                     else:
                         # Update the feedback message in the placeholder
                         feedback_placeholder.warning("No run ID found. Please generate a scenario first.")
@@ -612,19 +350,20 @@ try:
                         score = 0  # or 0
                         comment = ""
 
-                        # Record the feedback
-                        feedback_record = client.create_feedback(
+                        # Queue the feedback to be sent in the background
+                        feedback_id = langsmith_queue.create_feedback(
                             run_id,
                             feedback_type_str,
                             score=score,
                             comment=comment,
                         )
                         st.session_state.feedback = {
-                            "feedback_id": str(feedback_record.id),
+                            "feedback_id": feedback_id,
                             "score": score,
                         }
                         # Update the feedback message in the placeholder
                         feedback_placeholder.success("Feedback submitted. Thank you.")
+                        FEEDBACK.labels(page="threat_group", feedback=feedback_type_str).inc()
                     else:
                         # Update the feedback message in the placeholder
                         feedback_placeholder.warning("No run ID found. Please generate a scenario first.")
@@ -635,10 +374,17 @@ try:
 except Exception as e:
     st.error("An error occurred: " + str(e))
 
+# Show the version and memory footprint of the shared ATT&CK data, and the scenario cache hit rate
+st.caption(format_memory_usage())
+st.caption(format_cache_stats(response_cache.stats()))
+
 # Add a back button
 link_to_homepage = "/"
 
 st.markdown(
     f'<a href="{link_to_homepage}" style="display: inline-block; padding: 5px 20px; color: white; text-align: center; text-decoration: none; font-size: 16px; border-radius: 4px;">⬅️ Back</a>',
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+# Record how long this rerun took
+observe_rerun("threat_group", rerun_start)
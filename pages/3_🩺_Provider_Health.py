@@ -0,0 +1,118 @@
+import hmac
+
+import pandas as pd
+import streamlit as st
+
+from attackgen.coalescing import in_flight_requests
+from attackgen.generation import PROVIDERS
+from attackgen.metrics import start_metrics_server
+from attackgen.ollama import get_ollama_pool
+from attackgen.routing import format_breaker_state, router
+
+
+# ------------------ Streamlit UI Configuration ------------------ #
+
+# Serve the Prometheus metrics endpoint (once per process)
+start_metrics_server()
+
+st.set_page_config(
+    page_title="Provider Health",
+    page_icon="🩺",
+)
+
+# Changing the failover order or resetting breakers affects every user of this server, so these controls are only
+# enabled once an ADMIN_PASSWORD secret has been set, for those who know it
+admin_password = st.secrets.get("ADMIN_PASSWORD")
+
+# ------------------ Streamlit UI ------------------ #
+
+st.markdown("# <span style='color: #1DB954;'>Provider Health🩺</span>", unsafe_allow_html=True)
+
+st.markdown("""
+            ### Circuit Breakers
+
+            Each model provider has a circuit breaker for every endpoint and API key in use. After repeated errors (for example an outage or a run of rate limit errors) the breaker opens and the provider is skipped, so scenarios are generated with the next healthy provider instead. After a cool-down a single trial request is let through, and the breaker closes again if it succeeds.
+            """)
+
+breaker_stats = router.stats()
+if not breaker_stats:
+    st.info("No scenarios have been generated since the server started.")
+else:
+    breaker_table = pd.DataFrame([{
+        "Provider": stats["provider"],
+        "Model": stats["model"],
+        "Endpoint": stats["endpoint"],
+        "API Key": f"…{stats['key_id']}" if stats["key_id"] else None,
+        "State": format_breaker_state(stats),
+        "Recent Requests": stats["requests"],
+        "Error Rate": f"{stats['error_rate']:.0%}",
+        "Consecutive Failures": stats["consecutive_failures"],
+        "First Token p50 (s)": stats["p50_s"],
+        "First Token p95 (s)": stats["p95_s"],
+        "Retry In (s)": stats["retry_in_s"],
+        "Last Error": stats["last_error"],
+    } for stats in breaker_stats])
+    st.dataframe(breaker_table, use_container_width=True, hide_index=True)
+
+# Identical requests made while one is in progress share its response instead of calling the provider again
+coalescing_stats = in_flight_requests.stats()
+st.caption(f"{coalescing_stats['in_flight']} provider requests in progress · {coalescing_stats['saved']:,} provider "
+           f"calls saved by sharing identical requests already in progress")
+
+ollama_pool = get_ollama_pool()
+if ollama_pool.checked:
+    st.markdown("""
+                ### Ollama Servers
+
+                Ollama requests are sent to the healthy server with the selected model that has the fewest requests in progress. A server is healthy while its model list can be fetched; a server that cannot be reached is skipped until it responds again.
+                """)
+    ollama_table = pd.DataFrame([{
+        "Server": stats["host"],
+        "Healthy": "✅" if stats["healthy"] else "❌",
+        "Models": stats["models"],
+        "In Progress": stats["in_progress"],
+        "Requests": stats["requests"],
+        "Connection Failures": stats["failures"],
+        "Last Seen (s ago)": None if stats["seen_s"] is None else round(stats["seen_s"]),
+        "Last Error": stats["last_error"],
+    } for stats in ollama_pool.stats()])
+    st.dataframe(ollama_table, use_container_width=True, hide_index=True)
+
+if st.button("Refresh"):
+    st.rerun()
+
+st.markdown("""
+            ### Failover Order
+
+            When a scenario's provider is unavailable, the other providers whose settings have been entered are tried in this order. Providers with recent errors or much slower responses are tried after healthy ones.
+            """)
+
+if admin_password is None:
+    st.info("Set an ADMIN_PASSWORD secret to change the failover order or reset circuit breakers here.")
+    is_admin = False
+else:
+    entered_password = st.text_input("Admin password", type="password")
+    is_admin = hmac.compare_digest(entered_password.encode(), str(admin_password).encode())
+
+priority = st.multiselect("Failover order", PROVIDERS, default=router.priority, disabled=not is_admin,
+                          help="Providers are tried in the order they are listed. Providers left out are tried last.")
+if st.button("Save Failover Order", disabled=not is_admin):
+    router.set_priority(priority)
+    st.success("Failover order saved.")
+
+if breaker_stats:
+    breaker_names = [f"{breaker.provider} ({breaker.model})"
+                     + (f" at {breaker.endpoint}" if breaker.endpoint else "")
+                     + (f", API key …{breaker.key_id}" if breaker.key_id else "") for breaker in router.breakers()]
+    reset_name = st.selectbox("Reset a circuit breaker", breaker_names, disabled=not is_admin)
+    if st.button("Reset Breaker", disabled=not is_admin):
+        router.breakers()[breaker_names.index(reset_name)].reset()
+        st.success(f"The circuit breaker for {reset_name} has been reset.")
+
+# Add a back button
+link_to_homepage = "/"
+
+st.markdown(
+    f'<a href="{link_to_homepage}" style="display: inline-block; padding: 5px 20px; color: white; text-align: center; text-decoration: none; font-size: 16px; border-radius: 4px;">⬅️ Back</a>',
+    unsafe_allow_html=True
+)
@@ -0,0 +1,67 @@
+"""
+Shared fixtures: a small ATT&CK bundle compiled in memory, and the mock provider server.
+"""
+
+import pytest
+
+from attackgen.index import AttackIndex
+from attackgen.snapshot import AttackSnapshot, compile_bundle
+
+
+TACTICS = [("initial-access", "Initial Access"), ("execution", "Execution"), ("persistence", "Persistence")]
+
+
+def _technique(number, phases, **extra):
+    return {"type": "attack-pattern", "id": f"attack-pattern--{number}", "name": f"Technique {number}",
+            "kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": phase} for phase in phases],
+            "external_references": [{"source_name": "mitre-attack", "external_id": f"T{1000 + number}"}], **extra}
+
+
+def _uses(source, number):
+    return {"type": "relationship", "id": f"relationship--{source}-{number}", "relationship_type": "uses",
+            "source_ref": source, "target_ref": f"attack-pattern--{number}"}
+
+
+@pytest.fixture(scope="session")
+def bundle():
+    """Three tactics, seven techniques (one revoked) and three groups, one of them without techniques."""
+    objects = [{"type": "x-mitre-collection", "id": "x-mitre-collection--1", "x_mitre_version": "15.1"},
+               {"type": "x-mitre-matrix", "id": "x-mitre-matrix--1",
+                "tactic_refs": [f"x-mitre-tactic--{shortname}" for shortname, _ in TACTICS]}]
+    objects += [{"type": "x-mitre-tactic", "id": f"x-mitre-tactic--{shortname}", "name": name,
+                 "x_mitre_shortname": shortname} for shortname, name in TACTICS]
+    objects += [_technique(1, ["initial-access"]), _technique(2, ["initial-access"]),
+                _technique(3, ["execution", "persistence"]), _technique(4, ["execution"]),
+                _technique(5, ["persistence"]), _technique(6, ["persistence"], revoked=True), _technique(7, [])]
+    objects += [
+        {"type": "intrusion-set", "id": "intrusion-set--1", "name": "Test Group", "aliases": ["Test Group", "TG1"]},
+        {"type": "intrusion-set", "id": "intrusion-set--2", "name": "Other Group", "aliases": ["Other Group"]},
+        {"type": "intrusion-set", "id": "intrusion-set--3", "name": "Empty Group", "aliases": ["Empty Group"]},
+        {"type": "campaign", "id": "campaign--1", "name": "Test Campaign"},
+        {"type": "relationship", "id": "relationship--campaign", "relationship_type": "attributed-to",
+         "source_ref": "campaign--1", "target_ref": "intrusion-set--1"},
+    ]
+    objects += [_uses("intrusion-set--1", number) for number in (1, 2, 3, 6)]
+    objects += [_uses("campaign--1", number) for number in (3, 5)]
+    objects += [_uses("intrusion-set--2", number) for number in (4, 7)]
+    return {"type": "bundle", "objects": objects}
+
+
+@pytest.fixture(scope="session")
+def snapshot(bundle):
+    return AttackSnapshot(dict(compile_bundle(bundle), source_sha256=""))
+
+
+@pytest.fixture(scope="session")
+def index(snapshot):
+    return AttackIndex(snapshot)
+
+
+@pytest.fixture
+def mock_server():
+    """A mock provider server on a free port, stopped after the test."""
+    from attackgen.mockserver import MockLLMServer, MockSettings
+
+    server = MockLLMServer(port=0, settings=MockSettings(tokens_per_second=2000)).start()
+    yield server
+    server.stop()
@@ -0,0 +1,73 @@
+import pytest
+from langchain_core.messages import HumanMessage
+
+from attackgen.cache import ResponseCache
+from attackgen.generation import OLLAMA, ProviderConfig, timed_generation
+
+
+CONFIG = ProviderConfig(OLLAMA, "llama3:latest")
+MESSAGES = [HumanMessage(content="Write a scenario.")]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite3"))
+
+
+def test_miss_then_hit(cache):
+    assert cache.get(CONFIG, MESSAGES) is None
+
+    cache.put(CONFIG, MESSAGES, "# Scenario")
+
+    assert cache.get(CONFIG, MESSAGES) == "# Scenario"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_includes_provider_model_and_messages(cache):
+    cache.put(CONFIG, MESSAGES, "# Scenario")
+
+    assert cache.get(ProviderConfig(OLLAMA, "mistral:latest"), MESSAGES) is None
+    assert cache.get(CONFIG, [HumanMessage(content="Write another scenario.")]) is None
+
+
+def test_empty_responses_are_not_stored(cache):
+    cache.put(CONFIG, MESSAGES, "  \n")
+
+    assert cache.get(CONFIG, MESSAGES) is None
+
+
+def test_responses_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), ttl_seconds=-1)
+    cache.put(CONFIG, MESSAGES, "# Scenario")
+
+    assert cache.get(CONFIG, MESSAGES) is None
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_bytes=15)
+    first, second = [HumanMessage(content="first")], [HumanMessage(content="second")]
+    cache.put(CONFIG, first, "0123456789")
+    cache.put(CONFIG, second, "0123456789")
+
+    assert cache.get(CONFIG, first) is None
+    assert cache.get(CONFIG, second) == "0123456789"
+
+
+def _requests(server):
+    return sum(count for (path, _), count in server.stats.items() if path == "api/chat")
+
+
+def test_timed_generation_uses_the_cache_unless_refreshing(cache, mock_server):
+    config = ProviderConfig(OLLAMA, "llama3:latest", endpoint=mock_server.url)
+
+    first = timed_generation(config, MESSAGES, cache=cache)
+    text = "".join(first)
+    cached = timed_generation(config, MESSAGES, cache=cache)
+    assert "".join(cached) == text
+    assert cached.stats()["cached"] and not first.stats()["cached"]
+    assert _requests(mock_server) == 1
+
+    refreshed = timed_generation(config, MESSAGES, cache=cache, refresh=True)
+    assert "".join(refreshed)
+    assert not refreshed.stats()["cached"]
+    assert _requests(mock_server) == 2
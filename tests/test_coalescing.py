@@ -0,0 +1,97 @@
+import gc
+
+import pytest
+
+from attackgen.coalescing import Flight, InFlightRequests, RequestCancelled
+from attackgen.generation import OLLAMA, ProviderConfig
+
+
+CONFIG = ProviderConfig(OLLAMA, "llama3:latest")
+
+
+class Source:
+    """Stands in for the RoutedStream behind a request."""
+    winner = CONFIG
+    hedged = False
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.started = False
+
+    def __iter__(self):
+        self.started = True
+        yield from self.chunks
+
+
+def _stream(requests, chunks=("a", "b", "c")):
+    source = Source(chunks)
+    return requests.stream("key", CONFIG, source, source)
+
+
+def test_a_stream_dropped_unread_is_never_registered():
+    requests = InFlightRequests()
+
+    stream = _stream(requests)
+    assert requests.stats()["in_flight"] == 0
+    del stream
+    gc.collect()
+
+    assert list(_stream(requests)) == ["a", "b", "c"]
+    assert requests.stats() == {"in_flight": 0, "saved": 0, "subscribers": 0}
+
+
+def test_a_stream_closed_part_way_is_removed():
+    requests = InFlightRequests()
+    chunks = iter(_stream(requests))
+
+    assert next(chunks) == "a"
+    assert requests.stats()["in_flight"] == 1
+    chunks.close()
+
+    assert requests.stats()["in_flight"] == 0
+    second = _stream(requests)
+    assert list(second) == ["a", "b", "c"]
+    assert not second.coalesced
+
+
+def test_identical_requests_share_the_leading_request():
+    requests = InFlightRequests()
+    leader = _stream(requests)
+    leading = iter(leader)
+    assert next(leading) == "a"
+
+    follower = _stream(requests)
+    following = iter(follower)
+    assert next(following) == "a"
+    assert list(leading) == ["b", "c"]
+    assert list(following) == ["b", "c"]
+
+    assert follower.coalesced and not leader.coalesced
+    assert not follower.source.started
+    assert follower.winner == CONFIG
+    assert requests.stats() == {"in_flight": 0, "saved": 1, "subscribers": 0}
+
+
+def test_followers_see_the_leading_request_fail():
+    def failing():
+        yield "a"
+        raise ConnectionError("lost")
+
+    requests = InFlightRequests()
+    leading = iter(_stream(requests, failing()))
+    assert next(leading) == "a"
+    following = iter(_stream(requests))
+    assert next(following) == "a"
+
+    with pytest.raises(ConnectionError):
+        next(leading)
+    with pytest.raises(ConnectionError):
+        next(following)
+    assert requests.stats()["in_flight"] == 0
+
+
+def test_followers_time_out():
+    flight = Flight("key")
+
+    with pytest.raises(RequestCancelled):
+        list(flight.follow(timeout=0.05))
@@ -0,0 +1,10 @@
+import pytest
+
+from attackgen.import_budget import check_target, targets
+
+
+@pytest.mark.parametrize("name, code, budget", targets(), ids=[target[0] for target in targets()])
+def test_imports_within_budget(name, code, budget):
+    seconds, problems = check_target(code, budget)
+
+    assert not problems, f"{name}: " + "; ".join(problems)
@@ -0,0 +1,33 @@
+def _snapshot_techniques(snapshot, alias):
+    """The group's technique IDs as found by walking the snapshot's relationships."""
+    group = snapshot.get_groups_by_alias(alias)[0]
+    return {technique["object"]["id"] for technique in snapshot.get_techniques_used_by_group(group["id"])}
+
+
+def test_group_techniques_match_the_snapshot_lookup(snapshot, index):
+    for group in snapshot.groups:
+        for alias in group["aliases"]:
+            rows = index.techniques_for_group(index.group_for_alias(alias))
+            assert {index.technique_ids[row] for row in rows} == _snapshot_techniques(snapshot, alias)
+
+
+def test_group_techniques_include_campaigns_and_skip_revoked(snapshot, index):
+    rows = index.techniques_for_group(index.group_for_alias("Test Group"))
+
+    assert [index.technique_ids[row] for row in rows] == [
+        "attack-pattern--1", "attack-pattern--2", "attack-pattern--3", "attack-pattern--5"]
+
+
+def test_group_without_techniques(index):
+    assert len(index.techniques_for_group(index.group_for_alias("Empty Group"))) == 0
+
+
+def test_unknown_alias(index):
+    assert index.group_for_alias("Unknown Group") is None
+
+
+def test_technique_tactics_follow_the_technique(snapshot, index):
+    for row, technique in enumerate(snapshot.techniques):
+        tactics = [index.tactic_shortnames[column] for column in index.tactics_for_technique(row)]
+        assert tactics == technique["phases"]
+        assert index.primary_tactic[row] == (index.tactic_shortnames.index(tactics[0]) if tactics else -1)
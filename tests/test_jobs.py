@@ -0,0 +1,73 @@
+import threading
+import time
+
+from attackgen.jobs import DONE, FAILED, JobQueue
+
+
+def _wait(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done
+
+
+def test_job_result_and_failure():
+    queue = JobQueue(max_workers=2)
+
+    def generate(job, text):
+        job.append(text)
+        return text.upper()
+
+    def fail(job):
+        raise RuntimeError("provider unavailable")
+
+    done, failed = queue.submit(generate, "scenario"), queue.submit(fail)
+    _wait(done)
+    _wait(failed)
+
+    assert (done.status, done.result, done.text) == (DONE, "SCENARIO", "scenario")
+    assert (failed.status, failed.error) == (FAILED, "provider unavailable")
+    assert done.finished is not None and failed.finished is not None
+    assert queue.get(done.id) is done
+
+
+def test_finished_jobs_expire():
+    queue = JobQueue(keep_seconds=0)
+    job = queue.submit(lambda job: "scenario")
+    _wait(job)
+
+    queue.submit(lambda job: None)
+
+    assert queue.get(job.id) is None
+
+
+def test_expiry_while_a_job_is_finishing():
+    queue = JobQueue(keep_seconds=0)
+    release = threading.Event()
+    job = queue.submit(lambda job: release.wait(5))
+    # A job seen by another thread between its final status and its finish time
+    job.status = DONE
+    job.finished = None
+
+    queue.submit(lambda job: None)
+
+    assert queue.get(job.id) is job
+    release.set()
+
+
+def test_a_done_job_always_has_its_finish_time():
+    queue = JobQueue(max_workers=4)
+    seen = []
+
+    def watch(job):
+        while not job.done:
+            pass
+        seen.append(job.finished)
+
+    for _ in range(20):
+        job = queue.submit(lambda job: None)
+        watcher = threading.Thread(target=watch, args=(job,))
+        watcher.start()
+        watcher.join(5)
+
+    assert len(seen) == 20 and None not in seen
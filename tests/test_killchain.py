@@ -0,0 +1,54 @@
+import numpy as np
+
+from attackgen.catalog import TechniqueCatalog
+from attackgen.killchain import KillChainSampler, build_kill_chain
+
+
+def test_sample_takes_one_technique_per_phase():
+    sampler = KillChainSampler([10, 11, 12, 13, 14], [0, 0, 2, 2, -1])
+
+    chains = sampler.sample(50, seed=1)
+
+    assert len(sampler) == 2
+    assert chains.shape == (50, 2)
+    assert set(chains[:, 0]) <= {10, 11}
+    assert set(chains[:, 1]) <= {12, 13}
+
+
+def test_same_seed_gives_same_kill_chains():
+    sampler = KillChainSampler(np.arange(20), np.arange(20) % 4)
+
+    for replace in (True, False):
+        assert np.array_equal(sampler.sample(8, seed=42, replace=replace), sampler.sample(8, seed=42, replace=replace))
+    assert not np.array_equal(sampler.sample(8, seed=1), sampler.sample(8, seed=2))
+
+
+def test_sample_without_replacement_uses_every_technique_before_repeating():
+    sampler = KillChainSampler(np.arange(6), [0, 0, 0, 1, 1, 1])
+
+    chains = sampler.sample(6, seed=3, replace=False)
+
+    for column, rows in enumerate(({0, 1, 2}, {3, 4, 5})):
+        assert set(chains[:3, column]) == rows
+        assert set(chains[3:, column]) == rows
+
+
+def test_empty_group_gives_empty_kill_chains():
+    sampler = KillChainSampler(np.array([], dtype=np.int32), np.array([], dtype=np.int16))
+
+    chains = sampler.sample(3, seed=0)
+
+    assert len(sampler) == 0
+    assert chains.shape == (3, 0)
+
+
+def test_build_kill_chain(snapshot, index):
+    store = type("Store", (), {"snapshot": snapshot, "index": index, "catalog": TechniqueCatalog(snapshot, index)})
+
+    table = build_kill_chain("TG1", seed=7, store=store)
+
+    assert list(table.columns) == ["Technique Name", "ATT&CK ID", "Phase Name"]
+    assert list(table["Phase Name"]) == ["Initial Access", "Execution", "Persistence"]
+    assert table.equals(build_kill_chain("TG1", seed=7, store=store))
+    assert build_kill_chain("Empty Group", store=store).empty
+    assert build_kill_chain("Unknown Group", store=store) is None
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from attackgen.generation import OPENAI, ProviderConfig
+from attackgen.routing import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, Router, is_provider_failure
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(OPENAI, "gpt-4o", failure_threshold=3)
+
+    for _ in range(2):
+        breaker.record_failure(1.0)
+        assert breaker.state == CLOSED
+    breaker.record_failure(1.0, ProviderError(500))
+
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.stats()["last_error"] == "HTTP 500"
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(OPENAI, "gpt-4o", failure_threshold=2)
+
+    breaker.record_failure(1.0)
+    breaker.record_success(1.0)
+    breaker.record_failure(1.0)
+
+    assert breaker.state == CLOSED
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(OPENAI, "gpt-4o", failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure(1.0)
+    time.sleep(0.06)
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success(1.0)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(OPENAI, "gpt-4o", failure_threshold=3, reset_seconds=0.05)
+    for _ in range(3):
+        breaker.record_failure(1.0)
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+    breaker.record_failure(1.0)
+
+    assert breaker.state == OPEN
+
+
+def test_released_trial_can_be_retried():
+    breaker = CircuitBreaker(OPENAI, "gpt-4o", failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure(1.0)
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+    breaker.release()
+
+    assert breaker.allow_request()
+
+
+@pytest.mark.parametrize("error, failure", [
+    (ProviderError(500), True), (ProviderError(503), True), (ProviderError(429), True),
+    (ProviderError(400), False), (ProviderError(401), False), (ConnectionError(), True), (TimeoutError(), True),
+    (ValueError(), False),
+])
+def test_only_provider_failures_count(error, failure):
+    assert is_provider_failure(error) is failure
+
+
+def test_breakers_are_kept_per_api_key():
+    router = Router()
+    first = ProviderConfig(OPENAI, "gpt-4o", api_key="sk-first")
+
+    assert router.breaker(first) is router.breaker(ProviderConfig(OPENAI, "gpt-4o", api_key="sk-first"))
+    assert router.breaker(first) is not router.breaker(ProviderConfig(OPENAI, "gpt-4o", api_key="sk-second"))
+
+
+def test_open_breakers_are_skipped():
+    router = Router(priority=[OPENAI])
+    healthy, failing = ProviderConfig(OPENAI, "gpt-4o"), ProviderConfig(OPENAI, "gpt-4o-mini")
+    for _ in range(3):
+        router.breaker(failing).record_failure(1.0)
+
+    assert router.order([failing, healthy]) == [healthy]
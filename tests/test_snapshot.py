@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from attackgen.snapshot import FORMAT_VERSION, SnapshotError, _HEADER, build_snapshot, load_snapshot, read_snapshot
+
+
+@pytest.fixture
+def paths(tmp_path, bundle):
+    source_path, snapshot_path = str(tmp_path / "enterprise-attack.json"), str(tmp_path / "enterprise-attack.snapshot")
+    with open(source_path, "w") as f:
+        json.dump(bundle, f)
+    build_snapshot(source_path, snapshot_path)
+    return source_path, snapshot_path
+
+
+def test_read_matches_the_source(paths, snapshot):
+    source_path, snapshot_path = paths
+
+    loaded = read_snapshot(snapshot_path, source_path)
+
+    assert loaded.attack_version == "15.1"
+    assert loaded.techniques == snapshot.techniques
+    assert loaded.relationships == snapshot.relationships
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(SnapshotError):
+        read_snapshot(str(tmp_path / "missing.snapshot"))
+
+
+def test_changed_source_makes_the_snapshot_stale(paths, bundle):
+    source_path, snapshot_path = paths
+    with open(source_path, "w") as f:
+        json.dump(dict(bundle, objects=bundle["objects"][:-1]), f)
+
+    with pytest.raises(SnapshotError):
+        read_snapshot(snapshot_path, source_path)
+
+
+def test_other_format_version(paths):
+    _, snapshot_path = paths
+    with open(snapshot_path, "r+b") as f:
+        header = _HEADER.unpack(f.read(_HEADER.size))
+        f.seek(0)
+        f.write(_HEADER.pack(header[0], FORMAT_VERSION + 1, *header[2:]))
+
+    with pytest.raises(SnapshotError):
+        read_snapshot(snapshot_path)
+
+
+def test_any_corrupt_byte_is_a_snapshot_error(paths):
+    _, snapshot_path = paths
+    with open(snapshot_path, "rb") as f:
+        data = f.read()
+
+    for position in range(_HEADER.size, len(data), max(1, (len(data) - _HEADER.size) // 300)):
+        for value in (0x00, 0xff, data[position] ^ 0x55):
+            with open(snapshot_path, "wb") as f:
+                f.write(data[:position] + bytes([value]) + data[position + 1:])
+            try:
+                read_snapshot(snapshot_path)
+            except SnapshotError:
+                pass
+
+
+def test_truncated_snapshot_is_rebuilt(paths):
+    source_path, snapshot_path = paths
+    size = os.path.getsize(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.truncate(size // 2)
+
+    assert load_snapshot(source_path, snapshot_path).attack_version == "15.1"
+    assert os.path.getsize(snapshot_path) == size
@@ -15,10 +15,15 @@ A copy of the licence is provided with this program. If you are unable
 to view it, please see https://www.gnu.org/licenses/
 """
 
-import requests
 import streamlit as st
 import os
 
+from attackgen.assets import BRANDING_SVG_URL, get_cached_asset
+from attackgen.generation import OLLAMA_KEEP_ALIVE
+from attackgen.ollama import WARM_UP, format_warm_up_status, get_ollama_pool, preload_models
+from attackgen.metrics import start_metrics_server
+from attackgen.prompts import COMPANY_SIZES, INDUSTRIES
+
 # Récupérer l'e-mail à partir de la variable d'environnement
 email = os.getenv("STREAMLIT_EMAIL")
 
@@ -28,15 +33,18 @@ if email is None:
 
 # ------------------ Streamlit UI Configuration ------------------ #
 
+# Serve the Prometheus metrics endpoint (once per process)
+start_metrics_server()
+preload_models()
+
 
 
 
-# Télécharger l'image SVG localement
-url = "https://trknmgl-paygen.replit.app/trkn.svg"
-response = requests.get(url)
-with open("trkn.svg", "wb") as f:
-    f.write(response.content)
-    email="jeremydiliotti@gmail.com"
+# Get the branding SVG from the local asset cache. It is fetched (and later revalidated) in the background, so
+# the page never waits on the network; until then the browser loads it from its URL.
+branding_svg = get_cached_asset(BRANDING_SVG_URL)
+branding_svg_src = branding_svg.data_uri() or BRANDING_SVG_URL
+email="jeremydiliotti@gmail.com"
 # Configurer la page avec l'icône SVG local
 st.set_page_config(
     page_title="AttackGen by trhacknon",
@@ -44,6 +52,17 @@ st.set_page_config(
 )
 
 
+# Streamlit 1.37 renamed st.experimental_fragment to st.fragment
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+@fragment(run_every=0.5)
+def wait_for_ollama_models(ollama_pool):
+    """Poll the Ollama servers' first model lists and rerun the page once they have arrived."""
+    if not ollama_pool.pending:
+        st.rerun()
+
+
 # ------------------ Sidebar ------------------ #
 with st.sidebar:
     # Ajoutez vos styles CSS pour personnaliser la barre latérale ici
@@ -141,17 +160,22 @@ with st.sidebar:
 
 
     if model_provider == "Ollama":
-        # Make a request to the Ollama API to get the list of available models
-        try:
-            response = requests.get("http://localhost:11434/api/tags")
-            response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xx
-        except requests.exceptions.RequestException as e:
+        # Get the list of available models on the Ollama servers from the lists cached for this process, which are
+        # refreshed from the Ollama API in the background
+        ollama_pool = get_ollama_pool()
+        available_models = ollama_pool.models()
+        if available_models is None and ollama_pool.pending:
+            # The model lists are fetched in the background; rerun the page once they have arrived
+            st.info("Looking for Ollama models...")
+            wait_for_ollama_models(ollama_pool)
+        elif available_models is None:
             st.error("Ollama endpoint not found, please select a different model provider.")
-            response = None
-
-        if response:
-            data = response.json()
-            available_models = [model["name"] for model in data["models"]]
+        else:
+            if ollama_pool.error:
+                st.caption(f"Ollama is not responding; showing the models it reported {ollama_pool.age_seconds:.0f}s ago.")
+            elif len(ollama_pool.hosts) > 1:
+                healthy_hosts = sum(stats["healthy"] for stats in ollama_pool.stats())
+                st.caption(f"{healthy_hosts} of {len(ollama_pool.hosts)} Ollama servers are responding.")
             # Add model selection input field to the sidebar
             ollama_model = st.selectbox(
             "Select the model you would like to use:",
@@ -160,25 +184,21 @@ with st.sidebar:
             )
             st.session_state["ollama_model"] = ollama_model
 
+            # Load the model into memory now, so the first scenario doesn't wait while Ollama loads it
+            if ollama_model and st.toggle("Preload the model", value=WARM_UP, key="ollama_warm_up",
+                                          help=f"Ollama keeps the model loaded for {OLLAMA_KEEP_ALIVE} after each request."):
+                ollama_pool.warm_up_in_background(ollama_model)
+                warm_up_status = format_warm_up_status(ollama_model, ollama_pool.warm_up_status(ollama_model))
+                if warm_up_status:
+                    st.caption(warm_up_status)
+
     st.markdown("""---""")
 
     # Add the drop-down selectors for Industry and Company Size
-    industry = st.selectbox(
-    "Select your company's industry:",
-    sorted(['Aerospace / Defense', 'Agriculture / Food Services', 
-            'Automotive', 'Construction', 'Education', 
-            'Energy / Utilities', 'Finance / Banking', 
-            'Government / Public Sector', 'Healthcare', 
-            'Hospitality / Tourism', 'Insurance', 
-            'Legal Services', 'Manufacturing', 
-            'Media / Entertainment', 'Non-profit', 
-            'Real Estate', 'Retail / E-commerce', 
-            'Technology / IT', 'Telecommunication', 
-            'Transportation / Logistics'])
-    , placeholder="Select Industry")
+    industry = st.selectbox("Select your company's industry:", INDUSTRIES, placeholder="Select Industry")
     st.session_state["industry"] = industry
 
-    company_size = st.selectbox("Select your company's size:", ['Small (1-50 employees)', 'Medium (51-200 employees)', 'Large (201-1,000 employees)', 'Enterprise (1,001-10,000 employees)', 'Large Enterprise (10,000+ employees)'], placeholder="Select Company Size")
+    company_size = st.selectbox("Select your company's size:", COMPANY_SIZES, placeholder="Select Company Size")
     st.session_state["company_size"] = company_size
 
     st.sidebar.markdown("---")
@@ -196,7 +216,7 @@ with st.sidebar:
 
 st.markdown("# <span style='color: #1DB954;'>AttackGen by trhacknon 👾</span>", unsafe_allow_html=True)
 st.markdown("<span style='color: #1DB954;'> **Use MITRE ATT&CK and Large Language Models to generate attack scenarios for incident response testing.**</span>", unsafe_allow_html=True)
-st.markdown("<a href='https://trknmgl-paygen.replit.app/trkn.svg' style='display: inline-block; width: 50%; transform: scale(0.5);'><img src='https://trknmgl-paygen.replit.app/trkn.svg' alt='Click to see the source'></a>", unsafe_allow_html=True)
+st.markdown(f"<a href='{BRANDING_SVG_URL}' style='display: inline-block; width: 50%; transform: scale(0.5);'><img src='{branding_svg_src}' alt='Click to see the source'></a>", unsafe_allow_html=True)
 st.markdown("---")
 
 st.markdown("""          